@@ -1,7 +1,9 @@
 import os
 
 from map_io import *
+import mod_writer
 from terrain import SOURCE, MERGE, WATER_HEIGHT
+from timing import timed
 
 class BasicMap:
     def __init__(self, file_dir, map_dir, max_x, max_y, n_x, n_y):
@@ -15,29 +17,49 @@ class BasicMap:
         self.n_y = n_y
         self.box_width, self.box_height = box_from_max(self.max_x, self.max_y, self.n_x, self.n_y)
         self.heightmap_loc = None
+        self.heightmap = None
+        self.label_from_ijk = {cube.tuple(): ind + 1 for ind, cube in enumerate(valid_cubes(n_x, n_y))}
+        self.labels_from_scale = {}
 
+    def hex_labels(self, scale=1):
+        """The label map (see create_label_map) of every hex on the map, at 1/scale of its size (max_x // scale by
+        max_y // scale, like the game's downsampled textures). Each level of this pyramid is drawn from the hex geometry
+        the first time it's asked for and kept, so any number of images at that level are just lookups."""
+        if scale not in self.labels_from_scale:
+            self.labels_from_scale[scale] = create_label_map(self.label_from_ijk, self.max_x // scale, self.max_y // scale, self.n_x, self.n_y)
+        return self.labels_from_scale[scale]
+
+    def paint_hexes(self, rgb_from_ijk, scale=1, mode='RGB', default="black", palette=None):
+        """The same image as create_hex_map(rgb_from_ijk, ...) of the map at 1/scale of its size, looked up from hex_labels."""
+        return paint_labels(self.hex_labels(scale), self.label_from_ijk, rgb_from_ijk, mode, default, palette)
+
+    @timed()
     def create_provinces(self, rgb_from_pid, pid_from_cube, file_ext, default=(0,0,0), **extras):
         """Creates provinces.file_ext and calls self.prov_extra, where you should put things like definition.csv"""
         rgb_from_ijk = {k.tuple(): rgb_from_pid[pid] for k, pid in pid_from_cube.items()}
-        create_hex_map(rgb_from_ijk=rgb_from_ijk, max_x=self.max_x, max_y=self.max_y, mode='RGB', default=default, n_x=self.n_x, n_y=self.n_y).save(os.path.join(self.file_dir, self.map_dir, "provinces" + file_ext))
+        mod_writer.save_image(self.paint_hexes(rgb_from_ijk, mode='RGB', default=default), os.path.join(self.file_dir, self.map_dir, "provinces" + file_ext))
         self.prov_extra(rgb_from_pid, pid_from_cube, **extras)
     
     def prov_extra(self, rgb_from_pid, pid_from_cube):
         pass
 
+    @timed()
     def create_heightmap(self, base_from_vertex, mask_from_vertex, file_ext, size_factor=1, **extras):
         """Uses height_from_cube to generate a simple heightmap."""
         self.heightmap_loc = os.path.join(self.file_dir, self.map_dir, "heightmap"+file_ext)
-        create_noise_map(base_from_vertex=base_from_vertex, mask_from_vertex=mask_from_vertex, max_x=self.max_x * size_factor, max_y=self.max_y * size_factor, n_x=self.n_x, n_y=self.n_y, mask_max=(255-WATER_HEIGHT)//2).save(self.heightmap_loc)
+        self.heightmap = create_noise_map(base_from_vertex=base_from_vertex, mask_from_vertex=mask_from_vertex, max_x=self.max_x * size_factor, max_y=self.max_y * size_factor, n_x=self.n_x, n_y=self.n_y, mask_max=(255-WATER_HEIGHT)//2)
+        mod_writer.save_image(self.heightmap, self.heightmap_loc)
         self.height_extra(**extras)
 
     def height_extra(self):
         pass
 
+    @timed()
     def create_world_normal(self, file_ext=".bmp"):
-        """Uses the heightmap to generate the normal vector map."""
-        create_normal(PIL.Image.open(self.heightmap_loc)).save(os.path.join(self.file_dir, self.map_dir, "world_normal"+file_ext))
+        """Uses the heightmap (kept from create_heightmap, since it may still be being saved) to generate the normal vector map."""
+        mod_writer.save_image(create_normal(self.heightmap), os.path.join(self.file_dir, self.map_dir, "world_normal"+file_ext))
 
+    @timed()
     def create_rivers(self, height_from_vertex, river_flow_from_edge, river_sources, river_merges, river_max_flow, base_loc, file_ext):
         """Create rivers.file_ext"""
         # TODO: Take into account river_max_flow?
@@ -45,4 +67,4 @@ class BasicMap:
         river_vertices = {v: SOURCE for v in river_sources}
         river_vertices.update({(fr, to): MERGE for fr,to in river_merges})
         river_background = {k.cube.tuple():255 if v >= WATER_HEIGHT else 254 for k,v in height_from_vertex.items() if k.rot==0}
-        create_hex_map(rgb_from_ijk=river_background, rgb_from_edge=river_edges, rgb_from_vertex=river_vertices, max_x=self.max_x, max_y=self.max_y, mode='P', palette=get_palette(os.path.join(base_loc, self.map_dir, "rivers"+file_ext)), default=254, n_x=self.n_x, n_y=self.n_y).save(os.path.join(self.file_dir, self.map_dir, "rivers"+file_ext))
\ No newline at end of file
+        mod_writer.save_image(create_hex_map(rgb_from_ijk=river_background, rgb_from_edge=river_edges, rgb_from_vertex=river_vertices, max_x=self.max_x, max_y=self.max_y, mode='P', palette=get_palette(os.path.join(base_loc, self.map_dir, "rivers"+file_ext)), default=254, n_x=self.n_x, n_y=self.n_y), os.path.join(self.file_dir, self.map_dir, "rivers"+file_ext))
\ No newline at end of file
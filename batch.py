@@ -0,0 +1,173 @@
+"""Generates worlds for a range of seeds in parallel, to pick maps from. Each seed's world is saved with world_io to
+{out}/{seed}/world (export it later with gen.py --world), alongside a log of what generation printed, and
+{out}/summary.json and {out}/summary.csv record for every seed whether it worked, the reason if not, how many continent
+attempts, rechunks and inner sea annealing steps it took, the CreationFailures it retried past and the time they
+wasted, and the time of each stage.
+With --vary, every seed is also run with each combination of the given config values, and {out}/failures.md
+breaks the wasted time down by failure and by the parameters that drive continent creation, to tune configs with."""
+import argparse
+import contextlib
+import copy
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import yaml
+
+import timing
+from gen import create_world, derive_config, load_config
+from map_io import valid_cubes
+from world_io import save_world
+
+# The config entries behind most continent failures, recorded for every run whether or not they're varied.
+PARAMS = ["BORDER_SIZE", "KINGDOM_SIZE", "num_centers"]
+
+
+def varied_config(config, values):
+    """A copy of config with the entries in values replaced, and anything derived from them worked out again."""
+    config = copy.deepcopy(config)
+    for key, value in values.items():
+        config[key] = value
+        if "SIZE_LIST" in key:
+            config.pop(key.replace("SIZE_LIST", "SIZE"), None)
+            config.pop(key.replace("SIZE_LIST", "DUCHY_LIST"), None)
+    return derive_config(config)
+
+
+def run_seed(config, seed, out_dir, name, params=PARAMS):
+    """Process pool entry point: generates and saves the world for seed to out_dir/name. Returns a dict summarizing the
+    run, including the config's values for params."""
+    config = copy.deepcopy(config)
+    config["seed"] = seed
+    config["CACHE_DIR"] = None  # Every seed is new, and the workers would race on the stage files.
+    seed_dir = os.path.join(out_dir, name)
+    os.makedirs(seed_dir, exist_ok=True)
+    timing.reset()
+    start_time = time.time()
+    row = {"name": name, "seed": seed, "status": "ok", "error": ""}
+    row["params"] = {key: config.get(key) for key in params}
+    if row["params"]["num_centers"] is None:  # create_triangle_continents' default
+        row["params"]["num_centers"] = len(valid_cubes(config["n_x"], config["n_y"])) // (3 * config["KINGDOM_SIZE"])
+    with open(os.path.join(seed_dir, "log.txt"), 'w', encoding='utf_8') as log, contextlib.redirect_stdout(log):
+        try:
+            save_world(os.path.join(seed_dir, "world"), create_world(config))
+        except Exception as e:
+            row["status"] = "failed"
+            where = traceback.extract_tb(e.__traceback__)[-1]
+            row["error"] = f"{type(e).__name__}: {e} ({os.path.basename(where.filename)}:{where.lineno})"
+            traceback.print_exc(file=log)
+    row["wall"] = time.time() - start_time
+    row["counts"] = timing.counts()
+    row["stages"] = {span.split(".", 1)[1]: stats["wall"] for span, stats in timing.report().items() if span.startswith("stage.")}
+    row["wasted"] = sum([n for counter, n in row["counts"].items() if counter.startswith("continents.failed_seconds.")]) + row["counts"].get("continents.rechunk_seconds", 0)
+    return row
+
+
+def correlation(xs, ys):
+    """Pearson correlation of xs and ys, or None if either is constant."""
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    var_x = sum([(x - mean_x) ** 2 for x in xs])
+    var_y = sum([(y - mean_y) ** 2 for y in ys])
+    if var_x == 0 or var_y == 0:
+        return None
+    return sum([(x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)]) / (var_x * var_y) ** 0.5
+
+
+def failure_report(rows):
+    """Markdown: the failed continent attempts and their time by reason, then for each parameter that differs between
+    runs, the wasted time and attempts at each of its values and their correlation with it."""
+    total_wasted = sum([row["wasted"] for row in rows])
+    continents_time = sum([row["stages"].get("continents", 0) for row in rows])
+    lines = [
+        f"## Continent failures over {len(rows)} runs",
+        "",
+        f"{total_wasted:.1f}s of {continents_time:.1f}s creating continents went to failed attempts and rechunking.",
+        "",
+        "| failure | count | seconds | share of wasted |",
+        "|---|---|---|---|",
+    ]
+    reasons = sorted({counter.rsplit(".", 1)[1] for row in rows for counter in row["counts"] if counter.startswith("continents.failures.")})
+    by_reason = []
+    for reason in reasons:
+        n = sum([row["counts"].get(f"continents.failures.{reason}", 0) for row in rows])
+        seconds = sum([row["counts"].get(f"continents.failed_seconds.{reason}", 0) for row in rows])
+        by_reason.append((seconds, f"| {reason} | {n} | {seconds:.1f} | {seconds / max(total_wasted, 1e-9):.0%} |"))
+    rechunk_seconds = sum([row["counts"].get("continents.rechunk_seconds", 0) for row in rows])
+    by_reason.append((rechunk_seconds, f"| (rechunking) | {sum([row['counts'].get('continents.rechunks', 0) for row in rows])} | {rechunk_seconds:.1f} | {rechunk_seconds / max(total_wasted, 1e-9):.0%} |"))
+    lines.extend([line for _, line in sorted(by_reason, key=lambda pair: -pair[0])])
+    for param in sorted({param for row in rows for param in row["params"]}):
+        values = [row["params"].get(param) for row in rows]
+        if len({json.dumps(value) for value in values}) < 2:
+            continue
+        lines.extend(["", f"### {param}", "", "| value | runs | mean wasted seconds | mean attempts |", "|---|---|---|---|"])
+        for value in sorted({json.dumps(value) for value in values}):
+            group = [row for row, v in zip(rows, values) if json.dumps(v) == value]
+            lines.append(f"| {value} | {len(group)} | {sum([row['wasted'] for row in group]) / len(group):.1f} | {sum([row['counts'].get('continents.attempts', 0) for row in group]) / len(group):.1f} |")
+        if all([isinstance(value, (int, float)) for value in values]):
+            r_wasted = correlation(values, [row["wasted"] for row in rows])
+            r_attempts = correlation(values, [row["counts"].get("continents.attempts", 0) for row in rows])
+            lines.extend(["", f"Correlation with wasted seconds: {'-' if r_wasted is None else f'{r_wasted:.2f}'}; with attempts: {'-' if r_attempts is None else f'{r_attempts:.2f}'}."])
+    if not any([line.startswith("### ") for line in lines]):
+        lines.extend(["", f"{', '.join(PARAMS)} were the same for every run; pass --vary to compare values."])
+    return "\n".join(lines) + "\n"
+
+
+def write_summary(out_dir, rows):
+    """Writes rows to summary.json as they are, to summary.csv with one column per parameter, counter and stage, and
+    their failure_report to failures.md."""
+    with open(os.path.join(out_dir, "summary.json"), 'w', encoding='utf_8') as outf:
+        json.dump(rows, outf, indent=1)
+    param_names = sorted({name for row in rows for name in row["params"]})
+    count_names = sorted({name for row in rows for name in row["counts"]})
+    stage_names = sorted({name for row in rows for name in row["stages"]})
+    with open(os.path.join(out_dir, "summary.csv"), 'w', encoding='utf_8', newline='') as outf:
+        writer = csv.writer(outf)
+        writer.writerow(["name", "seed", "status", "error", "wall", "wasted"] + param_names + count_names + [f"stage.{name}" for name in stage_names])
+        for row in rows:
+            writer.writerow(
+                [row["name"], row["seed"], row["status"], row["error"], f"{row['wall']:.2f}", f"{row['wasted']:.2f}"]
+                + [json.dumps(row["params"].get(name)) for name in param_names]
+                + [round(row["counts"].get(name, 0), 2) for name in count_names]
+                + [f"{row['stages'][name]:.2f}" if name in row["stages"] else "" for name in stage_names]
+            )
+    with open(os.path.join(out_dir, "failures.md"), 'w', encoding='utf_8') as outf:
+        outf.write(failure_report(rows))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates and saves worlds for a range of seeds in parallel.")
+    parser.add_argument("--config", default="config.yml", help="Config file to use; its seed is replaced.")
+    parser.add_argument("--seeds", nargs=2, type=int, required=True, metavar=("FIRST", "LAST"), help="Inclusive range of seeds to generate.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--out", default="batch", help="Directory for the worlds and the summary.")
+    parser.add_argument("--vary", nargs="+", action="append", default=[], metavar=("KEY", "VALUE"),
+                        help="A config key and the values (in YAML) to try it at, like --vary num_centers 40 60 80. Can be repeated; every combination is run.")
+    args = parser.parse_args()
+    config = load_config(args.config)
+    os.makedirs(args.out, exist_ok=True)
+    seeds = range(args.seeds[0], args.seeds[1] + 1)
+    keys = [key for key, *_ in args.vary]
+    combinations = list(itertools.product(*[[yaml.safe_load(value) for value in values] for _, *values in args.vary]))
+    params = PARAMS + [key for key in keys if key not in PARAMS]
+    jobs = []
+    for cind, combination in enumerate(combinations):
+        combo_config = varied_config(config, dict(zip(keys, combination)))
+        for seed in seeds:
+            jobs.append((combo_config, seed, str(seed) if len(combinations) == 1 else f"{cind}-{seed}"))
+    order_from_name = {name: ind for ind, (_, _, name) in enumerate(jobs)}
+    rows = []
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(run_seed, combo_config, seed, args.out, name, params) for combo_config, seed, name in jobs]
+        for future in as_completed(futures):
+            row = future.result()
+            rows.append(row)
+            print(f"{row['name']}: {row['status']} in {row['wall']:.1f}s, {row['wasted']:.1f}s wasted", row["error"], flush=True)
+            rows.sort(key=lambda row: order_from_name[row["name"]])
+            write_summary(args.out, rows)  # Rewritten as seeds finish, so a long batch can be looked at as it goes.
+    print(f"{sum([row['status'] == 'ok' for row in rows])} of {len(rows)} runs generated; see {os.path.join(args.out, 'summary.csv')} and failures.md")
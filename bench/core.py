@@ -0,0 +1,161 @@
+"""Benchmarks for the core geometry and region algorithms, on synthetic inputs built from map_io.valid_cubes.
+Run from the repo root:
+    python -m bench.core [--sizes ck3 eu4] [--only voronoi split_chunk] [--repeat 3] [--out results.json] [--baseline old.json]
+Every benchmark reseeds random before its setup and before each run, so the work done is the same from run to run,
+and --baseline compares the median times against an earlier --out file, exiting with 1 if anything got slower."""
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+
+from chunk_split import split_chunk, SplitChunkMaxIterationExceeded
+from cube import Vertex
+from gen import arrange_inner_sea, compute_func, create_chunks
+from map_io import create_hex_map, create_noise_map, valid_cubes
+from voronoi import growing_voronoi, voronoi
+
+SEED = 1945
+# n_x, n_y for each grid size: the default CK3 map, EU4's, and twice EU4's in each direction.
+SIZES = {"ck3": (129, 65), "eu4": (235, 65), "eu4x2": (470, 130)}
+# Pixels per box for the image benchmarks; smaller than the games use, to keep the pure-Python drawing quick.
+BOX_WIDTH, BOX_HEIGHT = 4, 7
+
+
+def image_size(n_x, n_y):
+    """Rounded up to a multiple of 512 like the games' maps, which the fractal noise in create_noise_map needs."""
+    return -(-BOX_WIDTH * (3 * n_x - 3) // 512) * 512, -(-BOX_HEIGHT * (2 * n_y - 2) // 512) * 512
+
+
+def weights(cubes):
+    return {k: random.randint(1, 8) for k in cubes}
+
+
+def setup_voronoi(cubes, n_x, n_y):
+    weight_from_cube = weights(cubes)
+    return random.sample(cubes, len(cubes) // 200), weight_from_cube
+
+
+def setup_growing_voronoi(cubes, n_x, n_y):
+    weight_from_cube = weights(cubes)
+    centers = random.sample(cubes, len(cubes) // 200)
+    return centers, [len(cubes) // (2 * len(centers))] * len(centers), weight_from_cube
+
+
+def setup_split_chunk(cubes, n_x, n_y):
+    """Splits every voronoi region on the map, about the size of a duchy, into three counties."""
+    _, group_from_cube, _ = voronoi(random.sample(cubes, len(cubes) // 12), weights(cubes))
+    chunks = {}
+    for k in cubes:
+        chunks.setdefault(group_from_cube[k], []).append(k)
+    return [(chunk, [len(chunk) // 3] * 2 + [len(chunk) - 2 * (len(chunk) // 3)]) for _, chunk in sorted(chunks.items()) if len(chunk) >= 6],
+
+
+def run_split_chunk(jobs):
+    """Returns how many chunks couldn't be split, which like in gen are just skipped."""
+    failures = 0
+    for chunk, sizes in jobs:
+        try:
+            split_chunk(chunk, sizes)
+        except SplitChunkMaxIterationExceeded:
+            failures += 1
+    return failures
+
+
+def setup_compute_func(cubes, n_x, n_y):
+    _, chunks, cids = create_chunks(weights(cubes), len(cubes) // 30)
+    return chunks, cids, 3
+
+
+def setup_arrange_inner_sea(cubes, n_x, n_y):
+    """Three continents the size of the largest chunks of a 12-way split."""
+    _, chunks, _ = create_chunks(weights(cubes), 12)
+    largest = sorted(chunks, key=lambda chunk: -len(chunk.members))[:3]
+    return [list(chunk.members) for chunk in largest], cubes[len(cubes) // 2], [2, 0, 4], SEED
+
+
+def setup_create_hex_map(cubes, n_x, n_y):
+    rgb_from_ijk = {k.tuple(): (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255)) for k in cubes}
+    return rgb_from_ijk, *image_size(n_x, n_y), n_x, n_y
+
+
+def setup_create_noise_map(cubes, n_x, n_y):
+    base_from_vertex = {}
+    mask_from_vertex = {}
+    for k in cubes:
+        for rot in [-1, 0, 1]:
+            base_from_vertex[Vertex(k, rot)] = random.randint(64, 128)
+            mask_from_vertex[Vertex(k, rot)] = random.randint(0, 8)
+    return base_from_vertex, mask_from_vertex, *image_size(n_x, n_y), n_x, n_y, 64
+
+
+# name: (setup, function to time). setup gets the map's cubes (in valid_cubes order), n_x, and n_y, and returns the args.
+BENCHMARKS = {
+    "voronoi": (setup_voronoi, voronoi),
+    "growing_voronoi": (setup_growing_voronoi, growing_voronoi),
+    "split_chunk": (setup_split_chunk, run_split_chunk),
+    "compute_func": (setup_compute_func, compute_func),
+    "arrange_inner_sea": (setup_arrange_inner_sea, arrange_inner_sea),
+    "create_hex_map": (setup_create_hex_map, create_hex_map),
+    "create_noise_map": (setup_create_noise_map, create_noise_map),
+}
+
+
+def run_benchmark(name, size, repeat):
+    """Times BENCHMARKS[name] on the grid SIZES[size], repeat times. Returns a dict of the results."""
+    setup, func = BENCHMARKS[name]
+    n_x, n_y = SIZES[size]
+    cubes = valid_cubes(n_x, n_y)
+    random.seed(SEED)
+    args = setup(cubes, n_x, n_y)
+    times = []
+    for _ in range(repeat):
+        random.seed(SEED)
+        start_time = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start_time)
+    return {"n_cubes": len(cubes), "times": times, "best": min(times), "median": statistics.median(times)}
+
+
+def compare(results, baseline, tolerance):
+    """Prints each result's median against baseline's, and returns the keys that got more than tolerance slower."""
+    slower = []
+    for key, result in results.items():
+        if key not in baseline:
+            print(f"{key:30} {result['median']:9.3f}s  (new)")
+            continue
+        ratio = result["median"] / baseline[key]["median"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  SLOWER"
+            slower.append(key)
+        elif ratio < 1 - tolerance:
+            flag = "  faster"
+        print(f"{key:30} {result['median']:9.3f}s  was {baseline[key]['median']:9.3f}s  x{ratio:.2f}{flag}")
+    return slower
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times the core geometry and region algorithms at fixed seeds.")
+    parser.add_argument("--sizes", nargs="+", default=list(SIZES), choices=list(SIZES))
+    parser.add_argument("--only", nargs="+", default=list(BENCHMARKS), choices=list(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare against the results in this JSON file.")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="How much slower than the baseline counts as a regression.")
+    args = parser.parse_args()
+    results = {}
+    for name in args.only:
+        for size in args.sizes:
+            results[f"{name}/{size}"] = run_benchmark(name, size, args.repeat)
+            print(f"{name}/{size}: median {results[f'{name}/{size}']['median']:.3f}s over {args.repeat} runs", flush=True)
+    if args.out is not None:
+        with open(args.out, 'w', encoding='utf_8') as outf:
+            json.dump({"python": platform.python_version(), "platform": platform.platform(), "seed": SEED, "results": results}, outf, indent=1)
+    if args.baseline is not None:
+        with open(args.baseline, 'r', encoding='utf_8') as inf:
+            baseline = json.load(inf)["results"]
+        if len(compare(results, baseline, args.tolerance)) > 0:
+            sys.exit(1)
@@ -0,0 +1,189 @@
+"""Checks that generation still gives exactly the same output for a set of seeds. Run from the repo root:
+    python -m bench.golden --record [--seeds 1 2 3]    # after a change that's meant to alter the output
+    python -m bench.golden [--seeds 1 2 3]             # after a change that isn't
+For each seed this generates the world, renders the province map and heightmap at 1/--image-scale size, and exports
+every game in the config whose base game directory exists (into a temporary directory). Everything is hashed: each
+world field, and each image and text file. --record stores the hashes, the world (through world_io), and the files
+under --golden/{seed}; otherwise the new hashes are compared against those, with a summary of what changed in each
+differing artifact and, for images, a picture of the differing pixels in --golden/diff/{seed}. Only hashes.json is
+committed, so in a fresh checkout differing artifacts are listed without a summary until --record is run locally
+(before the change being checked)."""
+import argparse
+import copy
+import hashlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import PIL.Image
+import PIL.ImageChops
+
+from basic_map import BasicMap
+from gen import create_world, export_mods, load_config
+from world_io import KIND_FROM_FIELD, encode, load_world, save_world
+
+IMAGE_EXTS = [".png", ".bmp", ".tga", ".dds"]
+BASE_DIR_FROM_GAME = {"CK3": "BASE_CK3_DIR", "EU4": "BASE_EU4_DIR", "V3": "BASE_V3_DIR", "HOI4": "BASE_HOI4_DIR"}
+
+
+def field_digest(field, value):
+    """Hash of a world field that doesn't depend on the order of a map's entries (but does on the order of a list's)."""
+    arrays, json_value = encode(KIND_FROM_FIELD.get(field, "json"), value)
+    digest = hashlib.sha256()
+    if "keys" in arrays and len(arrays["keys"]) > 0:
+        keys = arrays["keys"].reshape(len(arrays["keys"]), -1)
+        order = np.lexsort(keys.T[::-1])
+        arrays = {part: arr[order] if part in ["keys", "values"] else arr for part, arr in arrays.items()}
+    for part, arr in sorted(arrays.items()):
+        digest.update(part.encode())
+        digest.update(np.ascontiguousarray(arr).tobytes())
+    digest.update(json.dumps(json_value, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def file_digest(path):
+    with open(path, 'rb') as inf:
+        return hashlib.sha256(inf.read()).hexdigest()
+
+
+def render_images(world, out_dir, image_scale):
+    """Draws the province map and heightmap for world, shrunk by image_scale, the way the exporters would."""
+    basic_map = BasicMap(out_dir, "map", world["ow_max_x"] // image_scale, world["ow_max_y"] // image_scale, world["ow_nx"], world["ow_ny"])
+    basic_map.create_provinces(world["rgb_from_pid"], world["pid_from_cube"], ".png")
+    basic_map.create_heightmap(world["base_from_vertex"], world["mask_from_vertex"], ".png")
+
+
+def generate(config, seed, out_dir, image_scale):
+    """Generates everything for seed into out_dir: world/, render/, and one directory per exported game.
+    Returns a dict from artifact name to hash."""
+    config = copy.deepcopy(config)
+    config["seed"] = seed
+    config["CACHE_DIR"] = None
+    games = [game for game in config["MOD_OUTPUTS"] if os.path.isdir(config.get(BASE_DIR_FROM_GAME[game], ""))]
+    config["MOD_OUTPUTS"] = {game: os.path.join(out_dir, "mods", game) for game in games}
+    world = create_world(config)
+    save_world(os.path.join(out_dir, "world"), world)
+    random.seed(seed)
+    np.random.seed(seed)  # The heightmap noise comes from numpy's generator.
+    render_images(world, os.path.join(out_dir, "render"), image_scale)
+    export_mods(config, world, world_dir=os.path.join(out_dir, "world"), parallel=False)
+    hashes = {f"world/{field}": field_digest(field, value) for field, value in world.items()}
+    for sub in ["render", "mods"]:
+        for root, _, files in os.walk(os.path.join(out_dir, sub)):
+            for name in files:
+                path = os.path.join(root, name)
+                hashes[os.path.relpath(path, out_dir).replace(os.sep, "/")] = file_digest(path)
+    return dict(sorted(hashes.items()))
+
+
+def field_diff(old, new):
+    """A short description of how a world field changed."""
+    if isinstance(old, dict) and isinstance(new, dict):
+        added = len(new.keys() - old.keys())
+        removed = len(old.keys() - new.keys())
+        changed = sum([old[k] != new[k] for k in old.keys() & new.keys()])
+        return f"{changed} of {len(old)} entries changed, {added} added, {removed} removed"
+    if isinstance(old, list) and isinstance(new, list):
+        changed = sum([a != b for a, b in zip(old, new)])
+        return f"{changed} of {min(len(old), len(new))} items changed, length {len(old)} -> {len(new)}"
+    return f"{old!r} -> {new!r}"
+
+
+def image_diff(old_path, new_path, diff_path):
+    """Counts the differing pixels, and saves the new image in grey with them in red to diff_path."""
+    old = PIL.Image.open(old_path).convert("RGB")
+    new = PIL.Image.open(new_path).convert("RGB")
+    if old.size != new.size:
+        return f"size {old.size} -> {new.size}"
+    mask = np.asarray(PIL.ImageChops.difference(old, new)).any(axis=2)
+    picture = np.repeat(np.asarray(new.convert("L"))[:, :, None] // 2, 3, axis=2)
+    picture[mask] = (255, 0, 0)
+    os.makedirs(os.path.dirname(diff_path), exist_ok=True)
+    PIL.Image.fromarray(picture).save(diff_path)
+    return f"{mask.sum()} of {mask.size} pixels differ; see {diff_path}"
+
+
+def text_diff(old_path, new_path):
+    """Counts the differing lines, position by position."""
+    with open(old_path, 'rb') as inf:
+        old = inf.read().splitlines()
+    with open(new_path, 'rb') as inf:
+        new = inf.read().splitlines()
+    changed = sum([a != b for a, b in zip(old, new)]) + abs(len(old) - len(new))
+    return f"{changed} lines differ, {len(old)} -> {len(new)} lines"
+
+
+def compare(seed, golden_dir, new_dir, old_hashes, new_hashes):
+    """Returns the number of artifacts that differ between the recorded and new ones for seed, and lines describing how."""
+    names = sorted(old_hashes.keys() | new_hashes.keys())
+    differ = [name for name in names if old_hashes.get(name) != new_hashes.get(name)]
+    lines = [f"seed {seed}: {len(names) - len(differ)} of {len(names)} artifacts match"]
+    old_world = None
+    new_world = None
+    for name in differ:
+        if name not in new_hashes:
+            summary = "missing"
+        elif name not in old_hashes:
+            summary = "new"
+        elif not os.path.exists(os.path.join(golden_dir, name.split("/")[0] if name.startswith("world/") else name)):
+            summary = "changed (no recorded copy to compare with)"
+        elif name.startswith("world/"):
+            if old_world is None:
+                old_world = load_world(os.path.join(golden_dir, "world"))
+                new_world = load_world(os.path.join(new_dir, "world"))
+            field = name.split("/", 1)[1]
+            summary = field_diff(old_world[field], new_world[field])
+        else:
+            summary = None
+            if os.path.splitext(name)[1] in IMAGE_EXTS:
+                try:
+                    summary = image_diff(os.path.join(golden_dir, name), os.path.join(new_dir, name), os.path.join(os.path.dirname(golden_dir), "diff", str(seed), name + ".png"))
+                except OSError:  # Not every .dds is one PIL can read.
+                    pass
+            if summary is None:
+                summary = text_diff(os.path.join(golden_dir, name), os.path.join(new_dir, name))
+        lines.append(f"  {name}: {summary}")
+    return len(differ), lines
+
+
+def check_seed(config, seed, golden, image_scale, record):
+    """Generates seed, then records it under golden or compares it with what's there.
+    Returns the number of differences and lines to print about them."""
+    golden_dir = os.path.join(golden, str(seed))
+    with tempfile.TemporaryDirectory() as new_dir:
+        new_hashes = generate(config, seed, new_dir, image_scale)
+        if record:
+            shutil.rmtree(golden_dir, ignore_errors=True)
+            shutil.copytree(new_dir, golden_dir)
+            with open(os.path.join(golden_dir, "hashes.json"), 'w', encoding='utf_8') as outf:
+                json.dump({"image_scale": image_scale, "hashes": new_hashes}, outf, indent=1)
+            return 0, [f"seed {seed}: recorded {len(new_hashes)} artifacts"]
+        with open(os.path.join(golden_dir, "hashes.json"), 'r', encoding='utf_8') as inf:
+            recorded = json.load(inf)
+        if recorded["image_scale"] != image_scale:
+            return 1, [f"seed {seed} was recorded with --image-scale {recorded['image_scale']}"]
+        return compare(seed, golden_dir, new_dir, recorded["hashes"], new_hashes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compares the output for a set of seeds against recorded golden output.")
+    parser.add_argument("--config", default="config.yml")
+    parser.add_argument("--seeds", nargs="+", type=int, help="Seeds to check; the config's seed by default.")
+    parser.add_argument("--golden", default="golden", help="Directory holding the recorded output, one subdirectory per seed.")
+    parser.add_argument("--image-scale", type=int, default=4, help="Render the maps at 1/this of the game size, for speed.")
+    parser.add_argument("--record", action="store_true", help="Record the current output as golden instead of comparing.")
+    args = parser.parse_args()
+    config = load_config(args.config)
+    seeds = args.seeds or [config["seed"]]
+    with ProcessPoolExecutor(max_workers=min(len(seeds), os.cpu_count() or 1)) as executor:
+        results = list(executor.map(check_seed, *zip(*[(config, seed, args.golden, args.image_scale, args.record) for seed in seeds])))
+    print()
+    for _, lines in results:
+        print("\n".join(lines))
+    if sum([differences for differences, _ in results]) > 0:
+        sys.exit(1)
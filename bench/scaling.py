@@ -0,0 +1,140 @@
+"""Measures how each stage of create_data grows with the size of the world. Run from the repo root:
+    python -m bench.scaling [--grid 1 1.5 2] [--provinces 1 1.5 2] [--no-memory] [--out scaling.md]
+There are two sweeps over synthetic versions of config.yml: one scales the hex grid (n_x, n_y and the per-game grids)
+with the content fixed, and one scales the number of sea provinces on a fixed grid by shrinking SEA_PROVINCE_SIZE. (The
+land comes from the title templates in CONTINENT_LISTS, whose county sizes are tuned by hand; scaling those up makes
+continent creation fail more often than not.) Each level runs create_data once for time and, unless --no-memory,
+again under tracemalloc for each timing span's peak memory. For every span, the growth exponent is the slope of log
+time against log n (hexes for the grid sweep, provinces for the province sweep); spans growing faster than n log n
+over the same range are flagged."""
+import argparse
+import copy
+import json
+import math
+import time
+
+import timing
+from gen import create_data, load_config
+from map_io import valid_cubes
+
+# Spans shorter than this at the largest level are too noisy to fit, and aren't flagged.
+MIN_TIME = 0.1
+# How far above the local exponent of n log n a span can be before it's flagged.
+SLACK = 0.15
+# Seeds to try at each level before leaving it out of the fit.
+ATTEMPTS = 3
+
+
+def round_to(x, multiple):
+    return max(multiple, int(round(x / multiple)) * multiple)
+
+
+def scaled_config(config, grid=1.0, provinces=None):
+    """A copy of config with the hex grids scaled by grid in each direction. If provinces is given, the sea provinces
+    are placed at random (the coastal style is capped by the number of shore hexes), provinces times as many as
+    SEA_PROVINCE_SIZE alone would give."""
+    config = copy.deepcopy(config)
+    for key in ["n_x", "n_y", "ck3n_x", "ck3n_y", "eu4n_x", "eu4n_y"]:
+        config[key] = int(round(config[key] * grid))
+    for key in ["max_x", "max_y", "eu4max_x", "eu4max_y"]:
+        config[key] = round_to(config[key] * grid, 32)
+    if provinces is not None:
+        config["SEA_PROVINCE_STYLE"] = "random"
+        config["SEA_PROVINCE_SIZE"] = max(1, int(round(config.get("SEA_PROVINCE_SIZE", 10) / provinces)))
+        config.pop("SEA_PROVINCES", None)  # assign_sea_zones works it out from the size.
+    config["CACHE_DIR"] = None
+    return config
+
+
+def run_level(config, memory):
+    """Runs create_data on config, returning the number of hexes, the number of provinces, and the timing spans.
+    With memory, the spans' wall times come from a plain run and their peak memory from a second, traced run."""
+    timing.reset()
+    output = create_data(copy.deepcopy(config))
+    spans = timing.report()
+    if memory:
+        timing.reset()
+        timing.trace_memory()
+        try:
+            create_data(copy.deepcopy(config))
+        finally:
+            timing.trace_memory(False)
+        for name, stats in timing.report().items():
+            if name in spans:
+                spans[name]["peak_mb"] = stats["peak_mb"]
+    return len(valid_cubes(config["n_x"], config["n_y"])), len(set(output[1].values())), spans
+
+
+def fit_exponent(ns, ts):
+    """Least-squares slope of log t against log n."""
+    xs = [math.log(n) for n in ns]
+    ys = [math.log(max(t, 1e-9)) for t in ts]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    return sum([(x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)]) / sum([(x - mean_x) ** 2 for x in xs])
+
+
+def sweep_table(title, factors, ns, spans_list):
+    """Returns a markdown table of each span's time at each level, its peak memory at the largest, and its exponent."""
+    nlogn = fit_exponent(ns, [n * math.log(n) for n in ns])
+    names = [name for name in spans_list[-1] if all([name in spans for spans in spans_list])]
+    lines = [
+        f"### {title}",
+        "",
+        "| span | " + " | ".join([f"x{f} (n={n})" for f, n in zip(factors, ns)]) + " | peak MB | exponent | |",
+        "|---|" + "---|" * len(ns) + "---|---|---|",
+    ]
+    rows = []
+    for name in names:
+        ts = [spans[name]["wall"] for spans in spans_list]
+        if ts[-1] < MIN_TIME:
+            exponent, flag = "-", ""
+        else:
+            exponent = fit_exponent(ns, ts)
+            flag = "worse than n log n" if exponent > nlogn + SLACK else ""
+            exponent = f"{exponent:.2f}"
+        peak = spans_list[-1][name]["peak_mb"]
+        rows.append((ts[-1], f"| {name} | " + " | ".join([f"{t:.2f}s" for t in ts]) + f" | {'-' if peak is None else f'{peak:.1f}'} | {exponent} | {flag} |"))
+    lines.extend([row for _, row in sorted(rows, key=lambda row: -row[0])])
+    lines.append("")
+    lines.append(f"n log n over this range has exponent {nlogn:.2f}.")
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fits how each stage of create_data grows with the world size.")
+    parser.add_argument("--config", default="config.yml")
+    parser.add_argument("--grid", nargs="*", type=float, default=[1, 1.5, 2], help="Factors to scale the hex grid by.")
+    parser.add_argument("--provinces", nargs="*", type=float, default=[1, 2, 4], help="Factors to scale the number of sea provinces by.")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the traced runs for peak memory.")
+    parser.add_argument("--out", help="Write the tables to this markdown file, and the raw spans next to it as JSON.")
+    args = parser.parse_args()
+    config = load_config(args.config)
+    raw = {}
+    tables = []
+    for sweep, factors in [("grid", args.grid), ("provinces", args.provinces)]:
+        levels = []
+        for factor in factors:
+            start_time = time.time()
+            level_config = scaled_config(config, **{sweep: factor})
+            for attempt in range(ATTEMPTS):  # Generation fails outright for some seeds and sizes; try the next seed.
+                try:
+                    n_cubes, n_provinces, spans = run_level(level_config, not args.no_memory)
+                    break
+                except Exception as e:
+                    print(f"{sweep} x{factor} failed with seed {level_config['seed']}: {e!r}")
+                    level_config["seed"] += 1
+            else:
+                continue
+            levels.append((factor, n_cubes if sweep == "grid" else n_provinces, spans))
+            print(f"{sweep} x{factor}: {n_cubes} hexes, {n_provinces} provinces, {time.time()-start_time:.1f}s", flush=True)
+        raw[sweep] = [{"factor": f, "n": n, "spans": spans} for f, n, spans in levels]
+        if len(levels) >= 2:
+            tables.append(sweep_table(f"Scaling the {sweep}", *zip(*levels)))
+    report = "\n".join(tables)
+    print(report)
+    if args.out is not None:
+        with open(args.out, 'w', encoding='utf_8') as outf:
+            outf.write(report)
+        with open(args.out.rsplit(".", 1)[0] + ".json", 'w', encoding='utf_8') as outf:
+            json.dump(raw, outf, indent=1)
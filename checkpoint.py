@@ -0,0 +1,74 @@
+import hashlib
+import json
+import os
+import pickle
+import random
+
+from timing import span
+
+# Bump this when a stage's outputs change shape, so old checkpoints stop matching.
+CHECKPOINT_VERSION = 1
+
+
+class StageCache:
+    """Runs the named stages of a pipeline, saving each stage's result (and the random state after it) to cache_dir.
+    A stage's key hashes the config entries it reads together with the previous stage's key, so a rerun loads every
+    stage whose inputs are unchanged and recomputes from the first one that isn't. Every key also covers the data files
+    and the source of the code modules the stages use, so editing any of them invalidates all the checkpoints. If
+    cache_dir is None, stages just run."""
+
+    def __init__(self, cache_dir, config, config_keys_from_stage, data_files=(), code_modules=()):
+        self.cache_dir = cache_dir
+        self.config = config
+        self.config_keys_from_stage = config_keys_from_stage
+        self.loaded = []
+        self.computed = []
+        digest = hashlib.sha256(str(CHECKPOINT_VERSION).encode())
+        for path in sorted(data_files):  # Files the stages read besides config, like the region tree ymls.
+            with open(path, 'rb') as inf:
+                digest.update(path.encode())
+                digest.update(inf.read())
+        # The code that computes the stages, by source alone, so gen run as a script and imported give the same keys.
+        for path in sorted([os.path.abspath(module.__file__) for module in code_modules]):
+            with open(path, 'rb') as inf:
+                digest.update(inf.read())
+        self.key = digest.hexdigest()
+
+    def stage_key(self, name):
+        """Advances the chained key to stage name, and returns it."""
+        subset = {k: self.config.get(k) for k in self.config_keys_from_stage[name]}
+        digest = hashlib.sha256(self.key.encode())
+        digest.update(name.encode())
+        digest.update(json.dumps(subset, sort_keys=True, default=str).encode())
+        self.key = digest.hexdigest()
+        return self.key
+
+    def run(self, name, func, *args, **kwargs):
+        """Returns func(*args, **kwargs), loading it from the checkpoint for this stage if there is a valid one.
+        Either way, the time taken is recorded as the timing span stage.{name}."""
+        with span(f"stage.{name}"):
+            return self._run(name, func, *args, **kwargs)
+
+    def _run(self, name, func, *args, **kwargs):
+        key = self.stage_key(name)
+        if self.cache_dir is None:
+            self.computed.append(name)
+            return func(*args, **kwargs)
+        path = os.path.join(self.cache_dir, f"{name}-{key[:16]}.pickle")
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as inf:
+                    result, rng_state = pickle.load(inf)
+                random.setstate(rng_state)
+                self.loaded.append(name)
+                print(f"Loaded stage {name} from {path}")
+                return result
+            except (EOFError, pickle.UnpicklingError) as e:
+                print(f"Ignoring unreadable checkpoint {path}: {e}")
+        result = func(*args, **kwargs)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(path + ".tmp", 'wb') as outf:  # Written aside and moved, so an interrupted run can't leave a truncated checkpoint.
+            pickle.dump((result, random.getstate()), outf, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+        self.computed.append(name)
+        return result
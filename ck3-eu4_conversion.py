@@ -108,7 +108,7 @@ allocated = set()
 adj_size_list = [x for x in config["KINGDOM_DUCHY_LIST"]]
 adj_size_list[0] -= 6
 if aussi_coast[1][2] in chunks[aussi_coast[0][2]].self_edges:
-    raise CreationError
+    raise CreationError(CreationFailure.coasts_adjacent, chunk=eid)
 else:
     for border in [0,1]:
         cubes = aussi_coast[border][1]
@@ -142,8 +142,7 @@ else:
             try:
                 dsplit = split_chunk(duchy, config["KINGDOM_SIZE_LIST"][dind][start_ind:])
             except:
-                print("Kingdom failed to split.")
-                raise CreationError
+                raise CreationError(CreationFailure.kingdom_split_failed, size=len(duchy))
             for county in dsplit:
                 pid += 1
                 for k in county:
@@ -251,8 +250,7 @@ for dind, duchy in enumerate(ksplit):
     try:
         dsplit = split_chunk(duchy, config["KINGDOM_SIZE_LIST"][dind][start_ind:])
     except:
-        print("Kingdom failed to split.")
-        raise CreationError
+        raise CreationError(CreationFailure.kingdom_split_failed, size=len(duchy))
     for county in dsplit:
         pid += 1
         for k in county:
@@ -294,8 +292,7 @@ for gid in [0,1]:
         try:
             dsplit = split_chunk(duchy, config["KINGDOM_SIZE_LIST"][dind][start_ind:])
         except:
-            print("Kingdom failed to split.")
-            raise CreationError
+            raise CreationError(CreationFailure.kingdom_split_failed, size=len(duchy))
         for county in dsplit:
             pid += 1
             for k in county:
@@ -395,10 +392,11 @@ for cid in range(1, 291):
     else:
         terr_from_cid[cid] = random.choice(terrs)
 rgb_from_cid = {}
+used_rgbs = set()
 for cid in range(291):
-    rgb_from_cid[cid] = assign_color(rgb_from_cid,True)
+    rgb_from_cid[cid] = assign_color(used_rgbs,True)
 for cid in range(291,max_pid+1):
-    rgb_from_cid[cid] = assign_color(rgb_from_cid,False)
+    rgb_from_cid[cid] = assign_color(used_rgbs,False)
 # TODO: populate both of these
 rid_from_pid = {}  # max_rid already computed
 srid_from_pid = {}  # max_srid already computed
@@ -416,7 +414,7 @@ for cont_list, cont_size_list in [(china, china_size_list), (india, india_size_l
             srid_from_rid[max_rid] = max_srid
             for size in size_list:
                 max_pid += 1
-                rgb_from_cid[max_pid] = assign_color(rgb_from_cid,True)
+                rgb_from_cid[max_pid] = assign_color(used_rgbs,True)
                 rid_from_pid[max_pid] = max_rid
                 for cc in range(size):
                     cid_from_cube[cont_list[ind].add(offset)] = max_pid
@@ -428,7 +426,7 @@ for cont_list, cont_size_list in [(china, china_size_list), (india, india_size_l
                 srid_from_rid[max_rid] = max_srid
                 for size in sl:
                     max_pid += 1
-                    rgb_from_cid[max_pid] = assign_color(rgb_from_cid,True)
+                    rgb_from_cid[max_pid] = assign_color(used_rgbs,True)
                     rid_from_pid[max_pid] = max_rid
                     for cc in range(size):
                         cid_from_cube[cont_list[ind].add(offset)] = max_pid
@@ -441,7 +439,7 @@ for k,v in australia.items():
     cid_from_cube[k.add(offset)] = max_pid + v + 1
 for _ in range(max(australia.values())+1):
     max_pid += 1
-    rgb_from_cid[max_pid] = assign_color(rgb_from_cid,True)
+    rgb_from_cid[max_pid] = assign_color(used_rgbs,True)
 # Africa
 offset = Cube(s_x, -m_x, m_x-s_x)
 max_srid += 1
@@ -455,7 +453,7 @@ for size_list in africa_size_list:
         srid_from_rid[max_rid] = max_srid
         for size in size_list:
             max_pid += 1
-            rgb_from_cid[max_pid] = assign_color(rgb_from_cid,True)
+            rgb_from_cid[max_pid] = assign_color(used_rgbs,True)
             rid_from_pid[max_pid] = max_rid
             for cc in range(size):
                 cid_from_cube[africa[ind].add(offset)] = max_pid
@@ -467,7 +465,7 @@ for size_list in africa_size_list:
             srid_from_rid[max_rid] = max_srid
             for size in sl:
                 max_pid += 1
-                rgb_from_cid[max_pid] = assign_color(rgb_from_cid,True)
+                rgb_from_cid[max_pid] = assign_color(used_rgbs,True)
                 rid_from_pid[max_pid] = max_rid
                 for cc in range(size):
                     cid_from_cube[africa[ind].add(offset)] = max_pid
@@ -480,7 +478,7 @@ for k,v in america.items():
     cid_from_cube[k.add(offset)] = v + max_pid + 1
 for _ in range(max(america.values())+1):
     max_pid += 1
-    rgb_from_cid[max_pid] = assign_color(rgb_from_cid,True)
+    rgb_from_cid[max_pid] = assign_color(used_rgbs,True)
 print("Land:", max_pid)
 create_hex_map(rgb_from_ijk={k.tuple():rgb_from_cid[v] for k,v in cid_from_cube.items()}, max_x=max_x, n_x=n_x, max_y=max_y, n_y=n_y,).save("land_provinces.bmp")
 
@@ -493,7 +491,7 @@ for region in shallows:
     if len(region) < 10:
         max_pid += 1
         impassable.append(max_pid)
-        rgb_from_cid[max_pid] = assign_color(rgb_from_cid,False)
+        rgb_from_cid[max_pid] = assign_color(used_rgbs,False)
         for k in region:
             cid_from_cube[k] = max_pid
     else:
@@ -505,7 +503,7 @@ for region in shallows:
             max_pid += 1
             rid_from_pid[max_pid] = max_rid
             center_from_pid[max_pid] = center
-            rgb_from_cid[max_pid] = assign_color(rgb_from_cid,False)
+            rgb_from_cid[max_pid] = assign_color(used_rgbs,False)
 for k in shallow:
     for nbr in k.neighbors():
         if nbr not in cid_from_cube and sum([nn in cid_from_cube for nn in nbr.neighbors()]) >= 4:
@@ -519,7 +517,7 @@ for k, v in grp_from_cube.items():
 for v in range(max(grp_from_cube.values()) + 1):
     max_pid += 1
     center_from_pid[max_pid] = centers[v]
-    rgb_from_cid[max_pid] = assign_color(rgb_from_cid,False)
+    rgb_from_cid[max_pid] = assign_color(used_rgbs,False)
 print("Ocean:", max_pid)
 
 emap = EU4Map("", max_x=max_x, max_y=max_y, n_x=n_x, n_y=n_y)
@@ -1,12 +1,16 @@
 from math import sqrt
 import os
 import random
+import numpy as np
 import yaml
 
 from basic_map import BasicMap
+import clausewitz
 from map_io import *
+import mod_writer
 from stripper import copy_base_files, create_blanks, strip_base_files
 from terrain import *
+from timing import timed
 
 USED_MASKS = {  # Not obvious this should go in this direction.
     BaseTerrain.plains: "plains_01",
@@ -77,11 +81,11 @@ class CK3Map(BasicMap):
     def __init__(self, file_dir, max_x, max_y, n_x, n_y):
         """Creates a map of size max_x * max_y, which is n_x hexes wide and n_y hexes tall."""
         super().__init__(file_dir, "map_data", max_x, max_y, n_x, n_y)
-        create_hex_map(rgb_from_ijk={}, max_x=self.max_x//32, max_y=self.max_y//32, n_x=1, n_y=1, mode='RGBA', default=(255,255,255,100)).save(os.path.join(self.file_dir, self.map_dir, "indirection_heightmap.png"))
+        mod_writer.save_blank(os.path.join(self.file_dir, self.map_dir, "indirection_heightmap.png"), (self.max_x//32, self.max_y//32), 'RGBA', (255,255,255,100))
 
     def prov_extra(self, rgb_from_pid, pid_from_cube, name_from_pid):
         """Creates definition.csv"""
-        with open(os.path.join(self.file_dir, self.map_dir, "definition.csv"), 'w') as outf:
+        with mod_writer.open(os.path.join(self.file_dir, self.map_dir, "definition.csv"), 'w') as outf:
             outf.write("0;0;0;0;x;x;\n")
             for pid in sorted(rgb_from_pid.keys()):
                 name = name_from_pid.get(pid,"b_"+str(pid))
@@ -90,7 +94,7 @@ class CK3Map(BasicMap):
 
     def height_extra(self):
         """Uses height_from_cube to generate a simple heightmap."""
-        with open(os.path.join(self.file_dir, self.map_dir, 'heightmap.heightmap'), 'w') as outf:
+        with mod_writer.open(os.path.join(self.file_dir, self.map_dir, 'heightmap.heightmap'), 'w') as outf:
             outf.write("heightmap_file=\"map_data/packed_heightmap.png\"\n")
             outf.write("indirection_file=\"map_data/indirection_heightmap.png\"\n")
             outf.write(f"original_heightmap_size={{ {self.max_x} {self.max_y} }}\n")
@@ -98,35 +102,40 @@ class CK3Map(BasicMap):
             outf.write("should_wrap_x=no\n")
             outf.write("level_offsets={ { 0 0 }{ 0 0 }{ 0 0 }{ 0 0 }{ 0 7 }}\n")
 
+    @timed()
     def create_terrain_masks(self, file_dir, base_dir, terr_from_cube, tree_sparsity=(8,8)):
         """Creates all the terrain masks; just fills each cube.
         terr_from_cube is a map from cube to BaseTerrain.
         Also creates flatmap.dds and colormap.dds."""
         os.makedirs(os.path.join(file_dir, "gfx", "map", "terrain"), exist_ok=True)
         os.makedirs(os.path.join(file_dir, "content_source", "map_objects", "masks"), exist_ok=True)
+        # Which terrain each pixel is, from one draw of the hexes; each used mask is then the pixels of its terrain.
+        terrain_labels = lookup_labels(self.hex_labels(), self.label_from_ijk, {k.tuple(): v.value for k,v in terr_from_cube.items()})
+        terrain_from_mask = {v: k for k,v in USED_MASKS.items()}
         for mask in os.listdir(os.path.join(base_dir, "gfx", "map", "terrain")):
             if "mask.png" not in mask:
                 continue
             mask_name = mask.split("_mask")[0]
-            if mask_name not in USED_MASKS.values():
-                create_hex_map(rgb_from_ijk={}, max_x=self.max_x, max_y=self.max_y, n_x=self.n_x, n_y=self.n_y, mode='L', default="black").save(os.path.join(file_dir, "gfx", "map", "terrain", mask))
+            if mask_name not in terrain_from_mask:
+                mod_writer.save_blank(os.path.join(file_dir, "gfx", "map", "terrain", mask), (self.max_x, self.max_y), 'L', "black")
             else:
-                terrain = [k for k,v in USED_MASKS.items() if v == mask_name][0]
-                rgb_from_cube = {k.tuple(): 128 for k,v in terr_from_cube.items() if v == terrain}
-                create_hex_map(rgb_from_ijk=rgb_from_cube, max_x=self.max_x, max_y=self.max_y, n_x=self.n_x, n_y=self.n_y, mode='L', default="black").save(os.path.join(file_dir, "gfx", "map", "terrain", mask))
-        create_hex_map(rgb_from_ijk={}, max_x=self.max_x // 4, max_y=self.max_y // 4, n_x=self.n_x, n_y=self.n_y, mode='RGB', default=(127, 127, 127)).save(os.path.join(file_dir, "gfx", "map", "terrain", "colormap.dds"))
+                mask_pixels = (terrain_labels == terrain_from_mask[mask_name].value).astype(np.uint8) * 128
+                mod_writer.save_image(PIL.Image.fromarray(mask_pixels, 'L'), os.path.join(file_dir, "gfx", "map", "terrain", mask))
+        mod_writer.save_blank(os.path.join(file_dir, "gfx", "map", "terrain", "colormap.dds"), (self.max_x // 4, self.max_y // 4), 'RGB', (127, 127, 127))
         rgb_from_cube = {k.tuple(): (120, 120, 100) if v == BaseTerrain.ocean else (170,160,140) for k,v in terr_from_cube.items()}
-        create_hex_map(rgb_from_ijk=rgb_from_cube, max_x=self.max_x, max_y=self.max_y, n_x=self.n_x, n_y=self.n_y, mode='RGB', default="black").save(os.path.join(file_dir, "gfx", "map", "terrain", "flatmap.dds"))
+        mod_writer.save_image(self.paint_hexes(rgb_from_cube, mode='RGB', default="black"), os.path.join(file_dir, "gfx", "map", "terrain", "flatmap.dds"))
+        terrain_from_content = {v: k for k,v in CONTENT_SOURCES.items()}
         for mask in os.listdir(os.path.join(base_dir, "content_source", "map_objects", "masks")):
             mask_name = mask.split("_mask")[0]
-            if mask_name not in CONTENT_SOURCES.values():
-                create_hex_map(rgb_from_ijk={}, max_x=self.max_x//2, max_y=self.max_y//2, n_x=self.n_x, n_y=self.n_y, mode='L', default="black").save(os.path.join(file_dir, "content_source", "map_objects", "masks", mask))
+            if mask_name not in terrain_from_content:
+                mod_writer.save_blank(os.path.join(file_dir, "content_source", "map_objects", "masks", mask), (self.max_x//2, self.max_y//2), 'L', "black")
             else:
-                terrain = [k for k,v in CONTENT_SOURCES.items() if v == mask_name][0]
+                terrain = terrain_from_content[mask_name]
                 rgb_from_cube = {k.tuple(): random.randint(64,192) for k,v in terr_from_cube.items() if v == terrain}
-                create_hex_map(rgb_from_ijk=rgb_from_cube, max_x=self.max_x//2, max_y=self.max_y//2, n_x=self.n_x, n_y=self.n_y, mode='L', default="black").save(os.path.join(file_dir, "content_source", "map_objects", "masks", mask))
+                mod_writer.save_image(self.paint_hexes(rgb_from_cube, scale=2, mode='L', default="black"), os.path.join(file_dir, "content_source", "map_objects", "masks", mask))
 
         
+    @timed()
     def create_flowmap(self, file_dir, terr_from_cube):
         os.makedirs(os.path.join(file_dir, "gfx", "map", "water"), exist_ok=True)
         rgb_from_ijk = {}
@@ -136,27 +145,29 @@ class CK3Map(BasicMap):
                 rgb_from_ijk[cube.tuple()] = (flow, flow, flow)
             else:
                 rgb_from_ijk[cube.tuple()] = (255, 255, 255)
-        create_hex_map(rgb_from_ijk=rgb_from_ijk, max_x=self.max_x // 8, max_y=self.max_y // 8, n_x=self.n_x, n_y=self.n_y, mode='RGB', default=(0, 0, 0)).save(os.path.join(file_dir, "gfx", "map", "water", "foam_map.dds"))
+        mod_writer.save_image(self.paint_hexes(rgb_from_ijk, scale=8, mode='RGB', default=(0, 0, 0)), os.path.join(file_dir, "gfx", "map", "water", "foam_map.dds"))
         # TODO: Port over flowmap code
-        create_hex_map(rgb_from_ijk={}, max_x=self.max_x // 4, max_y=self.max_y // 4, n_x=self.n_x, n_y=self.n_y, mode='RGB', default=(126,130,255)).save(os.path.join(file_dir, "gfx", "map", "water", "flowmap.dds"))
-        create_hex_map(rgb_from_ijk={}, max_x=self.max_x // 2, max_y=self.max_y // 2, n_x=self.n_x, n_y=self.n_y, mode='RGB', default=(32,41,49)).save(os.path.join(file_dir, "gfx", "map", "water", "watercolor_rgb_waterspec_a.dds"))
+        mod_writer.save_blank(os.path.join(file_dir, "gfx", "map", "water", "flowmap.dds"), (self.max_x // 4, self.max_y // 4), 'RGB', (126,130,255))
+        mod_writer.save_blank(os.path.join(file_dir, "gfx", "map", "water", "watercolor_rgb_waterspec_a.dds"), (self.max_x // 2, self.max_y // 2), 'RGB', (32,41,49))
 
+    @timed()
     def surround_mask(self, file_dir, surround_cubes = {}):
         os.makedirs(os.path.join(file_dir, "gfx", "map", "surround_map"), exist_ok=True)
-        create_hex_map(rgb_from_ijk={k.tuple(): v for k,v in surround_cubes.items()}, max_x=self.max_x // 8, max_y=self.max_y // 8, n_x=self.n_x, n_y=self.n_y, mode='RGB', default=(0, 0, 0)).save(os.path.join(file_dir, "gfx", "map", "surround_map", "surround_fade.dds"))
-        create_hex_map(rgb_from_ijk={k.tuple(): (0,0,0) for k in surround_cubes}, max_x=self.max_x // 2, max_y=self.max_y // 2, n_x=self.n_x, n_y=self.n_y, mode='RGB', default=(255, 255, 255)).save(os.path.join(file_dir, "gfx", "map", "surround_map", "surround_mask.dds"))
+        mod_writer.save_image(self.paint_hexes({k.tuple(): v for k,v in surround_cubes.items()}, scale=8, mode='RGB', default=(0, 0, 0)), os.path.join(file_dir, "gfx", "map", "surround_map", "surround_fade.dds"))
+        mod_writer.save_image(self.paint_hexes({k.tuple(): (0,0,0) for k in surround_cubes}, scale=2, mode='RGB', default=(255, 255, 255)), os.path.join(file_dir, "gfx", "map", "surround_map", "surround_mask.dds"))
 
-    def create_positions(self, name_from_pid, pid_from_cube, file_dir,):
+    @timed()
+    def create_positions(self, name_from_pid, cubes_from_pid, file_dir,):
         """Create positions.txt and gfx/map/map_object_data files"""
         os.makedirs(os.path.join(file_dir, "gfx", "map", "map_object_data"), exist_ok=True)
         buffers = {name: f"game_object_locator={{\n\tname=\"{LAYER_NAME[name]}\"\n\trender_pass=Map\n\tclamp_to_water_level={CLAMP[name]}\n\tgenerated_content=no\n\tlayer=\"{LAYERS[name]}_layer\"\n\tinstances={{\n" for name in OFFSETS}
         for otype in ZEROS:
             buffers[otype] += "\t\t{\n\t\t\tid=0\n\t\t\tposition={ 0.0 0.0 0.0 }\n\t\t\trotation={ -0.0 -0.0 -0.0 1.0 }\n\t\t\tscale={ 1.0 1.0 1.0 }\n\t\t}\n"
-        with open(os.path.join(self.file_dir, self.map_dir, "positions.txt"), 'w', encoding="utf_8_sig") as outf:
+        with mod_writer.open(os.path.join(self.file_dir, self.map_dir, "positions.txt"), 'w', encoding="utf_8_sig") as outf:
             rotation = " ".join([str(s) for s in [0] * 5])
             height = " ".join([str(s) for s in [0, 0, 0, 20, 0]])
             for pid, name in sorted(name_from_pid.items()):
-                cube = [k for k,v in pid_from_cube.items() if v == pid]
+                cube = cubes_from_pid.get(pid, [])
                 if len(cube) == 0:
                     print(pid, name)
                     continue
@@ -181,7 +192,7 @@ class CK3Map(BasicMap):
                 filename = name + ".txt"
             else:
                 filename = name + "_locators.txt"
-            with open(os.path.join(self.file_dir, "gfx", "map", "map_object_data", filename), 'w', encoding="utf_8_sig") as outf:
+            with mod_writer.open(os.path.join(self.file_dir, "gfx", "map", "map_object_data", filename), 'w', encoding="utf_8_sig") as outf:
                 outf.write(contents)
 
     def update_defines(self, base_dir):
@@ -190,7 +201,7 @@ class CK3Map(BasicMap):
         os.makedirs(os.path.join(self.file_dir, "common", "defines"), exist_ok=True)
         os.makedirs(os.path.join(self.file_dir, "common", "defines", "graphic"), exist_ok=True)
         with open(os.path.join(base_dir, "common", "defines", "00_defines.txt"), 'r', encoding='utf_8_sig') as inf:
-            with open(os.path.join(self.file_dir, "common", "defines", "00_defines.txt"), 'w', encoding='utf_8_sig') as outf:
+            with mod_writer.open(os.path.join(self.file_dir, "common", "defines", "00_defines.txt"), 'w', encoding='utf_8_sig') as outf:
                 for line in inf.readlines():
                     if line.startswith("\tWORLD_EXTENTS_X"):
                         outf.write(line.split("=")[0] + f"= {self.max_x - 1}\n")
@@ -201,7 +212,7 @@ class CK3Map(BasicMap):
                     else:
                         outf.write(line)
         with open(os.path.join(base_dir, "common", "defines", "graphic", "00_graphics.txt"), 'r', encoding='utf_8_sig') as inf:
-            with open(os.path.join(self.file_dir, "common", "defines", "graphic", "00_graphics.txt"), 'w', encoding='utf_8_sig') as outf:
+            with mod_writer.open(os.path.join(self.file_dir, "common", "defines", "graphic", "00_graphics.txt"), 'w', encoding='utf_8_sig') as outf:
                 for line in inf.readlines():
                     if line.startswith("\tFLAT_MAP_HEIGHT"):
                         outf.write(line.split("=")[0] + f"= 19.2\n")
@@ -229,17 +240,17 @@ class CK3Map(BasicMap):
                 else:
                     rgb_from_ijk[cube.tuple()] = (160, 150, 125)
             rgb_from_edge = {edge: edge_color_from_grp[grp] for edge, grp in grp_from_edge.items()}
-            create_hex_map(rgb_from_ijk=rgb_from_ijk, rgb_from_edge=rgb_from_edge, max_x=1920, max_y=1080, n_x=bounds[1] - bounds[0], n_y=bounds[3] - bounds[2], mode='RGB', default="black").save(os.path.join(file_dir, "gfx", "interface", "bookmarks", group_name + ".dds"))
+            mod_writer.save_image(create_hex_map(rgb_from_ijk=rgb_from_ijk, rgb_from_edge=rgb_from_edge, max_x=1920, max_y=1080, n_x=bounds[1] - bounds[0], n_y=bounds[3] - bounds[2], mode='RGB', default="black"), os.path.join(file_dir, "gfx", "interface", "bookmarks", group_name + ".dds"))
             for grp, char_name in char_name_from_grp.items():
                 rgb_from_ijk = {cube: (*color_from_grp[grp], 127) for cube, gg in grp_from_cube.items() if grp == gg}
                 rgb_from_edge = {edge: (255,255,255,255) for edge, gg in grp_from_edge.items() if grp == gg}
-                create_hex_map(rgb_from_ijk=rgb_from_ijk, rgb_from_edge=rgb_from_edge, max_x=1920, max_y=1080, n_x=bounds[1] - bounds[0], n_y=bounds[3] - bounds[2], mode='RGBA', default=(255,255,255,0)).save(os.path.join(file_dir, "gfx", "interface", "bookmarks", group_name + "_" + char_name + ".dds"))
+                mod_writer.save_image(create_hex_map(rgb_from_ijk=rgb_from_ijk, rgb_from_edge=rgb_from_edge, max_x=1920, max_y=1080, n_x=bounds[1] - bounds[0], n_y=bounds[3] - bounds[2], mode='RGBA', default=(255,255,255,0)), os.path.join(file_dir, "gfx", "interface", "bookmarks", group_name + "_" + char_name + ".dds"))
 
 def create_terrain_file(file_dir, terr_from_pid):
     """Writes out common/province_terrain."""
     # Masks were historically wrapped into create_heightmap, and should maybe be again.
     os.makedirs(os.path.join(file_dir, "common", "province_terrain"), exist_ok=True)
-    with open(os.path.join(file_dir, "common", "province_terrain", "00_province_terrain.txt"), 'w', encoding="utf_8_sig") as outf:
+    with mod_writer.open(os.path.join(file_dir, "common", "province_terrain", "00_province_terrain.txt"), 'w', encoding="utf_8_sig") as outf:
         outf.write("default_land=plains\ndefault_sea=sea\ndefault_coastal_sea=coastal_sea\n")
         for pid, terr in terr_from_pid.items():
             if terr == BaseTerrain.ocean:
@@ -247,10 +258,11 @@ def create_terrain_file(file_dir, terr_from_pid):
             outf.write(f"{str(pid)}={CK3Terrain_from_BaseTerrain[terr].name}\n")  # Maybe should just replace this with a string dictionary?
 
 
+@timed()
 def create_adjacencies(file_dir, straits, pid_from_cube, name_from_pid, closest_xy = None):
     """straits is a list of (cube, cube, pid) tuples (from, to, pid of the water region it passes thru).
     This function will create the adjacencies file (including some calculations about type and positioning)."""
-    with open(os.path.join(file_dir, "map_data", "adjacencies.csv"), 'w', encoding="utf_8_sig") as outf:
+    with mod_writer.open(os.path.join(file_dir, "map_data", "adjacencies.csv"), 'w', encoding="utf_8_sig") as outf:
         outf.write("From;To;Type;Through;start_x;start_y;stop_x;stop_y;Comment\n")
         for strait in straits:
             fr, to = strait[0], strait[1]
@@ -279,39 +291,37 @@ def create_climate(file_dir, pid_from_cube, terr_from_pid):
     severe_pids = " ".join([str(x) for x in cold_pids[lcp*11//12:]])
     # TODO: Actually determine climate from location / terrain / etc.
     os.makedirs(os.path.join(file_dir, "map_data"), exist_ok=True)
-    with open(os.path.join(file_dir, "map_data", "climate.txt"),'w', encoding="utf_8_sig") as outf:
+    with mod_writer.open(os.path.join(file_dir, "map_data", "climate.txt"),'w', encoding="utf_8_sig") as outf:
         outf.write(f"mild_winter = {{\n\t{mild_pids}\n}}\nnormal_winter = {{\n\t{normal_pids}\n}}\nsevere_winter = {{\n\t{severe_pids}\n}}\n")
 
+def coa_span_from_title(script):
+    """The (start, end) offsets of the first block for each title in a coat of arms file."""
+    coa_span_from_title = {}
+    for block in script.blocks:
+        coa_span_from_title.setdefault(block.name, (block.start, block.end))
+    return coa_span_from_title
+
+
+@timed()
 def create_coa(file_dir, base_dir, custom_dir, title_list):
-    """Populate common/coat_of_arms/coat_of_arms/01 and 90 with all the titles in title_list, drawing first from custom_dir and then from base_dir."""
+    """Populate common/coat_of_arms/coat_of_arms/01 and 90 with all the titles in title_list, drawing first from custom_dir and then from base_dir.
+    Each title's block is looked up by name, and they're written in the order they have in the file."""
     os.makedirs(os.path.join(file_dir, "common", "coat_of_arms", "coat_of_arms"), exist_ok=True)
-    with open(os.path.join(file_dir, "common", "coat_of_arms", "coat_of_arms","01_landed_titles.txt"),'w', encoding='utf_8_sig') as outf:
+    missing = set(title_list)
+    with mod_writer.open(os.path.join(file_dir, "common", "coat_of_arms", "coat_of_arms","01_landed_titles.txt"),'w', encoding='utf_8_sig') as outf:
         for src_dir in [custom_dir, base_dir]:
             if src_dir is None:
                 continue
-            with open(os.path.join(src_dir, "01_landed_titles.txt"), 'r') as inf:
-                brackets = 0
-                title_name = ""
-                buffer = ""
-                # TODO: This is accidentally writing out too many }s.
-                for line in inf.readlines():
-                    line = line.split("#")[0]  # Drop all comments
-                    brackets += line.count("{")
-                    if len(title_name) == 0 and brackets == 1:
-                        title_name = line.split("=")[0].strip()
-                    if title_name in title_list:
-                        buffer += line
-                    brackets -= line.count("}")
-                    if brackets == 0 and len(title_name) > 0:
-                        if title_name in title_list:
-                            title_list.remove(title_name)
-                            buffer += line
-                            outf.write(buffer)
-                        title_name = ""
-                        buffer = ""
-    print(f"After processing coats of arms, there were {len(title_list)} titles without coas.")
+            script = clausewitz.read(os.path.join(src_dir, "01_landed_titles.txt"))
+            span_from_title = script.index("coa_span_from_title", coa_span_from_title)
+            found = sorted([(span_from_title[title], title) for title in missing if title in span_from_title])
+            for (start, end), _ in found:
+                outf.write(script.text(start, end) + "\n")
+            missing.difference_update([title for _, title in found])
+    print(f"After processing coats of arms, there were {len(missing)} titles without coas.")
 
 
+@timed()
 def create_geographical_regions(file_dir, regions, sea_region, all_material_types = None, no_material_types=None, all_animal_types=None, no_animal_types=None):
     """Create the geographical_regions/geographical_region.txt file.
     regions is a list of RegionTrees.
@@ -333,7 +343,7 @@ def create_geographical_regions(file_dir, regions, sea_region, all_material_type
         "steppe": "0 255 255"
     }
     os.makedirs(os.path.join(file_dir, "map_data", "geographical_regions"), exist_ok=True)
-    with open(os.path.join(file_dir, "map_data", "geographical_regions", "geographical_region.txt"),'w', encoding='utf_8_sig') as outf:
+    with mod_writer.open(os.path.join(file_dir, "map_data", "geographical_regions", "geographical_region.txt"),'w', encoding='utf_8_sig') as outf:
         all_regions = []
         for region in regions:
             region_title = "world_" + region.title.split("_")[1]
@@ -359,16 +369,17 @@ def create_geographical_regions(file_dir, regions, sea_region, all_material_type
             outf.write("hunt_animal_"+animal+"_region = {\n\tregions = {\n\t\t"+all_regions+"\n\t}\n}\n")
         for animal in no_animal_types:
             outf.write("hunt_animal_"+animal+"_region = {\n\tregions = {\n\t\t\n\t}\n}\n")
-    with open(os.path.join(file_dir, "map_data", "island_region.txt"),'w', encoding='utf_8_sig') as outf:
+    with mod_writer.open(os.path.join(file_dir, "map_data", "island_region.txt"),'w', encoding='utf_8_sig') as outf:
         # TODO: figuring out islands will depend on chunking the land elsewhere.
         for region_title in [x for x in regions[-1].all_ck3_titles() if x[0] == 'd']:
             outf.write("island_region_" + region_title + " = {\n\tduchies= {\n\t\t" + region_title + "\n\t}\n}\n\n")
 
 
+@timed()
 def create_landed_titles(file_dir, pid_from_title, regions, special_titles=None):
     """Make common/landed_titles."""
     os.makedirs(os.path.join(file_dir, "common", "landed_titles"), exist_ok=True)
-    with open(os.path.join(file_dir, "common", "landed_titles","00_landed_titles.txt"), 'w', encoding='utf_8_sig') as outf:
+    with mod_writer.open(os.path.join(file_dir, "common", "landed_titles","00_landed_titles.txt"), 'w', encoding='utf_8_sig') as outf:
         # Write the special titles out
         if special_titles is not None:
             with open(special_titles) as inf:
@@ -477,6 +488,60 @@ def culture_history(name, innovations, date="900"):
     return buf
 
 
+def name_list_from_culture(script):
+    """The name_list of each culture in a culture file that has one."""
+    return {block.name: block.get("name_list") for block in script.blocks if block.get("name_list") is not None}
+
+
+def names_from_name_list(script):
+    """The (dynasty names, male names, female names) of each name list in a name list file, as tuples so they can't be
+    changed in the index."""
+    names_from_name_list = {}
+    for block in script.blocks:
+        # Dynasty names are either a name or a { prefix name } pair, kept as written; they're split up when used.
+        dyn_names = [name if isinstance(name, str) else "{ " + " ".join([x for x in name if isinstance(x, str)]) + " }" for name in block.get("dynasty_names", []) if not isinstance(name, tuple)]
+        dyn_names = [name for name in dyn_names if "\"" in name]
+        male_names = clausewitz.values(block.get("male_names", []))  # Names can be in weighted groups, like 10 = { a b }.
+        female_names = clausewitz.values(block.get("female_names", []))
+        names_from_name_list[block.name] = (tuple(dyn_names), tuple(male_names), tuple(female_names))
+    return names_from_name_list
+
+
+def culture_names(base_dir, cultures):
+    """The base game's dynasty, male and female names for each of cultures, from its name list. Cultures sharing a
+    name list share its list of dynasty names, which create_history pops names off as it uses them."""
+    name_list_from_cul = {}
+    dyn_names_from_cul = {}
+    male_names_from_cul = {}
+    female_names_from_cul = {}
+    culture_dir = os.path.join(base_dir, "common", "culture", "cultures")
+    for filename in os.listdir(culture_dir):
+        if filename.startswith("_"):
+            continue
+        for cul, name_list in clausewitz.read(os.path.join(culture_dir, filename)).index("name_list_from_culture", name_list_from_culture).items():
+            if cul in cultures:
+                name_list_from_cul[cul] = name_list
+    name_dir = os.path.join(base_dir, "common", "culture", "name_lists")
+    for filename in os.listdir(name_dir):
+        if filename.startswith("_"):
+            continue
+        for name_list, (dyn_names, male_names, female_names) in clausewitz.read(os.path.join(name_dir, filename)).index("names_from_name_list", names_from_name_list).items():
+            if name_list not in name_list_from_cul.values():
+                continue
+            dyn_names = list(dyn_names)  # A copy, since names are popped off it as they're used; the index is kept for later exports.
+            for cul in [cul for cul, cul_name_list in name_list_from_cul.items() if cul_name_list == name_list]:
+                dyn_names_from_cul[cul] = dyn_names  # This might allow for reuse of dynasty names between regions with the same culture. Probably fine?
+                male_names_from_cul[cul] = male_names
+                female_names_from_cul[cul] = female_names
+    return dyn_names_from_cul, male_names_from_cul, female_names_from_cul
+
+
+def innovations(script):
+    """The innovations in an innovation file that aren't regional, in order."""
+    return [block.name for block in script.blocks if block.get("group") is not None and "regional" not in block.get("group")]
+
+
+@timed()
 def create_history(file_dir, base_dir, config, region_trees, cultures, pid_from_title):
     """Create the history files.
     This covers cultures, characters, provinces, and titles (as well as a few misc files).
@@ -491,84 +556,17 @@ def create_history(file_dir, base_dir, config, region_trees, cultures, pid_from_
     os.makedirs(os.path.join(file_dir, "history", "provinces"), exist_ok=True)
     os.makedirs(os.path.join(file_dir, "history", "titles"), exist_ok=True)
     os.makedirs(os.path.join(file_dir, "history", "wars"), exist_ok=True)
-    with open(os.path.join(file_dir, "history","wars","00_wars.txt"), 'w', encoding="utf_8_sig") as outf:
+    with mod_writer.open(os.path.join(file_dir, "history","wars","00_wars.txt"), 'w', encoding="utf_8_sig") as outf:
         outf.write("\n")
     os.makedirs(os.path.join(file_dir, "history", "province_mapping"), exist_ok=True)
-    with open(os.path.join(file_dir, "history","province_mapping","00_world.txt"), 'w', encoding="utf_8_sig") as outf:
+    with mod_writer.open(os.path.join(file_dir, "history","province_mapping","00_world.txt"), 'w', encoding="utf_8_sig") as outf:
         outf.write("\n")
 
     # For each culture and religion, pull up some basic data that we'll use.
     # CULTURES
     # Pull out the basegame namelists.
     # TODO: Add support for custom cultures?
-    name_list_from_cul = {}
-    dyn_names_from_cul = {}
-    male_names_from_cul = {}
-    female_names_from_cul = {}
-    culture_dir = os.path.join(base_dir, "common", "culture", "cultures")
-    for filename in os.listdir(culture_dir):
-        if filename.startswith("_"):
-            continue
-        with open(os.path.join(culture_dir,filename), 'r', encoding='utf_8_sig') as inf:
-            keeping = False
-            for line in inf.readlines():
-                if line[0] != "\t" and "=" in line and "{" in line:
-                    cul_name = line.split("=")[0].encode('ascii', 'ignore').strip().decode()  # There's a weird character at the start of some of the files, which this gets rid of. Probably a better way to do it.
-                    if cul_name in cultures:
-                        keeping = True
-                elif keeping and "name_list" in line:
-                    name_list_from_cul[cul_name] = line.split("=")[1].strip().split(" ")[0]
-                    keeping = False
-    name_dir = os.path.join(base_dir, "common", "culture", "name_lists")
-    for filename in os.listdir(name_dir):
-        if filename.startswith("_"):
-            continue
-        with open(os.path.join(name_dir,filename), 'r', encoding='utf_8_sig') as inf:
-            brackets = 0
-            list_name = ""
-            keeping = False
-            dyn_names = []
-            adding_dyn = False
-            male_names = []
-            adding_male = False
-            female_names = []
-            adding_female = False
-            for line in inf.readlines():
-                brackets += line.count("{")
-                if brackets == 1 and "=" in line and "{" in line:
-                    list_name = line.split("=")[0].encode('ascii', 'ignore').strip().decode()
-                    if list_name in name_list_from_cul.values():
-                        keeping = True
-                    continue
-                if keeping:
-                    brackets -= line.count("}")
-                    if brackets == 0:
-                        keeping = False
-                        adding_dyn = False
-                        adding_male = False
-                        adding_female = False
-                        for cul in [cul for cul, name_list in name_list_from_cul.items() if name_list == list_name]:
-                            dyn_names_from_cul[cul] = dyn_names  # This might allow for reuse of dynasty names between regions with the same culture. Probably fine?
-                            male_names_from_cul[cul] = male_names
-                            female_names_from_cul[cul] = female_names
-                    elif line.startswith("\tdynasty_names"):
-                        adding_dyn = True
-                    elif line.startswith("\tmale_names"):
-                        adding_male = True
-                    elif line.startswith("\tfemale_names"):
-                        adding_female = True
-                    elif brackets == 1:
-                        adding_dyn = False
-                        adding_male = False
-                        adding_female = False
-                    elif adding_dyn and "\"" in line:
-                        dyn_names.append(line.strip())
-                    elif adding_male:
-                        male_names.extend(line.strip().split(" "))
-                    elif adding_female:
-                        female_names.extend(line.strip().split(" "))
-                else:
-                    brackets -= line.count("}")
+    dyn_names_from_cul, male_names_from_cul, female_names_from_cul = culture_names(base_dir, cultures)
 
     # Pull out the basegame innovations.
     inno_dir = os.path.join(base_dir, "common", "culture", "innovations") 
@@ -580,14 +578,7 @@ def create_history(file_dir, base_dir, config, region_trees, cultures, pid_from_
         if era_name not in config["GUARANTEED_INNOS"] and era_name not in config["RANDOM_INNOS"]:
             continue  # Let's not bother to process files that we're not going to use.
         inno_list_from_era[era_name] = []
-        with open(os.path.join(inno_dir,filename), 'r') as inf:
-            name = ""
-            for line in inf.readlines():
-                if "=" in line and "{" in line:
-                    name = line.split("=")[0].strip()
-                if "=" in line and "group" in line and "regional" not in line and len(name) > 0:
-                    inno_list_from_era[era_name].append(name)
-                    name = ""
+        inno_list_from_era[era_name].extend(clausewitz.read(os.path.join(inno_dir, filename)).index("innovations", innovations))
     base_innos = []
     for inno_name in config["GUARANTEED_INNOS"]:
         if inno_name in inno_list_from_era:
@@ -604,7 +595,7 @@ def create_history(file_dir, base_dir, config, region_trees, cultures, pid_from_
     # Write out history/culture (mostly innovations)
     os.makedirs(os.path.join(file_dir, "history", "cultures"), exist_ok=True)
     for culture in cultures:  # This might be too few; I'm a little worried that we will somehow be missing a culture that will show up thru events or w/e. It's probably fine?
-        with open(os.path.join(file_dir, "history", "cultures", culture+".txt"), 'w', encoding='utf_8_sig') as outf:
+        with mod_writer.open(os.path.join(file_dir, "history", "cultures", culture+".txt"), 'w', encoding='utf_8_sig') as outf:
             this_innos = []
             this_innos.extend(base_innos)
             for era_name, num in config["RANDOM_INNOS"].items():
@@ -641,14 +632,14 @@ def create_history(file_dir, base_dir, config, region_trees, cultures, pid_from_
             # Somehow grab the appropriate region_tree
             region_tree_search = [y for y in [x.find_by_title(region) for x in region_trees] if y is not None]  # This feels super dumb
             if len(region_tree_search) == 0:  # This is a special title.
-                with open(os.path.join(file_dir, "history", "titles", region+".txt"),'w', encoding='utf_8_sig') as outf:
+                with mod_writer.open(os.path.join(file_dir, "history", "titles", region+".txt"),'w', encoding='utf_8_sig') as outf:
                     outf.write(title_history(region, {}, {}, 0))
                 continue
             region_tree = region_tree_search[0]
             titles = region_tree.all_ck3_titles()
             culture = region_tree.culture  # This currently doesn't allow for different culture or religions for subregions, but we don't use that yet, so it's fine.
             religion = region_tree.religion
-            with open(os.path.join(file_dir, "history", "characters", region+".txt"), 'w', encoding='utf_8_sig') as outf:
+            with mod_writer.open(os.path.join(file_dir, "history", "characters", region+".txt"), 'w', encoding='utf_8_sig') as outf:
                 for char in template["chars"].values():  # The key for each character is just for template legibility
                     others = {k: v + coffset if k in ['father', 'mother', 'spouse_id'] else v for k, v in char.items() if k not in ["cid", "dynasty"]}
                     cid = char["cid"] + coffset
@@ -678,7 +669,7 @@ def create_history(file_dir, base_dir, config, region_trees, cultures, pid_from_
                         if not os.path.exists(src_path):
                             src_path = os.path.join(base_dir, "common", "bookmark_portraits", "bookmark_adventurers_jarl_haesteinn.txt")
                         with open(src_path, encoding="utf_8_sig") as book_inf:
-                            with open(os.path.join(file_dir, "common", "bookmark_portraits", bookmark_name + ".txt"), 'w', encoding="utf_8_sig") as book_outf:
+                            with mod_writer.open(os.path.join(file_dir, "common", "bookmark_portraits", bookmark_name + ".txt"), 'w', encoding="utf_8_sig") as book_outf:
                                 for line in book_inf.readlines():
                                     if "bookmark_adventurers" in line:
                                         book_outf.write(bookmark_name + "={\n")
@@ -706,27 +697,27 @@ def create_history(file_dir, base_dir, config, region_trees, cultures, pid_from_
                     prov_buf +="\tholding = " + template["baronies"].get(num["b"], "none") + "\n}\n"
                 num[title[0]] += 1
             if region[0] != "e":  # We don't need to write out province history for empires.
-                with open(os.path.join(file_dir, "history", "provinces", region+".txt"),'w', encoding='utf_8_sig') as outf:
+                with mod_writer.open(os.path.join(file_dir, "history", "provinces", region+".txt"),'w', encoding='utf_8_sig') as outf:
                     outf.write(prov_buf)
             title_buf = ""
             for title, events in template["titles"].items():  # We have to do this a second time so that we can make the title map first.
                 if title[0] != "b":
                     title_buf += title_history(title_map[title], events, title_map, coffset)
-            with open(os.path.join(file_dir, "history", "titles", region+".txt"),'w', encoding='utf_8_sig') as outf:
+            with mod_writer.open(os.path.join(file_dir, "history", "titles", region+".txt"),'w', encoding='utf_8_sig') as outf:
                 outf.write(title_buf)
             doffset += len(template["dynasties"]) + 1
             if len(template["chars"]) > 0:
                 coffset += max([char["cid"] for char in template["chars"].values()]) + 1
         bookmark_buffer += "\n}\n"
-    with open(os.path.join(file_dir, "common", "bookmarks", "bookmarks", "00_bookmarks.txt"),'w', encoding='utf_8_sig') as outf:
+    with mod_writer.open(os.path.join(file_dir, "common", "bookmarks", "bookmarks", "00_bookmarks.txt"),'w', encoding='utf_8_sig') as outf:
         outf.write(bookmark_buffer)
-    with open(os.path.join(file_dir, "common", "bookmarks", "groups", "00_bookmark_groups.txt"),'w', encoding='utf_8_sig') as outf:
+    with mod_writer.open(os.path.join(file_dir, "common", "bookmarks", "groups", "00_bookmark_groups.txt"),'w', encoding='utf_8_sig') as outf:
         outf.write("bm_group_1000 = {\n\tdefault_start_date = 1000.1.1\n}\n")
-    with open(os.path.join(file_dir, "common", "dynasties", "00_dynasties.txt"),'w', encoding='utf_8_sig') as outf:
+    with mod_writer.open(os.path.join(file_dir, "common", "dynasties", "00_dynasties.txt"),'w', encoding='utf_8_sig') as outf:
         outf.write(dynasty_buffer)
-    with open(os.path.join(file_dir, "common", "dynasties", "01_players.txt"),'w', encoding='utf_8_sig') as outf:
+    with mod_writer.open(os.path.join(file_dir, "common", "dynasties", "01_players.txt"),'w', encoding='utf_8_sig') as outf:
         outf.write(player_buffer)
-    with open(os.path.join(file_dir, "common", "dynasty_houses", "00_dynasty_houses.txt"),'w', encoding='utf_8_sig') as outf:
+    with mod_writer.open(os.path.join(file_dir, "common", "dynasty_houses", "00_dynasty_houses.txt"),'w', encoding='utf_8_sig') as outf:
         outf.write("\n")
     return 
 
@@ -734,7 +725,7 @@ def create_history(file_dir, base_dir, config, region_trees, cultures, pid_from_
 def create_default_map(file_dir, impassable, sea_min, sea_max):
     """Writes out default.map."""
     os.makedirs(os.path.join(file_dir, "map_data"), exist_ok=True)
-    with open(os.path.join(file_dir, "map_data", "default.map"), 'w', encoding='utf_8_sig') as outf:
+    with mod_writer.open(os.path.join(file_dir, "map_data", "default.map"), 'w', encoding='utf_8_sig') as outf:
         outf.write("""definitions = "definition.csv"\nprovinces = "provinces.png"\n#positions = "positions.txt"\nrivers = "rivers.png"\n#terrain_definition = "terrain.txt"\ntopology = "heightmap.heightmap"\n#tree_definition = "trees.bmp"\ncontinent = "continent.txt"\nadjacencies = "adjacencies.csv"\n#climate = "climate.txt"\nisland_region = "island_region.txt"\nseasons = "seasons.txt"\n\n""")
         outf.write(f"sea_zones = RANGE {{ {sea_min} {sea_max} }}\n\n")
         for impid in impassable:
@@ -743,6 +734,15 @@ def create_default_map(file_dir, impassable, sea_min, sea_max):
         outf.write("\n")
 
 
+def holy_site_texts(script):
+    """The text of the first block for each holy site in a holy site file, as whole lines, in the order they're in the file."""
+    holy_site_texts = {}
+    for block in script.blocks:
+        holy_site_texts.setdefault(block.name, block.text("utf_8_sig", lines=True))
+    return holy_site_texts
+
+
+@timed()
 def create_religion(file_dir, base_dir, religions, holy_sites, custom_dir=None):
     """Create common/religion/holy_sites and common/religion/religions."""
     os.makedirs(os.path.join(file_dir, "common", "religion", "religions"), exist_ok=True)
@@ -754,7 +754,7 @@ def create_religion(file_dir, base_dir, religions, holy_sites, custom_dir=None):
     for dir in religion_locs:
         for religion_filename in os.listdir(os.path.join(dir, "common", "religion", "religions")):
             with open(os.path.join(dir, "common", "religion", "religions", religion_filename), 'r', encoding='utf_8_sig') as inf:
-                with open(os.path.join(file_dir, "common", "religion", "religions", religion_filename), 'w', encoding='utf_8_sig') as outf:
+                with mod_writer.open(os.path.join(file_dir, "common", "religion", "religions", religion_filename), 'w', encoding='utf_8_sig') as outf:
                     holy_site_section = True
                     for line in inf.readlines():
                         if "holy_site" in line:
@@ -766,27 +766,15 @@ def create_religion(file_dir, base_dir, religions, holy_sites, custom_dir=None):
                             if "}" in line: # We have finished that section and will maybe need to dump all the holy sites again.
                                 holy_site_section = True
                             outf.write(line)
-    with open(os.path.join(file_dir, "common", "religion", "holy_sites", "00_holy_sites.txt"), 'w', encoding='utf_8_sig') as outf:
+    with mod_writer.open(os.path.join(file_dir, "common", "religion", "holy_sites", "00_holy_sites.txt"), 'w', encoding='utf_8_sig') as outf:
         holy_site_locs = [os.path.join(base_dir, "common", "religion", "holy_sites", "00_holy_sites.txt")]
         if custom_dir is not None and os.path.exists(os.path.join(custom_dir, "common", "religion", "holy_sites")):
             holy_site_locs.insert(0, os.path.join(custom_dir, "common", "religion", "holy_sites", "00_holy_sites.txt"))
         for inf_loc in holy_site_locs:
-            with open(inf_loc, 'r', encoding='utf_8_sig') as inf:
-                brackets = 0
-                copying = False
-                for line in inf.readlines():
-                    if brackets == 0 and "{" in line:
-                        name = line.split("=")[0].strip()
-                        if name in holy_sites:
-                            copying = True
-                            holy_sites.remove(name)  # This is so if it's taken from the custom one, we don't also take it from the base one.
-                    brackets += line.count("{")
-                    if copying:
-                        outf.write(line)
-                    brackets -= line.count("}")
-                    if brackets == 0 and "}" in line and copying:
-                        outf.write("\n")
-                        copying = False
+            for name, text in clausewitz.read(inf_loc).index("holy_site_texts", holy_site_texts).items():
+                if name in holy_sites:
+                    holy_sites.remove(name)  # This is so if it's taken from the custom one, we don't also take it from the base one.
+                    outf.write(text + "\n")
         for holy_site in holy_sites:
             print("holy site " + holy_site + " not found!")  # These are the ones that didn't get found.
 
@@ -805,14 +793,15 @@ def create_dot_mod(file_dir, mod_name, mod_disp_name):
         ]
     shared += "replace_path = \"" + "\"\nreplace_path = \"".join(replace_paths)+"\""
     os.makedirs(os.path.join(file_dir, mod_name), exist_ok=True)
-    with open(os.path.join(file_dir,"{}.mod".format(mod_name)),'w', encoding="utf_8_sig") as f:
+    with mod_writer.open(os.path.join(file_dir,"{}.mod".format(mod_name)),'w', encoding="utf_8_sig") as f:
         f.write(shared + outer)
-    with open(os.path.join(file_dir, mod_name, "descriptor.mod".format(mod_name)),'w', encoding="utf_8_sig") as f:
+    with mod_writer.open(os.path.join(file_dir, mod_name, "descriptor.mod".format(mod_name)),'w', encoding="utf_8_sig") as f:
         f.write(shared)
     return os.path.join(file_dir, mod_name)
 
 
-def create_mod(file_dir, config, pid_from_cube, terr_from_cube, terr_from_pid, rgb_from_pid, base_from_vertex, mask_from_vertex, pid_from_title, name_from_pid, region_trees, cultures, religions, impassable, river_flow_from_edge, river_sources, river_merges, river_max_flow, straits, sea_region, ow_nx, ow_ny, ow_max_x, ow_max_y):
+@timed()
+def create_mod(file_dir, config, pid_from_cube, cubes_from_pid, terr_from_cube, terr_from_pid, rgb_from_pid, base_from_vertex, mask_from_vertex, pid_from_title, name_from_pid, region_trees, cultures, religions, impassable, river_flow_from_edge, river_sources, river_merges, river_max_flow, straits, sea_region, ow_nx, ow_ny, ow_max_x, ow_max_y):
     """Creates the CK3 mod files in file_dir, given the basic data."""
     # Make the basic filestructure that other things go in.
     file_dir = create_dot_mod(file_dir=file_dir, mod_name=config.get("MOD_NAME", "testmod"), mod_disp_name=config.get("MOD_DISPLAY_NAME", "testing_worldgen"))
@@ -839,7 +828,7 @@ def create_mod(file_dir, config, pid_from_cube, terr_from_cube, terr_from_pid, r
     ck3map.create_heightmap(base_from_vertex=base_from_vertex, mask_from_vertex=mask_from_vertex, file_ext=".png")
     ck3map.create_rivers(base_from_vertex, river_flow_from_edge, river_sources, river_merges, river_max_flow, base_loc=config["BASE_CK3_DIR"], file_ext=".png")
     ck3map.create_flowmap(file_dir=file_dir, terr_from_cube=terr_from_cube)
-    ck3map.create_positions(name_from_pid, pid_from_cube, file_dir=file_dir)
+    ck3map.create_positions(name_from_pid, cubes_from_pid, file_dir=file_dir)
     ck3map.create_terrain_masks(file_dir=file_dir, base_dir=config["BASE_CK3_DIR"], terr_from_cube=terr_from_cube)
     surround_cubes = {k: (255, 255, 0) for k in pid_from_cube}
     surround_cubes.update({k: (255,0,0) for k in pid_from_cube if any([nbr not in pid_from_cube for nbr in k.neighbors()])})
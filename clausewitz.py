@@ -0,0 +1,264 @@
+import hashlib
+import inspect
+import os
+import pickle
+import re
+
+# Whitespace, a comment, a quoted string, a brace, an operator, or a bare word.
+TOKEN = re.compile(rb'\s+|#[^\n]*|"(?:[^"\\]|\\.)*"?|[{}]|[<>!?]?=|[<>]|[^\s{}=<>!?#"]+|[!?]', re.S)
+SKIPPED = b" \t\n\r\f\v#"
+# What matters for matching braces, and the name and operator just before an opening brace.
+BRACE = re.compile(rb'#[^\n]*|"(?:[^"\\]|\\.)*"?|[{}]', re.S)
+KEY = re.compile(rb'("(?:[^"\\]|\\.)*"|[^\s{}=<>!?#"]+)\s*[<>!?]?=\s*\Z')
+BOM = b"\xef\xbb\xbf"
+
+# Every Script read this run, by absolute path, so each base game file is only read and split into blocks once.
+script_from_path = {}
+# Where each file's blocks and other indexes are kept between runs, keyed by its path, size and modification time;
+# None turns that off.
+cache_dir = None
+# Bump this when what's cached changes, so old entries stop matching.
+CACHE_VERSION = 2
+# The hash of each index function's source, which its cached values are tagged with.
+digest_from_func = {}
+
+
+def tokens(data, start=0, end=None):
+    """Yields (kind, start, end) for each token of data[start:end], where kind is one of "{", "}", "=" (for any
+    operator), "s" (a quoted string), or "w" (anything else). Comments and whitespace are skipped."""
+    end = len(data) if end is None else end
+    for match in TOKEN.finditer(data, start, end):
+        s, e = match.span()
+        first = data[s]
+        if first in SKIPPED:
+            continue
+        if first == 0x7b:  # {
+            kind = "{"
+        elif first == 0x7d:  # }
+            kind = "}"
+        elif first == 0x22:  # "
+            kind = "s"
+        elif data[e - 1] == 0x3d or first in b"<>":  # = and the comparison operators
+            kind = "="
+        else:
+            kind = "w"
+        yield kind, s, e
+
+
+class Block:
+    """A 'name = { ... }' statement in a Script. start is the offset of its name, brace of its opening brace, and end
+    just past its closing brace; line_start and line_end extend it to whole lines (including the final newline)."""
+
+    def __init__(self, script, name, start, brace, end):
+        self.script = script
+        self.name = name
+        self.start = start
+        self.brace = brace
+        self.end = end
+
+    @property
+    def line_start(self):
+        return self.script.data.rfind(b"\n", 0, self.start) + 1
+
+    @property
+    def line_end(self):
+        newline = self.script.data.find(b"\n", self.end)
+        return len(self.script.data) if newline == -1 else newline + 1
+
+    def text(self, encoding="utf_8", lines=False):
+        """The block's source, from its name to its closing brace, or with lines from its first line to its last."""
+        if lines:
+            return self.script.text(self.line_start, self.line_end, encoding)
+        return self.script.text(self.start, self.end, encoding)
+
+    def children(self):
+        """The blocks directly inside this one."""
+        return list(_blocks(self.script, self.brace + 1, self.end - 1))
+
+    def get(self, key, default=None):
+        """The value of the first 'key = value' directly inside this block, as written (so strings keep their quotes)."""
+        for entry in self.parse():
+            if isinstance(entry, tuple) and entry[0] == key:
+                return entry[2]
+        return default
+
+    def parse(self):
+        """The contents of the block, parsed on first use. See parse."""
+        if not hasattr(self, "_parsed"):
+            self._parsed = parse(self.script.data, self.brace + 1, self.end - 1)
+        return self._parsed
+
+
+class Script:
+    """The contents of a Paradox script file, as bytes with newlines normalized to \\n (like reading in text mode)
+    and any byte order mark kept, and its top-level blocks, found on first use. A Script made by read only reads its
+    file when data is first needed, which it isn't if everything asked of it comes from cache_dir."""
+
+    def __init__(self, data=None, path=None, stat=None):
+        self._data = None if data is None else normalize(data)
+        self.path = path
+        self.stat = stat
+
+    @property
+    def data(self):
+        if self._data is None:
+            with open(self.path, 'rb') as inf:
+                self._data = normalize(inf.read())
+        return self._data
+
+    @property
+    def blocks(self):
+        if not hasattr(self, "_blocks"):
+            self._blocks = [Block(self, *span) for span in self.index("blocks", block_spans)]
+        return self._blocks
+
+    def index(self, name, func):
+        """func(self), computed once per version of the file and kept in cache_dir under name along with its other
+        indexes, so a later run that finds the file unchanged needn't read or parse it. Entries are redone whenever the
+        source of func changes; anything else they depend on should bump CACHE_VERSION."""
+        if not hasattr(self, "_index_from_name"):
+            self._index_from_name = self._cached_indexes()
+        digest = source_digest(func)
+        entry = self._index_from_name.get(name)
+        if entry is None or entry[0] != digest:
+            entry = (digest, func(self))
+            self._index_from_name[name] = entry
+            self._cache_indexes()
+        return entry[1]
+
+    def _cache_path(self):
+        if cache_dir is None or self.path is None:
+            return None
+        return os.path.join(cache_dir, hashlib.sha256(self.path.encode()).hexdigest()[:24] + ".pickle")
+
+    def _cached_indexes(self):
+        """The indexes kept in the cache for this version of the file, as name: (source digest, value)."""
+        cache_path = self._cache_path()
+        if cache_path is None or not os.path.exists(cache_path):
+            return {}
+        try:
+            with open(cache_path, 'rb') as inf:
+                key, index_from_name = pickle.load(inf)
+        except (EOFError, pickle.UnpicklingError, ValueError):
+            return {}
+        return index_from_name if key == (CACHE_VERSION, self.path, self.stat) else {}
+
+    def _cache_indexes(self):
+        cache_path = self._cache_path()
+        if cache_path is None:
+            return
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_path + ".tmp", 'wb') as outf:  # Written aside and moved, like the stage checkpoints.
+            pickle.dump(((CACHE_VERSION, self.path, self.stat), self._index_from_name), outf, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(cache_path + ".tmp", cache_path)
+
+    def block(self, name):
+        """The first top-level block called name, or None."""
+        if not hasattr(self, "_block_from_name"):
+            self._block_from_name = {}
+            for block in self.blocks:
+                self._block_from_name.setdefault(block.name, block)
+        return self._block_from_name.get(name)
+
+    def text(self, start=0, end=None, encoding="utf_8"):
+        return self.data[start:end].decode(encoding)
+
+
+def normalize(data):
+    return data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+
+def block_spans(script):
+    """The (name, start, brace, end) of each top-level block of script."""
+    return [(b.name, b.start, b.brace, b.end) for b in _blocks(script, 3 if script.data.startswith(BOM) else 0, len(script.data))]
+
+
+def source_digest(func):
+    if func not in digest_from_func:
+        digest_from_func[func] = hashlib.sha256(inspect.getsource(func).encode()).hexdigest()
+    return digest_from_func[func]
+
+
+def read(path):
+    """The Script for the file at path, made the first time it's asked for and reused after that. Its blocks and other
+    indexes come from cache_dir if they were kept there for the same size and modification time of the file."""
+    path = os.path.abspath(path)
+    if path not in script_from_path:
+        stat = os.stat(path)
+        script_from_path[path] = Script(None, path, (stat.st_size, stat.st_mtime_ns))
+    return script_from_path[path]
+
+
+def _blocks(script, start, end):
+    """Yields the blocks at the outermost level of script.data[start:end]. Only braces, strings and comments matter
+    for finding them, so this skips the rest rather than tokenizing it."""
+    data = script.data
+    depth = 0
+    outside = start  # The end of the last block, or start; a block's name is between this and its opening brace.
+    brace = 0
+    for match in BRACE.finditer(data, start, end):
+        s, e = match.span()
+        if data[s] == 0x7b:  # {
+            if depth == 0:
+                brace = s
+            depth += 1
+        elif data[s] == 0x7d:  # }
+            if depth == 1:
+                key = KEY.search(data, max(outside, brace - 256), brace)
+                if key is not None:
+                    yield Block(script, key.group(1).decode("utf_8", "replace"), key.start(1), brace, e)
+                outside = e
+            depth = max(depth - 1, 0)  # Stray closing braces happen in the base game files; ignore them.
+
+
+def parse(data, start=0, end=None):
+    """Parses data[start:end] into a list of entries: (key, operator, value) for each statement, and value for each
+    bare value (like the names in a list). Values are the token text, or a list of entries for a braced block."""
+    toks = list(tokens(data, start, end))
+    entries, _ = _parse(data, toks, 0)
+    return entries
+
+
+def _parse(data, toks, ind):
+    entries = []
+    while ind < len(toks):
+        kind, s, e = toks[ind]
+        if kind == "}":
+            return entries, ind + 1
+        if kind == "{":
+            value, ind = _parse(data, toks, ind + 1)
+            entries.append(value)
+            continue
+        text = data[s:e].decode("utf_8", "replace")
+        if ind + 1 < len(toks) and toks[ind + 1][0] == "=" and kind in "ws":
+            op = data[toks[ind + 1][1]:toks[ind + 1][2]].decode()
+            if ind + 2 >= len(toks):
+                entries.append((text, op, None))
+                return entries, ind + 2
+            vkind, vs, ve = toks[ind + 2]
+            if vkind == "{":
+                value, ind = _parse(data, toks, ind + 3)
+            else:
+                value, ind = data[vs:ve].decode("utf_8", "replace"), ind + 3
+            entries.append((text, op, value))
+            continue
+        if kind != "=":
+            entries.append(text)
+        ind += 1
+    return entries, ind
+
+
+def values(entries):
+    """The bare values in parsed entries, including those in nested lists and in statements with list values
+    (like the names in '10 = { a b }'), in order."""
+    found = []
+    for entry in entries:
+        if isinstance(entry, tuple):
+            entry = entry[2]
+            if not isinstance(entry, list):
+                continue
+        if isinstance(entry, list):
+            found.extend(values(entry))
+        else:
+            found.append(entry)
+    return found
@@ -4,8 +4,10 @@ import shutil
 
 from basic_map import BasicMap
 from map_io import *
+import mod_writer
 from stripper import create_blanks, strip_base_files
 from terrain import *
+from timing import timed
 
 TERR_NAMES = {
     BaseTerrain.plains: "plains",
@@ -40,10 +42,11 @@ class EU4Map(BasicMap):
         """Creates a map of size max_x * max_y, which is n_x hexes wide and n_y hexes tall."""
         super().__init__(file_dir, "map", max_x, max_y, n_x, n_y)
     
+    @timed()
     def create_terrain(self, terr_from_cube, base_loc, file_ext):
         """Creates terrain.bmp"""
         rgb_from_ijk = {k.tuple(): COLOR_FROM_TERR[terr] for k, terr in terr_from_cube.items()}
-        create_hex_map(rgb_from_ijk=rgb_from_ijk, max_x=self.max_x, max_y=self.max_y, mode='P', palette=get_palette(os.path.join(base_loc, self.map_dir, "terrain"+file_ext)), default=254, n_x=self.n_x, n_y=self.n_y).save(os.path.join(self.file_dir, self.map_dir, "terrain"+file_ext))
+        mod_writer.save_image(self.paint_hexes(rgb_from_ijk, mode='P', default=254, palette=get_palette(os.path.join(base_loc, self.map_dir, "terrain"+file_ext))), os.path.join(self.file_dir, self.map_dir, "terrain"+file_ext))
 
     def prov_extra(self, rgb_from_pid, pid_from_cube, name_from_pid,):
         pass
@@ -64,16 +67,16 @@ def create_dot_mod(file_dir, mod_name, mod_disp_name):
         ]
     shared += "replace_path = \"" + "\"\nreplace_path = \"".join(replace_paths)+"\""
     os.makedirs(os.path.join(file_dir, mod_name), exist_ok=True)
-    with open(os.path.join(file_dir,"{}.mod".format(mod_name)),'w') as f:
+    with mod_writer.open(os.path.join(file_dir,"{}.mod".format(mod_name)),'w') as f:
         f.write(shared + outer)
-    with open(os.path.join(file_dir, mod_name, "descriptor.mod".format(mod_name)),'w') as f:
+    with mod_writer.open(os.path.join(file_dir, mod_name, "descriptor.mod".format(mod_name)),'w') as f:
         f.write(shared)
     return os.path.join(file_dir, mod_name)
 
 
 def create_adjacencies(file_dir):
     # TODO: Actually write out adjacencies
-    with open(os.path.join(file_dir, "map", "adjacencies.csv"), 'w', encoding="utf-8") as outf:
+    with mod_writer.open(os.path.join(file_dir, "map", "adjacencies.csv"), 'w', encoding="utf-8") as outf:
         outf.write("From;To;Type;Through;start_x;start_y;stop_x;stop_y;adjacency_rule_name;Comment\n")
         outf.write("-1;-1;;-1;-1;-1;-1;-1;-1")
 
@@ -81,14 +84,14 @@ def create_adjacencies(file_dir):
 def create_bookmarks(file_dir, player_tags, start_date="1444.11.11"):
     """Write out bookmark file."""
     os.makedirs(os.path.join(file_dir, "common", "bookmarks"), exist_ok=True)
-    with open(os.path.join(file_dir, "common", "bookmarks", "conversion.txt"), 'w', encoding="utf-8") as outf:
+    with mod_writer.open(os.path.join(file_dir, "common", "bookmarks", "conversion.txt"), 'w', encoding="utf-8") as outf:
         outf.write("bookmark =\n{\n\tname = \"CONVERSION_BOOKMARK\"\n\tdesc = \"CONVERSION_BOOKMARK_DESC\"\n\tdate = " + start_date + "\n\n\tcenter = 1\n\tdefault = yes\n\n" + "\n".join([f"\tcountry = {tag}" for tag in player_tags]) + "\n}")
 
 
 def create_colonial_regions(file_dir):
     """Write out common/colonial_regions/00_colonial_regions.txt"""
     os.makedirs(os.path.join(file_dir, "common", "colonial_regions"), exist_ok=True)
-    with open(os.path.join(file_dir, "common", "colonial_regions", "00_colonial_regions.txt"), 'w', encoding="utf-8") as outf:
+    with mod_writer.open(os.path.join(file_dir, "common", "colonial_regions", "00_colonial_regions.txt"), 'w', encoding="utf-8") as outf:
         outf.write("\n")
 
 
@@ -103,22 +106,23 @@ def create_countries(file_dir, region_trees, gov_from_tag={}):
     for region_tree in region_trees:
         for region in region_tree.all_region_trees():
             if region.tag is not None and region.capital_rid != -1:
-                with open(os.path.join(file_dir, "common", "countries", f"{region.title}.txt"), 'w', encoding="utf-8") as outf:
+                with mod_writer.open(os.path.join(file_dir, "common", "countries", f"{region.title}.txt"), 'w', encoding="utf-8") as outf:
                     outf.write(f"graphical_culture = westerngfx\n\ncolor = {{ {' '.join(region.color)} }}\n")
                 country_tag_buffer += f"{region.tag} = \"countries/{region.title}.txt\"\n"
                 country_color_buffer += f"{region.tag} = {{\n" + " ".join(["\tcolor1 = { " + " ".join(region.color) + " }\n"]) + "}\n\n"
-                with open(os.path.join(file_dir, "history", "countries", f"{region.tag}-{region.title}.txt"), 'w', encoding="utf-8") as outf:
+                with mod_writer.open(os.path.join(file_dir, "history", "countries", f"{region.tag}-{region.title}.txt"), 'w', encoding="utf-8") as outf:
                     outf.write("government = " + gov_from_tag.get(region.tag, "monarchy") + "\ngovernment_rank = 1\nmercantilism = 25\ntechnology_group = western\nreligion = " + region.religion + "\nprimary_culture = " + region.culture)
                     outf.write(f"\ncapital = {region.capital_pid}\n")
-    with open(os.path.join(file_dir, "common", "country_colors", "00_country_colors.txt"), 'w', encoding="utf-8") as outf:
+    with mod_writer.open(os.path.join(file_dir, "common", "country_colors", "00_country_colors.txt"), 'w', encoding="utf-8") as outf:
         outf.write(country_color_buffer)
-    with open(os.path.join(file_dir, "common", "country_tags", "00_countries.txt"), 'w', encoding="utf-8") as outf:
+    with mod_writer.open(os.path.join(file_dir, "common", "country_tags", "00_countries.txt"), 'w', encoding="utf-8") as outf:
         outf.write(country_tag_buffer)
 
 
+@timed()
 def create_geography(file_dir, pids_from_rid, srid_from_pid, name_from_rid, name_from_srid, cont_names, cont_from_pid):
     region_names = {}
-    with open(os.path.join(file_dir, "map", "area.txt"), 'w', encoding="utf-8") as outf:
+    with mod_writer.open(os.path.join(file_dir, "map", "area.txt"), 'w', encoding="utf-8") as outf:
         for rid, pids in pids_from_rid.items():
             outf.write(f"{name_from_rid[rid]} = {{\n\t{' '.join([str(pid) for pid in pids])}\n}}\n\n")
             srid = srid_from_pid[pids[0]]
@@ -126,15 +130,15 @@ def create_geography(file_dir, pids_from_rid, srid_from_pid, name_from_rid, name
                 region_names[srid].add(name_from_rid[rid])
             else:
                 region_names[srid] = {name_from_rid[rid]}
-    with open(os.path.join(file_dir, "map", "region.txt"), 'w', encoding="utf-8") as routf:
-        with open(os.path.join(file_dir, "map", "superregion.txt"), 'w', encoding="utf-8") as sroutf:
+    with mod_writer.open(os.path.join(file_dir, "map", "region.txt"), 'w', encoding="utf-8") as routf:
+        with mod_writer.open(os.path.join(file_dir, "map", "superregion.txt"), 'w', encoding="utf-8") as sroutf:
             sroutf.write("world_superregion = {\n")
             for srid, srname in name_from_srid.items():
                 buffer = ''.join([f"\t\t{area}\n" for area in region_names[srid]])
                 routf.write(f"{srname} = {{\n\tareas = {{\n{buffer}\t}}\n}}\n\n")
                 sroutf.write(f"\t{srname}\n")
             sroutf.write("}\n")
-    with open(os.path.join(file_dir, "map", "continent.txt"), 'w', encoding="utf-8") as outf:
+    with mod_writer.open(os.path.join(file_dir, "map", "continent.txt"), 'w', encoding="utf-8") as outf:
         for cind, cont_name in enumerate(cont_names):
             outf.write(cont_name + " = {\n\t")
             outf.write(" ".join([str(pid) for pid, cont in cont_from_pid.items() if cont == cind]))
@@ -142,6 +146,7 @@ def create_geography(file_dir, pids_from_rid, srid_from_pid, name_from_rid, name
         outf.write("island_check_provinces = {\n}\n\nnew_world = {\n}")
 
 
+@timed()
 def create_mod(file_dir, config, region_trees, rgb_from_pid, name_from_pid, pids_from_rid, name_from_rid, pid_from_cube, terr_from_cube, gov_from_tag, base_from_vertex, mask_from_vertex, river_flow_from_edge, river_sources, river_merges, river_max_flow, srid_from_pid, name_from_srid, cont_names, cont_from_pid):
     """Creates the EU4 mod files in file_dir, given the basic data."""
     # Make the basic filestructure that other things go in.
@@ -1,26 +1,73 @@
+import argparse
+import heapq
+import multiprocessing
 import os
-import pickle
 import random
+import sys
+import tempfile
 import time
 import yaml
+from concurrent.futures import ProcessPoolExecutor
+from enum import Enum
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Not on Windows.
+    resource = None
 
 import perlin_noise
 
 from map_io import valid_cubes
+import mod_writer
 from area import Area
+from checkpoint import StageCache
+import clausewitz
+import stripper
 from chunk_split import check_contiguous, find_contiguous, split_chunk, SplitChunkMaxIterationExceeded
 from cube import *
+from hex_grid import find_straits
+import profiling
 from terrain import BaseTerrain, RAIL_DIST, TERRAIN_HEIGHT, WATER_HEIGHT
+from timing import count, merge, report, span, timed, trace_memory, write_report
 from voronoi import area_voronoi, iterative_voronoi, growing_voronoi, max_voronoi, voronoi
+from world_io import load_world, save_world
 
 from region_tree import RegionTree
+from sea_mask import SeaMask
 import ck3
 import eu4
 import v3
 import hoi4
 
+class CreationFailure(Enum):
+    """The reasons a continent (or the inner sea) can fail to be created, which CreationError carries."""
+    kingdom_incorrectly_sized = "Kingdom was incorrectly sized."
+    no_triple_point = "No point where all three chunks meet"
+    no_bc_edge = "No b-c edge for 4-continent"
+    no_b = "No b for 5-continent"
+    cd_misaligned = "c-d didn't line up correctly for 5-continent"
+    centers_too_close = "Centers too close together"
+    center_near_edge = "Center too close to edge"
+    fixed_edge_cut_off = "Fixed edge cut off by center expansion."
+    fixed_edge_too_large = "Fixed edge too large for border duchy."
+    fixed_edge_too_small = "Fixed edge too small for border size."
+    no_dynamic_border = "No connection between regions left for dynamic border region."
+    growing_voronoi_failed = "growing_voronoi failed for some reason."
+    duplicate_centers = "Duplicate centers for growing_voronoi."
+    duchy_split_failed = "Duchy splitting failed for some reason."
+    kingdom_split_failed = "Kingdom failed to split."
+    open_inner_sea = "Inner sea is open."
+    coasts_adjacent = "The two longest coasts of the chunk border each other."
+
+
 class CreationError(Exception):
-    pass
+    """Raised with a CreationFailure, and keyword context about it (like the sizes involved) in self.context."""
+
+    def __init__(self, failure, **context):
+        self.failure = failure
+        self.context = context
+        super().__init__(failure.value + "".join([f" {k}={v}" for k, v in context.items()]))
 
 def assemble_culrels(region_trees):
     """Create lists of cultures and religions that are present in region_trees, which is a list of RegionTrees."""
@@ -140,14 +187,21 @@ def split_kingdom(kingdom, allocated, cdistmap, adj_size_list):
                 except SplitChunkMaxIterationExceeded:
                     continue
                 except AssertionError:  # The kingdom was incorrectly sized.
-                    print("Kingdom was incorrectly sized.")
-                    raise CreationError
+                    raise CreationError(CreationFailure.kingdom_incorrectly_sized, size=len(others), sizes=sum(adj_size_list))
     return this_capital, ksplit
 
 
+def triple_point(chunks, a, b, c):
+    """Returns a cube of chunk a that borders both chunk b and chunk c, raising CreationError if there isn't one."""
+    shared = chunks[a].self_edges[b].intersection(chunks[a].self_edges[c])
+    if len(shared) == 0:
+        raise CreationError(CreationFailure.no_triple_point, chunks=(a, b, c))
+    return list(shared)[0]
+
+
 def create_triangular_continent(weight_from_cube, chunks, candidate, config):
     """Chunks is a list of chunks; candidates is a tuple of chunk ids (of length 3, 4, or 5).
-    This generates a continent out of a series of triangular chunk cliques and will return CreationFailure if the adjacencies aren't right.
+    This generates a continent out of a series of triangular chunk cliques and will raise a CreationError if the adjacencies aren't right.
     Returns a list cube_from_pid"""
     terr_templates = []
     num_k = len(candidate[0])
@@ -155,7 +209,7 @@ def create_triangular_continent(weight_from_cube, chunks, candidate, config):
     num_b = num_k * 2 - 3
     if num_k == 3:
         a,b,c = candidate[0]
-        centers = [((a,b,c), list(chunks[a].self_edges[b].intersection(chunks[a].self_edges[c]))[0])]
+        centers = [((a,b,c), triple_point(chunks, a, b, c))]
         fixed_borders = []
         dyna_borders = [(a,b),(b,c),(a,c)]
     elif num_k == 4:
@@ -165,14 +219,13 @@ def create_triangular_continent(weight_from_cube, chunks, candidate, config):
             others = list(candidate[0][:ind]) + list(candidate[0][ind+1:])
             nums[sum([o in chunks[candidate[0][ind]].self_edges for o in others])].append(candidate[0][ind])
         if len(nums[3]) < 2:
-            print("No b-c edge for 4-continent")
-            raise CreationError
+            raise CreationError(CreationFailure.no_bc_edge)
         elif len(nums[3]) > 2:  # We need to pick the longest edge to be the b-c edge
             nums[3] = sorted([y for y in nums[3]], key=lambda x: max([chunks[x].self_edges[o] for o in nums[3] if o != x]), reverse=True)
         b,c,a,d = nums[3] + nums[2]
         centers = [
-            ((a,b,c), list(chunks[a].self_edges[b].intersection(chunks[a].self_edges[c]))[0]),
-            ((b,c,d), list(chunks[d].self_edges[b].intersection(chunks[d].self_edges[c]))[0])
+            ((a,b,c), triple_point(chunks, a, b, c)),
+            ((b,c,d), triple_point(chunks, d, b, c))
         ]
         fixed_borders = [(b,c)]
         dyna_borders = [(a,b),(a,c),(b,d),(c,d)]
@@ -183,8 +236,7 @@ def create_triangular_continent(weight_from_cube, chunks, candidate, config):
             nums[sum([o in chunks[candidate[0][ind]].self_edges for o in others])].append(candidate[0][ind])
         # b connects to at least 4; abc, bcd, bde are the triangles. 
         if len(nums[4]) < 1:
-            print("No b for 5-continent")
-            raise CreationError
+            raise CreationError(CreationFailure.no_b)
         b = nums[4][0]
         c, d, alpha, beta = nums[4][1:] + nums[3] + nums[2]
         if alpha in chunks[c].self_edges:
@@ -194,12 +246,11 @@ def create_triangular_continent(weight_from_cube, chunks, candidate, config):
             a = beta
             e = alpha
         if d not in chunks[c].self_edges:
-            print("c-d didn't line up correctly for 5-continent")
-            raise CreationError
+            raise CreationError(CreationFailure.cd_misaligned)
         centers = [
-            ((a,b,c), list(chunks[a].self_edges[b].intersection(chunks[a].self_edges[c]))[0]),
-            ((b,c,d), list(chunks[d].self_edges[b].intersection(chunks[d].self_edges[c]))[0]),
-            ((b,d,e), list(chunks[d].self_edges[b].intersection(chunks[d].self_edges[e]))[0]),
+            ((a,b,c), triple_point(chunks, a, b, c)),
+            ((b,c,d), triple_point(chunks, d, b, c)),
+            ((b,d,e), triple_point(chunks, d, b, e)),
         ]
         fixed_borders = [(b,c), (b,d)]
         dyna_borders = [(a,b),(a,c),(b,c),(b,e),(d,e)]
@@ -208,12 +259,10 @@ def create_triangular_continent(weight_from_cube, chunks, candidate, config):
     for (aa,bb,cc), center in centers:
         _, _, cdistmap = voronoi([center], weight_from_cube)
         if not all([x not in cube_from_pid for x in center.neighbors()]):  # The center is too close to an existing center.
-            print("Centers too close together")
-            raise CreationError
+            raise CreationError(CreationFailure.centers_too_close, center=center)
         cube_from_pid.extend([center] + list(center.neighbors()))
         if not all([x in weight_from_cube for x in cube_from_pid]):  # Check to make sure the center is actually contained.
-            print("Center too close to edge")
-            raise CreationError
+            raise CreationError(CreationFailure.center_near_edge, center=center)
         # Add the three counties to the central duchy, each one carved out of a different original region.
         for cid, other in enumerate([aa,bb,cc]):
             options = {k:weight_from_cube[k] for k in cdistmap.keys() if k in chunks[other].members and k not in cube_from_pid}
@@ -229,13 +278,11 @@ def create_triangular_continent(weight_from_cube, chunks, candidate, config):
         initiala = [x for x in chunks[aa].self_edges[bb] if x not in allocated]
         initialb = [x for x in chunks[bb].self_edges[aa] if x not in allocated]
         if len(initiala) == 0 or len(initialb) == 0:  # One of the sections is cut off from the other by the center.
-            print("Fixed edge cut off by center expansion.")
-            raise CreationError
+            raise CreationError(CreationFailure.fixed_edge_cut_off)
         # This should maybe be a call to growing_voronoi or something? I'm doing it manually here b/c
         # I want to ensure that the whole connection between the centers is included, but this is maybe something that would be done by the right choice of distance.
         if len(initiala) + len(initialb) > config["BORDER_SIZE"]:  # TODO: Handle this case correctly
-            print("Fixed edge too large for border duchy.")
-            raise CreationError
+            raise CreationError(CreationFailure.fixed_edge_too_large, size=len(initiala) + len(initialb), border_size=config["BORDER_SIZE"])
         this_border = initiala + initialb
         options = {}
         for cube in this_border:
@@ -265,8 +312,7 @@ def create_triangular_continent(weight_from_cube, chunks, candidate, config):
                 else:
                     options[w] = [nbr]
         if len(this_border) != config["BORDER_SIZE"]:
-            print("Fixed edge too small for border size.")
-            raise CreationError
+            raise CreationError(CreationFailure.fixed_edge_too_small, size=len(this_border), border_size=config["BORDER_SIZE"])
         for cube in this_border:
             group_from_cube[cube] = ind
             allocated.add(cube)
@@ -276,8 +322,7 @@ def create_triangular_continent(weight_from_cube, chunks, candidate, config):
     for o1, o2 in dyna_borders:
         options = {k for k in chunks[o1].self_edges[o2].union(chunks[o1].other_edges[o2]) if k not in allocated}
         if len(options) == 0:
-            print("No connection between regions left for dynamic border region.")
-            raise CreationError
+            raise CreationError(CreationFailure.no_dynamic_border)
         new_centers.append(min(options, key=cdistmap.get))
     # Add the kingdoms
     for o in candidate[0]:
@@ -287,8 +332,9 @@ def create_triangular_continent(weight_from_cube, chunks, candidate, config):
     try:
         new_centers, dyna_group_from_cube = growing_voronoi(new_centers, [config["BORDER_SIZE"]]*len(dyna_borders) + [config["KINGDOM_SIZE"]]*num_k, subweights)
     except ValueError:
-        print("growing_voronoi failed for some reason.")
-        raise CreationError
+        raise CreationError(CreationFailure.growing_voronoi_failed)
+    except AssertionError:  # Two of the centers landed on the same cube.
+        raise CreationError(CreationFailure.duplicate_centers)
     # Split the border duchies into counties
     group_from_cube.update({k: v + len(fixed_borders) for k, v in dyna_group_from_cube.items() if v != -1})
     for ind in range(num_b):
@@ -296,8 +342,7 @@ def create_triangular_continent(weight_from_cube, chunks, candidate, config):
         try:
             counties = split_chunk(duchy, config["BORDER_SIZE_LIST"])
         except:  # Covers both difficult-to-split and incorrectly-sized regions.
-            print("Duchy splitting failed for some reason.")
-            raise CreationError
+            raise CreationError(CreationFailure.duchy_split_failed, size=len(duchy), sizes=sum(config["BORDER_SIZE_LIST"]))
         for county in counties:
             cube_from_pid.extend(county)
         terr_templates.append(config["BORDER_TERRAIN_TEMPLATE"])
@@ -333,8 +378,7 @@ def create_triangular_continent(weight_from_cube, chunks, candidate, config):
                     except SplitChunkMaxIterationExceeded:
                         continue
                     except AssertionError:  # The kingdom was incorrectly sized.
-                        print("Kingdom was incorrectly sized.")
-                        raise CreationError
+                        raise CreationError(CreationFailure.kingdom_incorrectly_sized, size=len(others), sizes=sum(adj_size_list))
         if not to_be_continued:
             cube_from_pid.extend(this_capital)
             sea_centers.append([x for x in this_capital[0].neighbors() if x not in this_capital][0])
@@ -344,13 +388,13 @@ def create_triangular_continent(weight_from_cube, chunks, candidate, config):
                 try:
                     dsplit = split_chunk(duchy, config["KINGDOM_SIZE_LIST"][dind][start_ind:])
                 except:
-                    print("Kingdom failed to split.")
-                    raise CreationError
+                    raise CreationError(CreationFailure.kingdom_split_failed, size=len(duchy))
                 for county in dsplit:
                     cube_from_pid.extend(county)
     return cube_from_pid, terr_templates, sea_centers
     
 
+@timed()
 def create_triangle_continents(config, weight_from_cube = None, n_x=129, n_y=65, num_centers=None, last_pid=1, last_rid=0, last_srid=0, start_time=None):
     """Create len(config["CONTINENT_LISTS"]) continents with the appropriate number of kingdoms.
     Uses the standard triangle-border system, which requires 3 to 5 kingdoms per continent.
@@ -395,23 +439,31 @@ def create_triangle_continents(config, weight_from_cube = None, n_x=129, n_y=65,
         all_sea_centers = []
         while len(continents) <= cind:
             ind += 1
+            if ind >= len(candidates):  # Out of candidates, possibly because an earlier continent used them up.
+                print(f"Failed to make enough of size {num_k}, had to rechunk.")
+                rechunk_start = time.time()
+                count("continents.rechunks")
+                centers, chunks, cids = create_chunks(weight_from_cube, num_centers)
+                candidates = compute_func(chunks, cids, num_k)
+                count("continents.rechunk_seconds", time.time() - rechunk_start)
+                ind = 0
+            count("continents.attempts")
             if start_time is None:
                 print("Continent attempt:",ind)
             else:
                 print("Continent attempt:",ind, "Time elapsed:", time.time()-start_time)
+            attempt_start = time.time()
             subweights = {k:v for k,v in weight_from_cube.items() if any([k in chunks[cid].members for cid in candidates[ind][0]])}
             try:
                 continent, terr_template, sea_centers = create_triangular_continent(subweights, chunks, candidates[ind], config)
                 continents.append(continent)
                 terr_templates.append(terr_template)
                 all_sea_centers.extend(sea_centers)
-            except CreationError:
-                print("Creation error")
-                if ind == len(candidates) - 1:
-                    print(f"Failed to make enough of size {num_k}, had to rechunk.")
-                    centers, chunks, cids = create_chunks(weight_from_cube, num_centers)
-                    candidates = compute_func(chunks, cids, num_k)
-                    ind = -1
+            except CreationError as e:
+                print("Creation error:", e)
+                # Counted by reason, with the time the failed attempt took, to see where the retries go.
+                count(f"continents.failures.{e.failure.name}")
+                count(f"continents.failed_seconds.{e.failure.name}", time.time() - attempt_start)
     return continents, terr_templates, region_trees, all_sea_centers, last_pid, last_rid, last_srid, l_from_title,
 
 
@@ -427,6 +479,7 @@ def assign_sea_zones(sea_cubes, config, province_centers=[], region_centers=[],
     if "SEA_PROVINCES" not in config:
         config["SEA_PROVINCES"] = len(sea_cubes) // config.get("SEA_PROVINCE_SIZE", 10)
     if style == "random":
+        sea_province_centers = [k for k in sea_province_centers if k in sea_cubes]  # Some may have been cropped off.
         v_centers = random.sample(list(sea_cubes), max(0, config["SEA_PROVINCES"] - len(sea_province_centers))) + sea_province_centers
         v_centers, pid_from_cube, _ = voronoi(v_centers, {k:1 for k in sea_cubes})
     elif style == "even":
@@ -495,7 +548,8 @@ def assign_terrain_continent(cube_from_pid, rough_from_pid, templates):
     return terr_from_cube
 
 
-def arrange_inner_sea(continents, inner_sea_center, angles=[2,0,4]):
+@timed()
+def arrange_inner_sea(continents, inner_sea_center, angles=[2,0,4], seed=None):
     """Given three continents, arrange them to have straits around a central inner sea.
     Returns the cube lists for the continents, centers for sea regions, and the part of the inner sea within the bounding hex from its entrances."""
     assert len(continents) == 3
@@ -509,7 +563,7 @@ def arrange_inner_sea(continents, inner_sea_center, angles=[2,0,4]):
         ac.rotate(rot + 3)
         ac.translate(off2)
         moved_continents.append(ac)
-    if config.get("seed", None) == 20240512:  # Help the optimization along
+    if seed == 20240512:  # Help the optimization along
         moved_continents = [cont.add(off) for cont, off in zip(moved_continents, [Cube(0,0,0), Cube(-13,1,12), Cube(-4,-12,16)])]
     directions = [Cube(x, y, -x-y) for x in range(-2, 3) for y in range(-2, 3)]
     temp = 0.1
@@ -532,6 +586,7 @@ def arrange_inner_sea(continents, inner_sea_center, angles=[2,0,4]):
             moved_continents = candidate
             total_moves = [x.add(y) for x,y in zip(total_moves, offs)]
         temp *= 0.9999
+    count("inner_sea.steps", steps)
     if score == -99:
         print("Optimization found a perfect score after", steps, "steps.")
         print(total_moves)
@@ -587,34 +642,104 @@ def arrange_mediterranean(continents):
     raise NotImplementedError
 
 
-def assign_color(rgb_from_pid, land=None):
-    if land is None:
-        rgb = (random.randint(2,255),random.randint(2,255),random.randint(2,255))
-    elif land:
-        rgb = (random.randint(64,255),random.randint(64,255),random.randint(2,64))
-    else:
-        rgb = (random.randint(2,128),random.randint(2,128),random.randint(128,255))
-    if rgb not in rgb_from_pid.values():
-        return rgb
-    else:
-        return assign_color(rgb_from_pid)
+# (min, max) inclusive bounds of red, green, and blue for general, land, and sea colors.
+COLOR_RANGES = {
+    None: ((2, 255), (2, 255), (2, 255)),
+    True: ((64, 255), (64, 255), (2, 64)),
+    False: ((2, 128), (2, 128), (128, 255)),
+}
+
+
+def assign_color(used_rgbs, land=None):
+    """Returns a color in the land / sea / general range that isn't in used_rgbs, and adds it to used_rgbs."""
+    (r_lo, r_hi), (g_lo, g_hi), (b_lo, b_hi) = COLOR_RANGES[land]
+    for _ in range(100):
+        rgb = (random.randint(r_lo, r_hi), random.randint(g_lo, g_hi), random.randint(b_lo, b_hi))
+        if rgb not in used_rgbs:
+            used_rgbs.add(rgb)
+            return rgb
+    # The range is nearly full, so random draws keep colliding; walk it in order instead.
+    for r in range(r_lo, r_hi + 1):
+        for g in range(g_lo, g_hi + 1):
+            for b in range(b_lo, b_hi + 1):
+                if (r, g, b) not in used_rgbs:
+                    used_rgbs.add((r, g, b))
+                    return (r, g, b)
+    raise ValueError(f"No unused colors left in range {COLOR_RANGES[land]}")
+
 
 def create_colors(pid_from_cube):
     """Assign a unique color to each of the pids in pid_from_cube."""
     rgb_from_pid = {}
+    used_rgbs = set()
     for pid in pid_from_cube.values():
-        rgb_from_pid[pid] = assign_color(rgb_from_pid)
+        if pid not in rgb_from_pid:
+            rgb_from_pid[pid] = assign_color(used_rgbs)
     return rgb_from_pid
 
 
 def create_landed_colors(pid_from_cube, land_cubes):
-    """Assign a unique color to each of the pids in pid_from_cube."""
+    """Assign a unique color to each of the pids in pid_from_cube, using the land range for pids in land_cubes and the sea range otherwise."""
     rgb_from_pid = {}
+    used_rgbs = set()
     for cube, pid in pid_from_cube.items():
-        rgb_from_pid[pid] = assign_color(rgb_from_pid, cube in land_cubes)
+        if pid not in rgb_from_pid:
+            rgb_from_pid[pid] = assign_color(used_rgbs, cube in land_cubes)
     return rgb_from_pid
 
 
+def find_rail_path(start, end, rail_dist_from_cube, rid_from_cube, rids):
+    """Finds the cheapest path from start to end through cubes whose rid is in rids, with bidirectional A*.
+    Entering a cube costs its rail distance, and the heuristic is the cube distance times the cheapest rail distance.
+    Returns the list of cubes from start to end, or None if there is no path."""
+    min_rail_dist = min(RAIL_DIST.values())
+    goals = (end, start)
+    # Index 0 searches forward from start, index 1 backward from end. The backward search charges the cube it leaves,
+    # so that cost_from_cube[0][k] + cost_from_cube[1][k] is the forward cost of the full path through k.
+    frontiers = ([(start.dist(end) * min_rail_dist, 0, 0, start)], [(start.dist(end) * min_rail_dist, 0, 1, end)])
+    cost_from_cube = ({start: 0}, {end: 0})
+    parent_from_cube = ({start: None}, {end: None})
+    counter = 2
+    best_cost = 0 if start == end else None
+    meeting = start if start == end else None
+    while frontiers[0] and frontiers[1]:
+        side = 0 if frontiers[0][0][0] <= frontiers[1][0][0] else 1
+        if best_cost is not None and frontiers[side][0][0] >= best_cost:
+            break  # Neither frontier can produce anything cheaper than what we have.
+        _, cost, _, cube = heapq.heappop(frontiers[side])
+        if cost > cost_from_cube[side][cube]:
+            continue  # Stale entry.
+        for nbr in cube.ordered_neighbors():
+            if rid_from_cube.get(nbr, -1) not in rids:
+                continue
+            new_cost = cost + (rail_dist_from_cube[nbr] if side == 0 else rail_dist_from_cube[cube])
+            if nbr in cost_from_cube[side] and cost_from_cube[side][nbr] <= new_cost:
+                continue
+            cost_from_cube[side][nbr] = new_cost
+            parent_from_cube[side][nbr] = cube
+            heapq.heappush(frontiers[side], (new_cost + nbr.dist(goals[side]) * min_rail_dist, new_cost, counter, nbr))
+            counter += 1
+            if nbr in cost_from_cube[1 - side]:
+                total = new_cost + cost_from_cube[1 - side][nbr]
+                if best_cost is None or total < best_cost:
+                    best_cost = total
+                    meeting = nbr
+    if meeting is None:
+        return None
+    path = []
+    cube = meeting
+    while cube is not None:
+        path.append(cube)
+        cube = parent_from_cube[0][cube]
+    path.reverse()
+    cube = parent_from_cube[1][meeting]
+    while cube is not None:
+        path.append(cube)
+        cube = parent_from_cube[1][cube]
+    return path
+
+
+@timed()
 def create_supply_rails(terr_from_cube, pids_from_rid, rid_from_cube, cube_from_pid, pid_from_cube, name_from_rid):
     """Create supply nodes and railways"""
     supply_nodes = []
@@ -622,6 +747,7 @@ def create_supply_rails(terr_from_cube, pids_from_rid, rid_from_cube, cube_from_
     areas = {}
     rail_dist_from_cube = {k:RAIL_DIST[v] for k,v in terr_from_cube.items()}
     rail_connex = {}
+    routed = set()
     for rid, pids in pids_from_rid.items():
         if rid not in name_from_rid or name_from_rid[rid][0] == "s":
             continue
@@ -630,31 +756,11 @@ def create_supply_rails(terr_from_cube, pids_from_rid, rid_from_cube, cube_from_
         areas[rid] = Area(cid=rid, members=[cube_from_pid[pid] for pid in pids if pid in cube_from_pid])
         areas[rid].calc_edges(rid_from_cube)
         for orid in areas[rid].self_edges:
-            if name_from_rid[orid][0] == "s":
+            if name_from_rid[orid][0] == "s" or (min(rid, orid), max(rid, orid)) in routed:
                 continue
+            routed.add((min(rid, orid), max(rid, orid)))
             ocap_pid = min(pids_from_rid[orid])
-            cap_cube = land_cube_from_pid[cap_pid]
-            ocap_cube = land_cube_from_pid[ocap_pid]
-            partial_paths = [(0, [cap_cube], False), (0,[ocap_cube], True)]
-            need_path = True
-            final_path = None
-            reached_cubes = {False: {cap_cube}, True: {ocap_cube}}
-            while need_path:  # This could be smarter by doing A* instead of just expanding 
-                if len(partial_paths) == 0:  # Somehow we failed to find a path.
-                    need_path=False
-                    continue
-                partial_paths = sorted(partial_paths)
-                this_path = partial_paths.pop(0)
-                for nbr in this_path[1][-1].neighbors():
-                    if rid_from_cube.get(nbr,-1) in [rid, orid] and nbr not in reached_cubes[this_path[2]]:
-                        if nbr in reached_cubes[not this_path[2]]:
-                            other_part = sorted([pp for pp in partial_paths if nbr in pp[1] and this_path[2] != pp[2]])[0][1]
-                            other_part.reverse()
-                            final_path = this_path[1] + other_part
-                            need_path = False
-                            break
-                        partial_paths.append((this_path[0] + rail_dist_from_cube[nbr], this_path[1] + [nbr], this_path[2]))
-                        reached_cubes[this_path[2]].add(nbr)
+            final_path = find_rail_path(cube_from_pid[cap_pid], cube_from_pid[ocap_pid], rail_dist_from_cube, rid_from_cube, (rid, orid))
             if final_path is not None:
                 for ind in range(len(final_path)-1):
                     a = pid_from_cube[final_path[ind]]
@@ -693,6 +799,7 @@ def create_supply_rails(terr_from_cube, pids_from_rid, rid_from_cube, cube_from_
     return supply_nodes, railways
 
 
+@timed()
 def create_old_world_islands_and_seas(config, land_cubes, sea_centers, last_pid, last_rid, last_srid, med=set()):
     """Given land_cubes, calculate shallow waters, place islands, and calculate sea regions."""
     # sea_centers[0] should be the middle of the inner sea region.
@@ -717,8 +824,7 @@ def create_old_world_islands_and_seas(config, land_cubes, sea_centers, last_pid,
             if inner:
                 inner_med.add(tc)
         if len(to_explore) >= 400:
-            print(sea_centers[0])
-            raise CreationError  # This should only happen if the med is somehow open, and is to prevent going forever.
+            raise CreationError(CreationFailure.open_inner_sea, center=sea_centers[0])  # This should only happen if the med is somehow open, and is to prevent going forever.
     else:
         inner_med = {tc for tc in med if tc not in sea_shore and not any([nbr not in med for nbr in tc.strait_neighbors()])}
     print(f"There are {len(inner_med)} cubes in the deep inner sea.")
@@ -744,79 +850,32 @@ def create_old_world_islands_and_seas(config, land_cubes, sea_centers, last_pid,
     filling_med = True
     region_tree, last_pid, last_rid, last_srid, l_from_title = RegionTree.from_yml(os.path.join("data", "e-e_islands.yml"), last_pid=last_pid, last_rid=last_rid, last_srid=last_srid)
     region_tree.children[0].capital_pid = last_pid  # The interstitial kingdom has its capital in another file, and so this needs to be assigned here.
-    candidates = inner_med
+    sea_mask = SeaMask(inner_med)
+    weight_from_cube = {k: random.randint(1,8) for k in inner_med}
     # These are split into 'earlier' and 'later' because there's both generic islands and island kingdoms, and when pids are assigned they do generics first.
     earlier_island_cubes = []
     later_island_cubes = []
     earlier_terr_templates = []
     later_terr_templates = []
     for island_num, island_name in enumerate(config.get("ISLAND_LIST", [])):
-        curr_candidates = [x for x in candidates]
         # Figure out if it's going to fit in the med and where to start it.
         size = int(island_name.split("-")[0].strip())
         # Because island inner structure isn't determined from a template, but instead the region_tree, let's parse that.
         rt, last_pid, last_rid, last_srid, local = RegionTree.from_yml(os.path.join("data", island_name)+".yml", last_pid=last_pid, last_rid=last_rid, last_srid=last_srid)
         l_from_title.update(local)
         depth, size_list = rt.size_list()
+        if depth == 2: # We need to split duchies also
+            raise NotImplementedError  # Assuming the center is a single-duchy region.
+        elif depth == 0:
+            size_list = [size_list]
         counties = []
-        failed = False
-        while filling_med and size < len(curr_candidates) and 0 < len(curr_candidates):  # We're still trying to stick them in the middle. Note curr_candidates is used to leave the loop.
-            if island_num == 0 and len(counties) == 0 and sea_centers[0] in inner_med:  # For the first one we want to force the capital location.
-                center = sea_centers[0]
-            else:
-                center = random.choice(curr_candidates)
-            weight_from_cube = {k: random.randint(1,8) for k in curr_candidates}  # It's a little wasteful to do this here instead of earlier but w/e
-            _, _, big_distmap = voronoi([center], weight_from_cube)
-            big_region = sorted(big_distmap.keys(), key=big_distmap.get)
-            if depth == 2: # We need to split duchies also
-                raise NotImplementedError  # Assuming the center is a single-duchy region.
-            elif depth == 0:
-                counties = [big_region[:size_list]]
-                curr_candidates = []
-            else:  # depth == 1
-                counties = [big_region[:size_list[0]]]  # First county is centered on the sampled point
-                for k in counties[-1]:
-                    if k in curr_candidates:
-                        curr_candidates.remove(k)
-                subweight_from_cube = {k:weight_from_cube[k] for k in big_region[size_list[0]:]}
-                big_region = big_region[size_list[0]:]
-                failed = False
-                for c_size in size_list[1:]:
-                    if len(big_region) < c_size:
-                        failed = True
-                        curr_candidates = [x for x in curr_candidates if x not in big_region]
-                    if failed:
-                        break
-                    _, _, small_distmap = voronoi([big_region[0]], subweight_from_cube)
-                    if len(small_distmap) == len(subweight_from_cube):  # The remaining space is connected, and so we don't need to think about it.
-                        small_region = sorted(small_distmap.keys(), key=small_distmap.get)
-                    else:
-                        small_region = sorted(small_distmap.keys(), key=small_distmap.get)
-                        while len(small_region) < c_size:  # The closest chunk is too small to support the next county. We'll assume that goes for all counties, which is maybe a bit harsh.
-                            subweight_from_cube = {k:v for k,v in subweight_from_cube.items() if k not in small_distmap}
-                            big_region = [k for k in big_region if k not in small_distmap]
-                            if len(big_region) == 0:  # We made it to the end of this candidate section.
-                                failed = True
-                                curr_candidates = [x for x in curr_candidates if x not in big_distmap]
-                                if len(curr_candidates) == 0:  # Not only have we finished this disconnected region, we've finished searching the whole inner sea.
-                                    filling_med = False
-                                break
-                            _, _, small_distmap = voronoi([big_region[0]], subweight_from_cube)
-                            small_region = sorted(small_distmap.keys(), key=small_distmap.get)
-                    if not failed:  # Need to check to make sure we didn't fail
-                        counties.append(small_region[:c_size])
-                        subweight_from_cube = {k:v for k,v in subweight_from_cube.items() if k not in counties[-1]}
-                        big_region = [k for k in big_region if k not in counties[-1]]  # The sort ordering is different so have to search
-                if not failed: # We successfully assigned the counties
-                    curr_candidates = []
-        if failed or sum([len(c) for c in counties]) != size:  # Not sure why this sometimes go thru this path.
-            filling_med = False
+        if filling_med:  # We're still trying to stick them in the middle.
+            center = sea_centers[0] if island_num == 0 else None  # For the first one we want to force the capital location.
+            counties = sea_mask.place(size_list, weight_from_cube, center=center)
+            if counties is None or sum([len(c) for c in counties]) != size:
+                filling_med = False
         if not filling_med:  # Written this way instead of as an else so that we can fail over to it, for either the first island or later ones.
             center = random.choice(list(outer_coast))
-            if depth == 2: # We need to split duchies also
-                raise NotImplementedError  # Assuming the center is a single-duchy region.
-            elif depth == 0:
-                size_list = [size_list]
             opts = [center]
             alloc = set()
             counties = []
@@ -862,10 +921,7 @@ def create_old_world_islands_and_seas(config, land_cubes, sea_centers, last_pid,
         # remove these cubes (and their neighbors) from the appropriate sets
         # This could maybe be earlier?
         if filling_med:
-            for cube in cubes:
-                for nbr in {cube}.union(cube.neighbors()).union(cube.strait_neighbors()):
-                    if nbr in candidates:
-                        candidates.remove(nbr)
+            sea_mask.close({nbr for cube in cubes for nbr in {cube}.union(cube.neighbors()).union(cube.strait_neighbors())})
         else:
             for cube in cubes:
                 for nbr in {cube}.union(cube.neighbors()).union(cube.strait_neighbors()):
@@ -896,22 +952,43 @@ def create_old_world_islands_and_seas(config, land_cubes, sea_centers, last_pid,
     sea_shore = [k for k in ow_sea if any([nbr in island_cubes or nbr in land_cubes for nbr in k.neighbors()])]
     return island_cubes, region_tree, l_from_title, earlier_terr_templates + later_terr_templates, ow_sea, sea_shore, last_pid, last_rid, last_srid
 
-def create_data(config):
-    """The main function that calls all the other functions in order. 
-    The resulting data structure should be enough to make the mod for any particular game."""
-    start_time = time.time()
-    random.seed(config.get("seed", 1945))
+# The config entries read by each stage of create_data, in order. Each stage's checkpoint is keyed by these and by every stage before it.
+CONFIG_KEYS_FROM_STAGE = {
+    "continents": ["seed", "n_x", "n_y", "num_centers", "CONTINENT_LISTS", "CENTER_SIZE", "CENTER_SIZE_LIST", "BORDER_SIZE", "BORDER_SIZE_LIST", "KINGDOM_SIZE", "KINGDOM_SIZE_LIST", "KINGDOM_DUCHY_LIST", "CENTER_TERRAIN_TEMPLATE", "BORDER_TERRAIN_TEMPLATE", "KINGDOM_TERRAIN_TEMPLATE", "PLAYER_HOLY_SITES"],
+    "inner_sea": ["eu4n_x", "eu4n_y", "angles"],
+    "islands": ["ISLAND_LIST", "ISLAND_TERRAIN_TEMPLATE"],
+    "pids": [],
+    "impassable": ["CROP_OW", "box_width", "ck3n_x", "ck3n_y", "max_x", "max_y"],
+    "sea_zones": ["SEA_PROVINCES", "SEA_REGIONS", "SEA_PROVINCE_SIZE", "SEA_PROVINCE_STYLE"],
+    "heightmap": [],
+    "rivers": ["RIVER_FRAC"],
+}
+# The modules besides gen whose code the stages run. Their source is part of every checkpoint key, so editing them can't load stale stages.
+STAGE_MODULES = ["area", "checkpoint", "chunk_split", "cube", "hex_grid", "map_io", "region_tree", "sea_mask", "terrain", "voronoi"]
+
+
+def continents_stage(config, start_time):
+    """Creates the three triangular continents and their region trees."""
     last_pid = 1  # province_id. They 1-index instead of 0-indexing.
-    last_cid = 1  # county_id. They 1-index instead of 0-indexing.
     last_rid = 1  # region_id. They 1-index instead of 0-indexing.
     last_srid = 1  # strategic_region_id. They 1-index instead of 0-indexing.
     continents, terr_templates, region_trees, sea_centers, last_pid, last_rid, last_srid, name_from_title = create_triangle_continents(config, n_x=config["n_x"], n_y=config["n_y"], num_centers=config.get("num_centers", None), last_pid=last_pid, last_rid=last_rid, last_srid=last_srid, start_time=start_time)
+    print("Continents created; time elapsed:", time.time()-start_time)
+    return continents, terr_templates, region_trees, sea_centers, last_pid, last_rid, last_srid, name_from_title
+
+
+def inner_sea_stage(config, continents, sea_centers, start_time):
+    """Arranges the continents around the inner sea."""
     m_x = config["eu4n_x"]//2
     m_y = -(config["eu4n_y"]+config["eu4n_x"]//2)//2
-    print("Continents created; time elapsed:", time.time()-start_time)
-    continents, sea_region_centers, med = arrange_inner_sea(continents, Cube(m_x, m_y, -m_x-m_y), config.get("angles", [2,0,4]))
+    continents, sea_region_centers, med = arrange_inner_sea(continents, Cube(m_x, m_y, -m_x-m_y), config.get("angles", [2,0,4]), seed=config.get("seed", None))
     sea_centers = sea_region_centers + sea_centers
     print("Inner sea arranged; time elapsed:", time.time()-start_time)
+    return continents, sea_centers, sea_region_centers, med
+
+
+def islands_stage(config, continents, region_trees, name_from_title, terr_templates, sea_centers, med, last_pid, last_rid, last_srid):
+    """Places the islands, and finds the old world seas."""
     # First we find the 'inland seas'; the med, the old world coasts. We extend with islands, create the shallow sea zones, and then crop the old world for CK3.
     land_cubes = set()
     for cont in continents:
@@ -922,6 +999,11 @@ def create_data(config):
         continents.append(island_cubes)
         name_from_title.update(island_l_from_title)
         terr_templates.append(island_terr_templates)
+    return continents, region_trees, name_from_title, terr_templates, ow_sea, sea_shore
+
+
+def pids_stage(continents, region_trees, name_from_title, terr_templates, start_time):
+    """Assigns pids, rids, srids, names, and terrain to every land cube."""
     pid_from_cube = {}
     rid_from_pid = {}
     srid_from_pid = {}
@@ -974,17 +1056,19 @@ def create_data(config):
     terr_from_pid = {v:terr_from_cube[k] for k,v in pid_from_cube.items() if k in terr_from_cube}
     land_cube_from_pid = {v:k for k,v in pid_from_cube.items()}
     print("pid/cube relationships established; time elapsed:", time.time()-start_time)
+    return pid_from_cube, rid_from_pid, srid_from_pid, cont_from_pid, pid_from_title, tag_from_pid, land_cubes, terr_from_cube, terr_from_pid, name_from_pid, name_from_rid, name_from_srid, land_cube_from_pid, last_pid, last_rid, last_srid
+
+
+def impassable_stage(config, land_cubes, sea_centers, sea_region_centers, pid_from_cube, rid_from_pid, cont_from_pid, pid_from_title, terr_from_cube, terr_from_pid, name_from_pid, name_from_rid, land_cube_from_pid, last_pid, last_rid, start_time):
+    """Turns enclosed non-land into impassable provinces, finds straits, and crops the old world."""
     # Split out wastelands / mountains / lakes
     # TODO: This should not use valid_cubes, but instead the interior of the bounding hex. This would also make the continent obvious.
     non_land = sorted(find_contiguous(Area(0, land_cubes).bounding_hex_interior(extra=1, ignore=land_cubes)), key=len)
     non_land.pop(-1)  # The largest non-land chunk is the water, which we can ignore
     print("non_land contiguous groups found; time elapsed:", time.time()-start_time)
     # Determine straits
-    straits = []
-    for k in land_cubes:
-        for other_land, sea_1, sea_2 in k.valid_straits(land_cubes):
-            straits.append((k, other_land, sea_1, sea_2))
-            sea_centers.append(sea_1)
+    straits = find_straits(land_cubes)
+    sea_centers.extend([sea_1 for _, _, sea_1, _ in straits])
     print("beginning impassable; time elapsed:", time.time()-start_time)
     impassable = []
     impassable_rids = []
@@ -1039,11 +1123,14 @@ def create_data(config):
 
     print("Cropped down to",ow_nx,"hexes and a width of",ow_max_x,"for the old world.")
     print("Cropped down to",ow_ny,"hexes and a height of",ow_max_y,"for the old world.")
+    return land_cubes, sea_centers, sea_region_centers, pid_from_cube, rid_from_pid, cont_from_pid, pid_from_title, terr_from_cube, terr_from_pid, name_from_pid, name_from_rid, land_cube_from_pid, impassable, impassable_rids, straits, last_pid, last_rid, ow_nx, ow_ny, ow_max_x, ow_max_y
+
+
+def sea_zones_stage(config, ow_sea, sea_shore, sea_centers, sea_region_centers, land_cubes, pid_from_cube, rid_from_pid, srid_from_pid, pid_from_title, terr_from_cube, terr_from_pid, name_from_pid, name_from_rid, name_from_srid, impassable_rids, straits, last_pid, last_rid, last_srid, start_time):
+    """Splits the sea into provinces and regions, and picks the locations in each land region."""
     sid_from_cube, rid_from_sid, srid_from_sid = assign_sea_zones(ow_sea, config, province_centers=sea_centers, region_centers=sea_region_centers, poss_centers=sea_shore, style=config.get("SEA_PROVINCE_STYLE", "random"))
     print("assigned sea zones; time elapsed:", time.time()-start_time)
     pid_from_cube.update({k:v + last_pid for k,v in sid_from_cube.items()})
-    with open("pid_from_cube.txt",'wb') as outf:
-        pickle.dump((pid_from_cube, med), outf)
     sea_region = {"ocean": []}  # TODO: multiple oceans
     for k, sid in sid_from_cube.items():
         pid = sid + last_pid
@@ -1077,6 +1164,19 @@ def create_data(config):
         sids = [pid_from_cube[nbr] for nbr in cube.neighbors() if nbr in ow_sea and nbr in pid_from_cube]
         if len(sids) > 0:
             coast_from_cube[cube] = min(sids)
+    # Inverse indexes, so that per-province and per-region lookups don't have to scan everything.
+    cubes_from_pid = {}
+    for cube, pid in pid_from_cube.items():
+        if pid in cubes_from_pid:
+            cubes_from_pid[pid].append(cube)
+        else:
+            cubes_from_pid[pid] = [cube]
+    pids_from_rid = {}
+    for pid, rid in sorted(rid_from_pid.items()):
+        if rid in pids_from_rid:
+            pids_from_rid[rid].append(pid)
+        else:
+            pids_from_rid[rid] = [pid]
     locs_from_rid = {}
     for rid in range(1,last_rid):
         if rid in impassable_rids:
@@ -1085,13 +1185,13 @@ def create_data(config):
         title = name_from_rid.get(rid, "s_"+str(rid))
         if title[0] == "s":
             continue
-        pids = [pid for pid, rr in rid_from_pid.items() if rr==rid]
+        pids = pids_from_rid[rid]
         pid_from_loc["city"] = min(pids)
-        coastal_pid_cubes = sorted([(pid, coast_from_cube[cube]) for cube, pid in pid_from_cube.items() if pid in pids and cube in coast_from_cube])
+        coastal_pid_cubes = sorted([(pid, coast_from_cube[cube]) for pid in pids for cube in cubes_from_pid[pid] if cube in coast_from_cube])
         if len(coastal_pid_cubes) > 0:
             pid_from_loc["port"] = coastal_pid_cubes[0][0]
             coast_from_rid[rid] = coastal_pid_cubes[0][1]
-        cubes = [cube for cube, pid in pid_from_cube.items() if pid in pids and pid != pid_from_loc["city"]]
+        cubes = [cube for pid in pids if pid != pid_from_loc["city"] for cube in cubes_from_pid[pid]]
         if len(cubes) == 0:
             print(f"Province {pid} only has one cube in it!")
             pid_from_loc["farm"] = pid_from_loc["mine"] = pid_from_loc["wood"] = pid_from_loc["city"]
@@ -1101,6 +1201,11 @@ def create_data(config):
             pid_from_loc["mine"] = pid_from_cube[random.choice(cubes)]
             pid_from_loc["wood"] = pid_from_cube[random.choice(cubes)]
         locs_from_rid[rid] = pid_from_loc
+    return pid_from_cube, rid_from_pid, srid_from_pid, pid_from_title, terr_from_cube, terr_from_pid, name_from_pid, name_from_rid, name_from_srid, sea_region, straits, coast_from_cube, coast_from_rid, cubes_from_pid, pids_from_rid, locs_from_rid
+
+
+def heightmap_stage(land_cubes, ow_sea, terr_from_cube, start_time):
+    """Computes distance from the coast and the base and mask heights of every vertex."""
     # Determine distance from land/water boundary
     print("begin coast_dist; time elapsed:", time.time()-start_time)
     # Determine the coastal vertices and cubes
@@ -1165,6 +1270,11 @@ def create_data(config):
             else:
                 base_from_vertex[vl] = min(max(0, l), WATER_HEIGHT - 1)
     print(f"Heightmap base heights range from {min(base_from_vertex.values())} to {max(base_from_vertex.values())}, and mask heights range from {min(mask_from_vertex.values())} to {max(mask_from_vertex.values())}. Time elapsed: {time.time()-start_time}")
+    return coastal_vertices, interior_vertices, land_height_from_cube, water_depth_from_cube, base_from_vertex, mask_from_vertex
+
+
+def rivers_stage(config, coastal_vertices, interior_vertices, start_time):
+    """Flows rivers down from randomly sampled interior vertices."""
     # Create rivers
     inland_from_v = {v: 0 for v in coastal_vertices}
     to_expand = {v for v in coastal_vertices}
@@ -1235,6 +1345,31 @@ def create_data(config):
         else:
             endpoints.append(start)
     print("rivers flowed; time elapsed:", time.time()-start_time)
+    return river_flow_from_edge, river_sources, river_merges, river_max_flow
+
+
+@timed()
+def create_data(config):
+    """The main function that calls all the other functions in order. 
+    The resulting data structure should be enough to make the mod for any particular game.
+    Each stage is checkpointed to config["CACHE_DIR"] (set it to null to turn that off), so reruns resume from the first stage whose config changed.
+    Editing gen.py or any of STAGE_MODULES invalidates every checkpoint."""
+    start_time = time.time()
+    random.seed(config.get("seed", 1945))
+    data_files = [os.path.join("data", fn) for fn in os.listdir("data") if fn.endswith(".yml")]
+    code_modules = [sys.modules[__name__]] + [sys.modules[name] for name in STAGE_MODULES]
+    stages = StageCache(config.get("CACHE_DIR", os.path.join("cache", "stages")), config, CONFIG_KEYS_FROM_STAGE, data_files=data_files, code_modules=code_modules)
+    continents, terr_templates, region_trees, sea_centers, last_pid, last_rid, last_srid, name_from_title = stages.run("continents", continents_stage, config, start_time)
+    continents, sea_centers, sea_region_centers, med = stages.run("inner_sea", inner_sea_stage, config, continents, sea_centers, start_time)
+    # First we find the 'inland seas'; the med, the old world coasts. We extend with islands, create the shallow sea zones, and then crop the old world for CK3.
+    continents, region_trees, name_from_title, terr_templates, ow_sea, sea_shore = stages.run("islands", islands_stage, config, continents, region_trees, name_from_title, terr_templates, sea_centers, med, last_pid, last_rid, last_srid)
+    pid_from_cube, rid_from_pid, srid_from_pid, cont_from_pid, pid_from_title, tag_from_pid, land_cubes, terr_from_cube, terr_from_pid, name_from_pid, name_from_rid, name_from_srid, land_cube_from_pid, last_pid, last_rid, last_srid = stages.run("pids", pids_stage, continents, region_trees, name_from_title, terr_templates, start_time)
+    land_cubes, sea_centers, sea_region_centers, pid_from_cube, rid_from_pid, cont_from_pid, pid_from_title, terr_from_cube, terr_from_pid, name_from_pid, name_from_rid, land_cube_from_pid, impassable, impassable_rids, straits, last_pid, last_rid, ow_nx, ow_ny, ow_max_x, ow_max_y = stages.run(
+        "impassable", impassable_stage, config, land_cubes, sea_centers, sea_region_centers, pid_from_cube, rid_from_pid, cont_from_pid, pid_from_title, terr_from_cube, terr_from_pid, name_from_pid, name_from_rid, land_cube_from_pid, last_pid, last_rid, start_time)
+    pid_from_cube, rid_from_pid, srid_from_pid, pid_from_title, terr_from_cube, terr_from_pid, name_from_pid, name_from_rid, name_from_srid, sea_region, straits, coast_from_cube, coast_from_rid, cubes_from_pid, pids_from_rid, locs_from_rid = stages.run(
+        "sea_zones", sea_zones_stage, config, ow_sea, sea_shore, sea_centers, sea_region_centers, land_cubes, pid_from_cube, rid_from_pid, srid_from_pid, pid_from_title, terr_from_cube, terr_from_pid, name_from_pid, name_from_rid, name_from_srid, impassable_rids, straits, last_pid, last_rid, last_srid, start_time)
+    coastal_vertices, interior_vertices, land_height_from_cube, water_depth_from_cube, base_from_vertex, mask_from_vertex = stages.run("heightmap", heightmap_stage, land_cubes, ow_sea, terr_from_cube, start_time)
+    river_flow_from_edge, river_sources, river_merges, river_max_flow = stages.run("rivers", rivers_stage, config, coastal_vertices, interior_vertices, start_time)
     # Assign type_from_pid
     type_from_pid = {}
     lakes = []  # This should be pids, not cubes
@@ -1244,12 +1379,22 @@ def create_data(config):
         type_from_pid[pid_from_cube[k]] = "sea"
     for k in lakes:
         type_from_pid[k] = "lake"
-    return continents, pid_from_cube, land_cube_from_pid, rid_from_pid, srid_from_pid, cont_from_pid, terr_from_cube, terr_from_pid, type_from_pid, base_from_vertex, mask_from_vertex, land_height_from_cube, water_depth_from_cube, region_trees, pid_from_title, name_from_pid, name_from_rid, name_from_srid, impassable, river_flow_from_edge, river_sources, river_merges, river_max_flow, straits, locs_from_rid, coast_from_rid, coast_from_cube, tag_from_pid, sea_region, ow_nx, ow_ny, ow_max_x, ow_max_y
+    return continents, pid_from_cube, land_cube_from_pid, rid_from_pid, srid_from_pid, cont_from_pid, terr_from_cube, terr_from_pid, type_from_pid, base_from_vertex, mask_from_vertex, land_height_from_cube, water_depth_from_cube, region_trees, pid_from_title, name_from_pid, name_from_rid, name_from_srid, impassable, river_flow_from_edge, river_sources, river_merges, river_max_flow, straits, locs_from_rid, coast_from_rid, coast_from_cube, tag_from_pid, sea_region, ow_nx, ow_ny, ow_max_x, ow_max_y, cubes_from_pid, pids_from_rid
 
 
-if __name__ == "__main__":
-    with open("config.yml", 'r') as inf:
+# The names of create_data's outputs, in order.
+DATA_FIELDS = ["continents", "pid_from_cube", "land_cube_from_pid", "rid_from_pid", "srid_from_pid", "cont_from_pid", "terr_from_cube", "terr_from_pid", "type_from_pid", "base_from_vertex", "mask_from_vertex", "land_height_from_cube", "water_depth_from_cube", "region_trees", "pid_from_title", "name_from_pid", "name_from_rid", "name_from_srid", "impassable", "river_flow_from_edge", "river_sources", "river_merges", "river_max_flow", "straits", "locs_from_rid", "coast_from_rid", "coast_from_cube", "tag_from_pid", "sea_region", "ow_nx", "ow_ny", "ow_max_x", "ow_max_y", "cubes_from_pid", "pids_from_rid"]
+
+
+def load_config(filename="config.yml"):
+    """Reads the config, and fills in the sizes and map dimensions that are derived from other entries."""
+    with open(filename, 'r') as inf:
         config = yaml.load(inf, yaml.Loader)
+    return derive_config(config)
+
+
+def derive_config(config):
+    """Fills in the entries of config that are derived from others and aren't set, like KINGDOM_SIZE from KINGDOM_SIZE_LIST."""
     buffer = {}
     for k,v in config.items():  # We should compute the sizes of the templates here rather than making the user do it.
         if "SIZE_LIST" in k:
@@ -1265,28 +1410,64 @@ if __name__ == "__main__":
     config["n_y"] = config.get("n_y", 65)
     config["max_x"] = config.get("max_x", config.get("box_width", 10)*(config["n_x"]*3-3))
     config["max_y"] = config.get("max_y", config.get("box_height", 17)*(config["n_y"]*2-2))
+    return config
+
 
-    continents, pid_from_cube, land_cube_from_pid, rid_from_pid, srid_from_pid, cont_from_pid, terr_from_cube, terr_from_pid, type_from_pid, base_from_vertex, mask_from_vertex, land_height_from_cube, water_depth_from_cube, region_trees, pid_from_title, name_from_pid, name_from_rid, name_from_srid, impassable, river_flow_from_edge, river_sources, river_merges, river_max_flow, straits, locs_from_rid, coast_from_rid, coast_from_cube, tag_from_pid, sea_region, ow_nx, ow_ny, ow_max_x, ow_max_y = create_data(config)
-    cultures, religions = assemble_culrels(region_trees=region_trees)  # Not obvious this should be here instead of just derived later?
-    rgb_from_pid = create_landed_colors(pid_from_cube, {k for k,v in terr_from_cube.items() if v != BaseTerrain.ocean})
+@timed()
+def create_world(config):
+    """Runs create_data and the game-agnostic steps after it, returning a dict from field name to data.
+    This is everything the exporters need, and is what world_io saves and loads."""
+    world = dict(zip(DATA_FIELDS, create_data(config)))
+    rgb_from_pid = create_landed_colors(world["pid_from_cube"], {k for k,v in world["terr_from_cube"].items() if v != BaseTerrain.ocean})
     rgb_from_pid[max(rgb_from_pid.keys())+1] = (1,1,1)
-    pids_from_rid = {}
-    for pid, rid in sorted(rid_from_pid.items()):
-        if rid in pids_from_rid:
-            pids_from_rid[rid].append(pid)
-        else:
-            pids_from_rid[rid] = [pid]
     pids_from_srid = {}
-    for pid, rid in sorted(srid_from_pid.items()):
+    for pid, rid in sorted(world["srid_from_pid"].items()):
         if rid in pids_from_srid:
             pids_from_srid[rid].append(pid)
         else:
             pids_from_srid[rid] = [pid]
-    rid_from_cube = {k: rid_from_pid[pid_from_cube[k]] for k in land_cube_from_pid.values()}
-    supply_nodes, railways = create_supply_rails(terr_from_cube, pids_from_rid, rid_from_cube, land_cube_from_pid, pid_from_cube, name_from_rid,)
+    rid_from_cube = {k: world["rid_from_pid"][world["pid_from_cube"][k]] for k in world["land_cube_from_pid"].values()}
+    supply_nodes, railways = create_supply_rails(world["terr_from_cube"], world["pids_from_rid"], rid_from_cube, world["land_cube_from_pid"], world["pid_from_cube"], world["name_from_rid"])
+    world.update(rgb_from_pid=rgb_from_pid, pids_from_srid=pids_from_srid, supply_nodes=supply_nodes, railways=railways)
+    return world
+
+
+def export_ck3(config, world):
+    """Writes the CK3 mod for world to config["MOD_OUTPUTS"]["CK3"]."""
+    cultures, religions = assemble_culrels(region_trees=world["region_trees"])  # Not obvious this should be here instead of just derived later?
+    ck3.create_mod(
+        file_dir=config["MOD_OUTPUTS"]["CK3"],
+        config=config,
+        cultures=cultures,
+        religions=religions,
+        **{field: world[field] for field in ["pid_from_cube", "cubes_from_pid", "terr_from_cube", "terr_from_pid", "rgb_from_pid", "base_from_vertex", "mask_from_vertex", "pid_from_title", "name_from_pid", "region_trees", "impassable", "river_flow_from_edge", "river_sources", "river_merges", "river_max_flow", "straits", "sea_region", "ow_nx", "ow_ny", "ow_max_x", "ow_max_y"]},
+    )
+
+
+def export_eu4(config, world):
+    """Writes the EU4 mod for world to config["MOD_OUTPUTS"]["EU4"]."""
+    eu4.create_mod(
+        file_dir=config["MOD_OUTPUTS"]["EU4"],
+        config=config,
+        gov_from_tag={},
+        cont_names=["europe", "asia", "africa", "north_america", "south_america", "oceania",],
+        **{field: world[field] for field in ["region_trees", "rgb_from_pid", "name_from_pid", "pids_from_rid", "name_from_rid", "pid_from_cube", "terr_from_cube", "base_from_vertex", "mask_from_vertex", "river_flow_from_edge", "river_sources", "river_merges", "river_max_flow", "srid_from_pid", "name_from_srid", "cont_from_pid"]},
+    )
+
+
+def export_v3(config, world):
+    """Writes the V3 mod for world to config["MOD_OUTPUTS"]["V3"]."""
+    v3.create_mod(
+        file_dir=config["MOD_OUTPUTS"]["V3"],
+        config=config,
+        **{field: world[field] for field in ["pid_from_cube", "cubes_from_pid", "rid_from_pid", "pids_from_rid", "terr_from_cube", "terr_from_pid", "rgb_from_pid", "base_from_vertex", "mask_from_vertex", "river_flow_from_edge", "river_sources", "river_merges", "river_max_flow", "locs_from_rid", "coast_from_rid", "name_from_rid", "region_trees", "tag_from_pid", "straits"]},
+    )
+
+
+def export_hoi4(config, world):
+    """Writes the HOI4 mod for world to config["MOD_OUTPUTS"]["HOI4"]."""
     weather_periods_from_srid = {}
-    cont_names = ["europe", "asia", "africa", "north_america", "south_america", "oceania",]
-    for srid in name_from_srid.keys():
+    for srid in world["name_from_srid"].keys():
         weather_periods_from_srid[srid] = [{
             "between": "{ 0.0 30.11}",
             "temperature": "{ 1.0 6.0 }",
@@ -1300,107 +1481,112 @@ if __name__ == "__main__":
             "sandstorm": "0.000",
             "min_snow_level": "0.000",
         }]
-    naval_from_srid = {}
-    if "CK3" in config["MOD_OUTPUTS"]:
-        ck3.create_mod(
-            file_dir=config["MOD_OUTPUTS"]["CK3"],
-            config=config,
-            pid_from_cube=pid_from_cube,
-            terr_from_cube=terr_from_cube,
-            terr_from_pid=terr_from_pid,
-            rgb_from_pid=rgb_from_pid,
-            base_from_vertex=base_from_vertex,
-            mask_from_vertex=mask_from_vertex,
-            pid_from_title=pid_from_title,
-            name_from_pid=name_from_pid,
-            region_trees=region_trees,
-            cultures=cultures,
-            religions=religions,
-            impassable=impassable,
-            river_flow_from_edge=river_flow_from_edge,
-            river_sources=river_sources, 
-            river_merges=river_merges,
-            river_max_flow=river_max_flow,
-            straits=straits,
-            sea_region=sea_region,
-            ow_nx=ow_nx,
-            ow_ny=ow_ny,
-            ow_max_x=ow_max_x,
-            ow_max_y=ow_max_y,
-        )
-    if "EU4" in config["MOD_OUTPUTS"]:
-        eu4.create_mod(
-            file_dir=config["MOD_OUTPUTS"]["EU4"],
-            config=config,
-            region_trees=region_trees,
-            rgb_from_pid=rgb_from_pid,
-            name_from_pid=name_from_pid,
-            pids_from_rid=pids_from_rid,
-            name_from_rid=name_from_rid,
-            pid_from_cube=pid_from_cube,
-            terr_from_cube=terr_from_cube,
-            gov_from_tag={},
-            base_from_vertex=base_from_vertex,
-            mask_from_vertex=mask_from_vertex,
-            river_flow_from_edge=river_flow_from_edge,
-            river_sources=river_sources, 
-            river_merges=river_merges,
-            river_max_flow=river_max_flow,
-            srid_from_pid=srid_from_pid,
-            name_from_srid=name_from_srid,
-            cont_names=cont_names,
-            cont_from_pid=cont_from_pid,
-        )
-    if "V3" in config["MOD_OUTPUTS"]:
-        v3.create_mod(
-            file_dir=config["MOD_OUTPUTS"]["V3"],
-            config=config,
-            pid_from_cube=pid_from_cube,
-            rid_from_pid=rid_from_pid,
-            pids_from_rid=pids_from_rid,
-            terr_from_cube=terr_from_cube,
-            terr_from_pid=terr_from_pid,
-            rgb_from_pid=rgb_from_pid,
-            base_from_vertex=base_from_vertex,
-            mask_from_vertex=mask_from_vertex,
-            river_flow_from_edge=river_flow_from_edge,
-            river_sources=river_sources, 
-            river_merges=river_merges,
-            river_max_flow=river_max_flow,
-            locs_from_rid=locs_from_rid,
-            coast_from_rid=coast_from_rid,
-            name_from_rid=name_from_rid,
-            region_trees=region_trees,
-            tag_from_pid=tag_from_pid,
-            straits=straits,
-        )
-    if "HOI4" in config["MOD_OUTPUTS"]:
-        hoi4.create_mod(
-            file_dir=config["MOD_OUTPUTS"]["HOI4"],
-            config=config,
-            pid_from_cube=pid_from_cube,
-            rgb_from_pid=rgb_from_pid,
-            terr_from_cube=terr_from_cube,
-            terr_from_pid=terr_from_pid,
-            rid_from_pid=rid_from_pid,
-            tag_from_pid=tag_from_pid,
-            type_from_pid=type_from_pid,
-            cont_from_pid=cont_from_pid,
-            coast_from_cube=coast_from_cube,
-            name_from_rid=name_from_rid,
-            pids_from_rid=pids_from_rid,
-            river_flow_from_edge=river_flow_from_edge,
-            river_sources=river_sources, 
-            river_merges=river_merges,
-            river_max_flow=river_max_flow,
-            locs_from_rid=locs_from_rid,
-            base_from_vertex=base_from_vertex,
-            mask_from_vertex=mask_from_vertex,
-            region_trees=region_trees,
-            supply_nodes=supply_nodes,
-            railways=railways,
-            pids_from_srid=pids_from_srid,
-            name_from_srid=name_from_srid,
-            weather_periods_from_srid=weather_periods_from_srid,
-            naval_from_srid=naval_from_srid,
-        )
+    hoi4.create_mod(
+        file_dir=config["MOD_OUTPUTS"]["HOI4"],
+        config=config,
+        weather_periods_from_srid=weather_periods_from_srid,
+        naval_from_srid={},
+        **{field: world[field] for field in ["pid_from_cube", "rgb_from_pid", "terr_from_cube", "terr_from_pid", "rid_from_pid", "tag_from_pid", "type_from_pid", "cont_from_pid", "coast_from_cube", "name_from_rid", "pids_from_rid", "river_flow_from_edge", "river_sources", "river_merges", "river_max_flow", "locs_from_rid", "base_from_vertex", "mask_from_vertex", "region_trees", "supply_nodes", "railways", "pids_from_srid", "name_from_srid"]},
+    )
+
+
+EXPORTERS = {"CK3": export_ck3, "EU4": export_eu4, "V3": export_v3, "HOI4": export_hoi4}
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far, in MB, or None where the resource module isn't available (Windows)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":  # bytes on macOS, kilobytes elsewhere
+        return peak / 2**20
+    return peak / 2**10
+
+
+def run_exporter(game, config, world, parallel=False):
+    """Runs the exporter for game with random seeded from the config seed and game, so a mod comes out the same
+    whichever other games are exported and in whatever order. Files are written through mod_writer, so those that come
+    out the same as in the last export aren't rewritten. parallel says the other games are being exported alongside
+    this one, in processes of their own. Returns (wall time in seconds, peak RSS in MB)."""
+    start_time = time.time()
+    clausewitz.cache_dir = config.get("PARSE_CACHE_DIR", os.path.join("cache", "scripts"))
+    # With the games exported in parallel, the CPUs are already taken, so by default each strips in its own process.
+    stripper.workers = config.get("STRIP_WORKERS") or (1 if parallel else os.cpu_count() or 1)
+    mod_writer.image_workers = config.get("IMAGE_WORKERS", 4)
+    random.seed(f"{config.get('seed', 1945)}-{game}")
+    np.random.seed(random.Random(f"{config.get('seed', 1945)}-{game}").getrandbits(32))  # for the heightmap noise
+    try:
+        with span(f"export.{game}"), mod_writer.export(config["MOD_OUTPUTS"][game], f"{game}.{config.get('MOD_NAME', 'testmod')}"):
+            EXPORTERS[game](config, world)
+    finally:
+        stripper.shutdown()
+    return time.time() - start_time, peak_rss_mb()
+
+
+def export_worker(game, config, world_dir, memory=False):
+    """Process pool entry point: opens the saved world read-only and exports game from it.
+    Returns run_exporter's stats along with this process's timing spans, so they can be merged into the parent's."""
+    trace_memory(memory)
+    stats = run_exporter(game, config, load_world(world_dir), parallel=True)
+    profiling.dump()  # Pool workers exit without running atexit.
+    return stats, report()
+
+
+def export_mods(config, world, world_dir=None, parallel=True, memory=False):
+    """Writes every game in config["MOD_OUTPUTS"] from world. With parallel, each game gets its own process, which reads
+    the world from world_dir (saving it to a temporary directory first if world_dir is None); the total time should then
+    be close to the slowest exporter rather than the sum. memory turns on tracemalloc in the workers, see timing.trace_memory.
+    Returns a dict from game to (wall time, peak RSS)."""
+    games = [game for game in EXPORTERS if game in config["MOD_OUTPUTS"]]
+    start_time = time.time()
+    stats_from_game = {}
+    if not parallel or len(games) <= 1:
+        for game in games:
+            stats_from_game[game] = run_exporter(game, config, world)
+    else:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            if world_dir is None:
+                world_dir = temp_dir
+                save_world(world_dir, world)
+            # Spawned, one task per process, so each worker's peak RSS is just its own exporter's.
+            with ProcessPoolExecutor(max_workers=len(games), mp_context=multiprocessing.get_context("spawn"), max_tasks_per_child=1) as executor:
+                future_from_game = {game: executor.submit(export_worker, game, config, world_dir, memory) for game in games}
+                for game, future in future_from_game.items():
+                    try:
+                        stats_from_game[game], spans = future.result()
+                        merge(spans)
+                    except Exception:
+                        print(f"{game} export failed")
+                        raise
+    for game, (wall_time, peak_rss) in stats_from_game.items():
+        print(f"{game} exported in {wall_time:.1f}s, peak RSS", "unknown" if peak_rss is None else f"{peak_rss:.0f} MB")
+    print("All mods exported; time elapsed:", time.time()-start_time)
+    return stats_from_game
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates a world and writes a mod for each game in the config's MOD_OUTPUTS.")
+    parser.add_argument("--config", default="config.yml", help="Config file to use.")
+    parser.add_argument("--save-world", help="Directory to save the generated world to, so it can be exported again later with --world.")
+    parser.add_argument("--world", help="Directory of a saved world to export, instead of generating a new one.")
+    parser.add_argument("--serial", action="store_true", help="Export the games one after another in this process, instead of in parallel.")
+    parser.add_argument("--timing-report", help="Write the wall time and call count of each timed span to this JSON file.")
+    parser.add_argument("--trace-memory", action="store_true", help="Also record the peak traced memory of each span (slow).")
+    parser.add_argument("--profile", help="Comma-separated timing spans to run under cProfile, like arrange_inner_sea,ck3.create_mod; see profiling.py.")
+    parser.add_argument("--profile-dir", default="profiles", help="Directory for the .pstats (and .collapsed) files from --profile.")
+    parser.add_argument("--profile-stacks", type=float, help="Also sample profiled spans every this many milliseconds into collapsed stacks for flamegraphs.")
+    args = parser.parse_args()
+    start_time = time.time()
+    trace_memory(args.trace_memory)
+    if args.profile is not None:
+        profiling.configure(args.profile.split(","), args.profile_dir, args.profile_stacks)
+    config = load_config(args.config)
+    if args.world is not None:
+        world = load_world(args.world)
+    else:
+        world = create_world(config)
+        if args.save_world is not None:
+            save_world(args.save_world, world)
+    export_mods(config, world, world_dir=args.world or args.save_world, parallel=not args.serial, memory=args.trace_memory)
+    if args.timing_report is not None:
+        write_report(args.timing_report, config=args.config, seed=config.get("seed"), world=args.world, total_wall=time.time()-start_time)
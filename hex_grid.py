@@ -0,0 +1,41 @@
+import numpy as np
+
+from cube import Cube
+
+# Straits are two sea cubes, k+a and k+b, with land at both ends, k and k+a+b. These are a and b for each of the six rotations.
+STRAIT_OFFSETS = [(Cube(1,-1, 0).rotate_right(rot), Cube(1, 0,-1).rotate_right(rot)) for rot in range(6)]
+
+
+def mask_from_cubes(cubes, pad=0):
+    """Returns a boolean array indexed by [x - x0, y - y0] that is True for the cubes in cubes, and (x0, y0).
+    pad adds that many False cells on every side, so shifted views up to pad away stay in bounds."""
+    xs = np.fromiter((k.x for k in cubes), dtype=np.int64, count=len(cubes))
+    ys = np.fromiter((k.y for k in cubes), dtype=np.int64, count=len(cubes))
+    x0 = xs.min() - pad
+    y0 = ys.min() - pad
+    mask = np.zeros((xs.max() - x0 + pad + 1, ys.max() - y0 + pad + 1), dtype=bool)
+    mask[xs - x0, ys - y0] = True
+    return mask, (int(x0), int(y0))
+
+
+def find_straits(land_cubes):
+    """Finds every strait in land_cubes, as a list of (k, other_land, sea_1, sea_2), matching Cube.valid_straits.
+    Sorted by k's x, then y, then rotation, so that the order doesn't depend on set iteration."""
+    if len(land_cubes) == 0:
+        return []
+    land, (x0, y0) = mask_from_cubes(land_cubes, pad=2)
+    n_x, n_y = land.shape[0] - 4, land.shape[1] - 4
+
+    def shifted(offset):
+        """land at k+offset, for every k in the unpadded window."""
+        return land[2+offset.x:2+offset.x+n_x, 2+offset.y:2+offset.y+n_y]
+
+    here = shifted(Cube(0,0,0))
+    hits = np.stack([here & ~shifted(a) & ~shifted(b) & shifted(a.add(b)) for a, b in STRAIT_OFFSETS], axis=-1)
+    straits = []
+    for i, j, rot in zip(*np.nonzero(hits)):
+        x, y = int(i) + 2 + x0, int(j) + 2 + y0
+        k = Cube(x, y, -x-y)
+        a, b = STRAIT_OFFSETS[rot]
+        straits.append((k, k.add(a).add(b), k.add(a), k.add(b)))
+    return straits
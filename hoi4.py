@@ -1,11 +1,13 @@
 import os
 import random
-import shutil
 
 from basic_map import BasicMap
+import clausewitz
 from map_io import *
+import mod_writer
 from stripper import create_blanks, strip_base_files
 from terrain import *
+from timing import timed
 
 TERR_NAMES = {
     BaseTerrain.plains: "plains",
@@ -38,29 +40,32 @@ class HOI4Map(BasicMap):
         """Creates a map of size max_x * max_y, which is n_x hexes wide and n_y hexes tall."""
         super().__init__(file_dir, "map", max_x, max_y, n_x, n_y)
 
+    @timed()
     def create_provinces(self, rgb_from_pid, pid_from_cube, coastal, cont_from_pid, terr_from_pid, type_from_pid):
         """Creates provinces.png and definition.csv"""
         # This doesn't use the superclass create_provinces and prov_extra because we need to modify the create_hex_map call, and also flip the image.
         rgb_from_ijk = {k.tuple(): rgb_from_pid[pid] for k, pid in pid_from_cube.items()}
         # TODO: fix four-corner joins by painting with rgb_from_vertex? Need to test it to figure out how to use it correctly on map edge.
-        create_hex_map(rgb_from_ijk=rgb_from_ijk, max_x=self.max_x, max_y=self.max_y, mode='RGB', default="black", n_x=self.n_x, n_y=self.n_y, four_corners=True).save(os.path.join(self.file_dir, "map", "provinces.bmp"))  # .transpose(PIL.Image.FLIP_TOP_BOTTOM)
-        with open(os.path.join(self.file_dir, "map", "definition.csv"), 'w') as outf:
+        mod_writer.save_image(create_hex_map(rgb_from_ijk=rgb_from_ijk, max_x=self.max_x, max_y=self.max_y, mode='RGB', default="black", n_x=self.n_x, n_y=self.n_y, four_corners=True), os.path.join(self.file_dir, "map", "provinces.bmp"))  # .transpose(PIL.Image.FLIP_TOP_BOTTOM)
+        with mod_writer.open(os.path.join(self.file_dir, "map", "definition.csv"), 'w') as outf:
             outf.write("0;0;0;0;land;false;unknown;0\n")
             for pid, rgb in sorted(rgb_from_pid.items()):
                 r,g,b = rgb
                 coast = "true" if pid in coastal else "false"
                 outf.write(";".join([str(x) for x in [pid,r,g,b,type_from_pid[pid], coast, TERR_NAMES[terr_from_pid[pid]], cont_from_pid.get(pid,0)]])+"\n")
     
+    @timed()
     def create_terrain(self, terr_from_cube, base_loc, file_ext):
         """Creates terrain.bmp"""
         rgb_from_ijk = {k.tuple(): COLOR_FROM_TERR[terr] for k, terr in terr_from_cube.items()}
-        create_hex_map(rgb_from_ijk=rgb_from_ijk, max_x=self.max_x, max_y=self.max_y, mode='P', palette=get_palette(os.path.join(base_loc, self.map_dir, "terrain"+file_ext)), default=254, n_x=self.n_x, n_y=self.n_y).save(os.path.join(self.file_dir, self.map_dir, "terrain"+file_ext))
+        mod_writer.save_image(self.paint_hexes(rgb_from_ijk, mode='P', default=254, palette=get_palette(os.path.join(base_loc, self.map_dir, "terrain"+file_ext))), os.path.join(self.file_dir, self.map_dir, "terrain"+file_ext))
 
+    @timed()
     def create_buildings(self, file_dir, pids_from_rid, coastal):
         """Creates the buildings.txt file, which has x,y locations for lots of buildings.
         pids_from_rid is a mapping of all pids associated with a rid. TODO: restrict to land or check for land before outputting buildings.
         coastal is a mapping from pids to water ids."""
-        with open(os.path.join(file_dir, "map", "buildings.txt"), 'w', encoding="utf-8") as outf:
+        with mod_writer.open(os.path.join(file_dir, "map", "buildings.txt"), 'w', encoding="utf-8") as outf:
             for rid, pids in pids_from_rid.items():
                 for bname, bnum in [("arms_factory", 6), ("industrial_complex", 6), ("anti_air_building", 3), ("air_base", 1), ("synthetic_refinery", 1), ("nuclear_reactor", 1), ("fuel_silo", 1), ("rocket_site", 1)]:
                     for _ in range(bnum):
@@ -113,19 +118,19 @@ def create_dot_mod(file_dir, mod_name, mod_disp_name):
         ]
     shared += "replace_path = \"" + "\"\nreplace_path = \"".join(replace_paths)+"\""
     os.makedirs(os.path.join(file_dir, mod_name), exist_ok=True)
-    with open(os.path.join(file_dir,"{}.mod".format(mod_name)),'w') as f:
+    with mod_writer.open(os.path.join(file_dir,"{}.mod".format(mod_name)),'w') as f:
         f.write(shared + outer)
-    with open(os.path.join(file_dir, mod_name, "descriptor.mod".format(mod_name)),'w') as f:
+    with mod_writer.open(os.path.join(file_dir, mod_name, "descriptor.mod".format(mod_name)),'w') as f:
         f.write(shared)
     return os.path.join(file_dir, mod_name)
 
 
 def create_adjacencies(file_dir):
     # TODO: Actually write out adjacencies
-    with open(os.path.join(file_dir, "map", "adjacencies.csv"), 'w', encoding="utf-8") as outf:
+    with mod_writer.open(os.path.join(file_dir, "map", "adjacencies.csv"), 'w', encoding="utf-8") as outf:
         outf.write("From;To;Type;Through;start_x;start_y;stop_x;stop_y;adjacency_rule_name;Comment\n")
         outf.write("-1;-1;;-1;-1;-1;-1;-1;-1")
-    with open(os.path.join(file_dir, "map", "adjacency_rules.txt"), 'w', encoding="utf-8") as outf:
+    with mod_writer.open(os.path.join(file_dir, "map", "adjacency_rules.txt"), 'w', encoding="utf-8") as outf:
         outf.write("\n")
 
 
@@ -138,10 +143,10 @@ def create_countries(file_dir, config, region_trees, tech_from_tag, popularities
     for region_tree in region_trees:
         for region in region_tree.all_region_trees():
             if region.tag is not None and region.capital_rid != -1:
-                with open(os.path.join(file_dir, "common", "countries", f"{region.title}.txt"), 'w', encoding="utf-8") as outf:
+                with mod_writer.open(os.path.join(file_dir, "common", "countries", f"{region.title}.txt"), 'w', encoding="utf-8") as outf:
                     outf.write(f"graphical_culture = western_european_gfx\ngraphical_culture_2d = western_european_2d\n\ncolor = {{ {' '.join(region.color)} }}")
                 country_tag_buffer += f"{region.tag} = \"countries/{region.title}.txt\"\n"
-                with open(os.path.join(file_dir, "history", "countries", f"{region.tag}-{region.title}.txt"), 'w', encoding="utf-8") as outf:
+                with mod_writer.open(os.path.join(file_dir, "history", "countries", f"{region.tag}-{region.title}.txt"), 'w', encoding="utf-8") as outf:
                     outf.write(f"capital = {region.capital_pid}\nset_oob = \"{region.tag}_1936\"\n\nstarting_train_buffer = 2\nset_technology = {{\n")
                     outf.write("\n".join([f"\t{name} = 1" for name in tech_from_tag[region.tag]]))
                     outf.write("\n}}\nset_research_slots = 3\nset_convoys = 300\n\n")
@@ -149,16 +154,17 @@ def create_countries(file_dir, config, region_trees, tech_from_tag, popularities
                     outf.write("set_popolarities = {\n" + "\n".join([f"\t{name} = {value}" for name, value in popularities_from_tag.get(region.tag, {"democratic": 64, "fascism": 1, "neutrality": 15, "communism": 20}).items()]) + "\n}\n")
                     if len(chars_from_tag.get(region.tag, [])) > 0:
                         outf.write("\n".join(["recruit_character = {char}" for char in chars_from_tag[region.tag]]))
-    with open(os.path.join(file_dir, "common", "country_tags", "02_country_tags.txt"), 'w', encoding="utf-8") as outf:
+    with mod_writer.open(os.path.join(file_dir, "common", "country_tags", "02_country_tags.txt"), 'w', encoding="utf-8") as outf:
         outf.write(country_tag_buffer)
     assert max_dnum < 100  # We _could_ use additional letters to get more than 100, but... why
-    with open(os.path.join(file_dir, "common", "country_tags", "zz_dynamic_tags.txt"), 'w', encoding="utf-8") as outf:
+    with mod_writer.open(os.path.join(file_dir, "common", "country_tags", "zz_dynamic_tags.txt"), 'w', encoding="utf-8") as outf:
         outf.write("dynamic_tags = yes\n" + "\n".join(["D" + str(dnum).rjust(2,"0") + " = \"countries/D" + str(dnum).rjust(2,"0") +".txt\"" for dnum in range(1,max_dnum + 1)]) + "\n")
     for dnum in range(1, max_dnum + 1):
-        with open(os.path.join(file_dir, "common", "countries", "D"+str(dnum).rjust(2,"0")+".txt"), 'w', encoding="utf-8") as outf:
+        with mod_writer.open(os.path.join(file_dir, "common", "countries", "D"+str(dnum).rjust(2,"0")+".txt"), 'w', encoding="utf-8") as outf:
             outf.write("color = { " + " ".join([str(random.randint(0,255)) for _ in range(3)]) +"}\n")  # Maybe this should copy the vanilla ones instead? They probably have better color choices.
     
 
+@timed()
 def create_states(file_dir, config, pids_from_rid, name_from_rid, manpower_from_rid, category_from_rid, tag_from_rid, cores_from_rid, vps_from_rid, buildings_from_rid,):
     """Creates history/states"""
     os.makedirs(os.path.join(file_dir, "history", "states"), exist_ok=True)
@@ -166,7 +172,7 @@ def create_states(file_dir, config, pids_from_rid, name_from_rid, manpower_from_
     for rid, pids in pids_from_rid.items():
         if name_from_rid[rid][0] == "s":
             continue
-        with open(os.path.join(file_dir, "history", "states", f"{rid}-{name_from_rid[rid]}.txt"),'w', encoding="utf-8") as outf:
+        with mod_writer.open(os.path.join(file_dir, "history", "states", f"{rid}-{name_from_rid[rid]}.txt"),'w', encoding="utf-8") as outf:
             outf.write(f"state={{\n\tid={rid}\n\tname=\"{name_from_rid[rid]}\"\n\tmanpower = {manpower_from_rid[rid]}\n\n\tstate_category = {category_from_rid[rid]}\n\n\thistory={{\n\t\towner = {tag_from_rid[rid]}\n")
             outf.write("\n".join([f"\t\tvictory_points = {{ {pid} {vp} }} " for pid, vp in vps_from_rid[rid].items()]))
             outf.write("\n\t\tbuildings = {\n")
@@ -183,12 +189,13 @@ def create_states(file_dir, config, pids_from_rid, name_from_rid, manpower_from_
             outf.write(f"\t}}\n\n\tlocal_supplies=0.0\n}}\n")
 
 
+@timed()
 def create_strategic_regions(file_dir, pids_from_srid, name_from_srid, weather_periods_from_srid, naval_from_srid={}):
     """Creates map/strategicregions"""
     os.makedirs(os.path.join(file_dir, "map", "strategicregions"), exist_ok=True)
     weather_pos_buffer = ""
     for srid, sname in name_from_srid.items():
-        with open(os.path.join(file_dir, "map", "strategicregions", f"{srid}-{sname}.txt"), 'w', encoding="utf-8") as outf:
+        with mod_writer.open(os.path.join(file_dir, "map", "strategicregions", f"{srid}-{sname}.txt"), 'w', encoding="utf-8") as outf:
             outf.write(f"strategic_region={{\n\tid={srid}\n\tname=\"STRATEGIC_REGION{srid}\"\n\tprovinces={{\n\t\t")
             outf.write(" ".join(str(pid) for pid in pids_from_srid[srid]))
             outf.write(f"\n\t}}\n")
@@ -200,33 +207,29 @@ def create_strategic_regions(file_dir, pids_from_srid, name_from_srid, weather_p
             outf.write("\t}\n}\n")
         # TODO: locate weather correctly
         weather_pos_buffer += f"{srid};1000.0;10.0;1000.0;small\n{srid};1000.0;10.0;1000.0;big\n"
-    with open(os.path.join(file_dir, "map", "weatherpositions.txt"), 'w', encoding="utf-8") as outf:
+    with mod_writer.open(os.path.join(file_dir, "map", "weatherpositions.txt"), 'w', encoding="utf-8") as outf:
         outf.write(weather_pos_buffer)
 
 
+@timed()
 def create_minimal(file_dir, base_loc, filenames_from_dirs):
     """For each filename in each directory in filenames_from_dirs, copy over just the first section from that file."""
     # TODO: Make there some sort of mapping so that we can assign the historical graphics to particular countries. Maybe this will need to handle different files separately.
     for dir, file_names in filenames_from_dirs:
         os.makedirs(os.path.join(file_dir, *dir), exist_ok=True)
         for file_name in file_names:
-            with open(os.path.join(base_loc, *dir, file_name), encoding="utf-8") as inf:
-                with open(os.path.join(file_dir, *dir, file_name), 'w', encoding="utf-8") as outf:
-                    brackets = 0
-                    for line in inf.readlines():
-                        brackets += line.count("{")
-                        outf.write(line)
-                        brackets -= line.count("}")
-                        if brackets == 0:
-                            break
+            script = clausewitz.read(os.path.join(base_loc, *dir, file_name))
+            end = script.blocks[0].line_end if len(script.blocks) > 0 else len(script.data)
+            with mod_writer.open(os.path.join(file_dir, *dir, file_name), 'w', encoding="utf-8") as outf:
+                outf.write(script.text(0, end))
 
 
 def create_rail_supplies(file_dir, supply_nodes, railways):
     """Creates map/supply_nodes.txt and map/railways.txt"""
-    with open(os.path.join(file_dir, "map", "supply_nodes.txt"), 'w', encoding="utf-8") as outf:
+    with mod_writer.open(os.path.join(file_dir, "map", "supply_nodes.txt"), 'w', encoding="utf-8") as outf:
         for pid in supply_nodes:
             outf.write(f"1 {pid}\n")
-    with open(os.path.join(file_dir, "map", "railways.txt"), 'w', encoding="utf-8") as outf:
+    with mod_writer.open(os.path.join(file_dir, "map", "railways.txt"), 'w', encoding="utf-8") as outf:
         for level, path in railways:
             outf.write(str(level) + " " + str(len(path)) + " " + " ".join(str(pid) for pid in path) + "\n")
 
@@ -241,11 +244,12 @@ def create_flags(file_dir, base_dir, tag_mapping, tags):
         for gov_type in gov_types:
             for dirs in [["flags"], ["flags", "medium"], ["flags", "small"]]:
                 try:
-                    shutil.copy(os.path.join(base_dir, "gfx", *dirs, vanilla_tag+"_"+gov_type+".tga"), os.path.join(file_dir, "gfx", *dirs, tag+"_"+gov_type+".tga"))
+                    mod_writer.copy(os.path.join(base_dir, "gfx", *dirs, vanilla_tag+"_"+gov_type+".tga"), os.path.join(file_dir, "gfx", *dirs, tag+"_"+gov_type+".tga"))
                 except:
                     continue
 
 
+@timed()
 def create_mod(file_dir, config, pid_from_cube, rgb_from_pid, terr_from_cube, terr_from_pid, rid_from_pid, tag_from_pid, type_from_pid, cont_from_pid, coast_from_cube, pids_from_rid, name_from_rid, river_flow_from_edge, river_sources, river_merges, river_max_flow, locs_from_rid, base_from_vertex, mask_from_vertex, region_trees, supply_nodes, railways, pids_from_srid, name_from_srid, weather_periods_from_srid, naval_from_srid,):
     """Creates the HOI4 mod files in file_dir, given the basic data."""
     # Make the basic filestructure that other things go in.
@@ -1,10 +1,13 @@
 # This file is for map-rendering code / file-IO that's game-independent.
 from math import sqrt
 
+import numpy as np
 import perlin_numpy
 import PIL.Image
+import PIL.ImageColor
 
 from cube import Cube, Edge, Vertex
+from timing import timed
 
 # rivers values
 LAND_COLOR = 255
@@ -53,6 +56,7 @@ def subset_from_minmax(min_x, max_x, min_y, max_y):
     """Returns the valid cubes between min_x and max_x / min_y and max_y, inclusive."""
     pass
 
+@timed()
 def create_hex_map(rgb_from_ijk, max_x, max_y, n_x, n_y, rgb_from_edge={}, rgb_from_vertex={}, mode='RGB', default="black", palette=None, four_corners=False):
     """Draw a hex map with size (max_x,max_y) with colors from rgb_from_ijk, rgb_from_vertex, and rgb_from_edge. mode determines the image type, and also the correct format for rgb (which should be shared by everything).
     There will be n_x hexes horizontally and n_y hexes vertically.
@@ -241,6 +245,7 @@ def calc_bary(box_width, box_height):
     return bary_up, bary_down
 
 
+@timed()
 def create_tri_map(height_from_vertex, max_x, max_y, n_x, n_y, mode='L', default="black", palette=None):
     """Creates a map out of triangular patches, each defined by three adjacent vertices in height_from_vertex."""
     box_width, box_height = box_from_max(max_x, max_y, n_x, n_y)
@@ -273,6 +278,38 @@ def create_tri_map(height_from_vertex, max_x, max_y, n_x, n_y, mode='L', default
     return img
 
 
+@timed()
+def create_label_map(label_from_ijk, max_x, max_y, n_x, n_y):
+    """Draws each hex in label_from_ijk with its label (a positive int), and 0 where there's no hex, into a max_y by
+    max_x array (uint16 if the labels fit). Looking colors up from it (see paint_labels) gives the same image
+    create_hex_map would draw, so every image of the same hexes at the same size only needs this one slow draw."""
+    labels = np.asarray(create_hex_map(rgb_from_ijk=label_from_ijk, max_x=max_x, max_y=max_y, n_x=n_x, n_y=n_y, mode='I', default=0))
+    return labels.astype(np.uint16) if max(label_from_ijk.values(), default=0) < 2**16 else labels
+
+
+def lookup_labels(labels, label_from_ijk, value_from_ijk, default=0, dtype=np.uint8):
+    """The array of value_from_ijk for the hex each pixel of labels (from create_label_map with label_from_ijk) is in,
+    and default outside them. Values can be ints or tuples (for an extra axis of channels)."""
+    lut = np.array([default] * (max(label_from_ijk.values()) + 1), dtype=dtype)
+    for ijk, value in value_from_ijk.items():
+        if ijk not in label_from_ijk:
+            print(ijk, value, "out of bounds!")
+            continue
+        lut[label_from_ijk[ijk]] = value
+    return lut[labels]
+
+
+def paint_labels(labels, label_from_ijk, rgb_from_ijk, mode='RGB', default="black", palette=None):
+    """The image create_hex_map(rgb_from_ijk, ..., mode=mode, default=default, palette=palette) would draw at the size of labels."""
+    if isinstance(default, str):
+        default = PIL.ImageColor.getcolor(default, mode)
+    img = PIL.Image.fromarray(lookup_labels(labels, label_from_ijk, rgb_from_ijk, default), mode)
+    if palette is not None:
+        img.putpalette(palette)
+    return img
+
+
+@timed()
 def create_noise_map(base_from_vertex, mask_from_vertex, max_x, max_y, n_x, n_y, mask_max, mode='L', default="black", palette=None):
     """Similar to create_tri_map but using mask_from_vertex to determine how much of a shared noise source to use.
     Ensure that mask_from_vertex has elements wherever base_from_vertex does."""
@@ -310,6 +347,7 @@ def create_noise_map(base_from_vertex, mask_from_vertex, max_x, max_y, n_x, n_y,
     return img
 
 
+@timed()
 def create_normal(heightmap):
     """Given heightmap (a PIL.Image), return an image that's the normal vector for heightmap."""
     max_x, max_y = heightmap.size
@@ -0,0 +1,187 @@
+"""Writes the exporters' files only where they changed. Inside export(root, name), files opened with open, images saved
+with save_image and files copied with copy are hashed as they're closed, and only written if they differ from what the
+last export under root left there (according to its manifest, root/.{name}.manifest.json), so regenerating a mod from
+the same world leaves most of the tree untouched and the game has less to reload. Files the last export wrote that this
+one didn't are removed. Images are encoded and written on image_workers threads (Pillow lets go of the GIL while
+encoding), and the export waits for them at the end, raising the first error. Outside of an export these are just the
+usual open, Image.save and shutil.copy."""
+import builtins
+import contextlib
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import PIL.Image
+
+# The export in progress in this process, or None to write straight to disk.
+session = None
+# Threads to save images on during an export; 0 saves them in the calling thread. Set from IMAGE_WORKERS by gen.run_exporter.
+image_workers = 4
+
+
+class Session:
+    """The files written under root in one export, and the manifest of the previous one."""
+
+    def __init__(self, root, name):
+        self.root = os.path.abspath(root)
+        self.manifest_path = os.path.join(self.root, f".{name}.manifest.json")
+        self.previous = {}
+        if os.path.exists(self.manifest_path):
+            with builtins.open(self.manifest_path, 'r', encoding='utf_8') as inf:
+                self.previous = json.load(inf)
+        self.entry_from_path = {}
+        self.bytes_written = 0
+        self.bytes_skipped = 0
+        self.files_written = 0
+        self.files_skipped = 0
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(image_workers) if image_workers > 0 else None
+        # Renders wait for one of these before handing an image over, so only a few are in memory at once.
+        self.slots = threading.BoundedSemaphore(image_workers + 1)
+        self.futures = []
+        # Encoded blank images, by (mode, size, color, format); the exporters save the same few to many files.
+        self.data_from_blank = {}
+
+    def commit(self, path, data):
+        """Writes data to path unless the manifest says it's already there, unchanged since the last export."""
+        path = os.path.abspath(path)
+        relpath = os.path.relpath(path, self.root).replace(os.sep, "/")
+        digest = hashlib.sha256(data).hexdigest()
+        previous = self.previous.get(relpath)
+        skip = previous is not None and previous[0] == digest and file_stat(path) == previous[1]
+        if not skip:
+            with builtins.open(path, 'wb') as outf:
+                outf.write(data)
+        with self.lock:  # Images are committed from the worker threads.
+            if skip:
+                self.bytes_skipped += len(data)
+                self.files_skipped += 1
+            else:
+                self.bytes_written += len(data)
+                self.files_written += 1
+            if not relpath.startswith(".."):
+                self.entry_from_path[relpath] = [digest, file_stat(path)]
+
+    def submit_image(self, image, path):
+        """Saves image to path on a worker thread, once there's a slot for it."""
+        self.slots.acquire()
+        future = self.executor.submit(encode_image, image, path)
+        future.add_done_callback(lambda _: self.slots.release())
+        self.futures.append(future)
+
+    def wait(self):
+        """Waits for the images submitted so far, raising the first error any of them had."""
+        futures, self.futures = self.futures, []
+        for future in futures:
+            future.result()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+    def finish(self):
+        """Removes the files only the previous export wrote, and saves this export's manifest."""
+        stale = sorted(self.previous.keys() - self.entry_from_path.keys())
+        for relpath in stale:
+            path = os.path.join(self.root, *relpath.split("/"))
+            if os.path.exists(path):
+                os.remove(path)
+            directory = os.path.dirname(path)
+            while directory != self.root and os.path.isdir(directory) and len(os.listdir(directory)) == 0:
+                os.rmdir(directory)
+                directory = os.path.dirname(directory)
+        os.makedirs(self.root, exist_ok=True)
+        with builtins.open(self.manifest_path, 'w', encoding='utf_8') as outf:
+            json.dump(self.entry_from_path, outf, indent=0, sort_keys=True)
+        print(f"Wrote {self.files_written} files ({self.bytes_written / 2**20:.1f} MB), skipped {self.files_skipped} unchanged ({self.bytes_skipped / 2**20:.1f} MB), removed {len(stale)} stale.")
+
+
+class PendingFile(io.BytesIO):
+    """Collects what's written to a file, and hands it to the session when closed."""
+
+    def __init__(self, path, session):
+        super().__init__()
+        self.path = path
+        self.session = session
+
+    def close(self):
+        if not self.closed:
+            self.session.commit(self.path, self.getvalue())
+        super().close()
+
+
+def file_stat(path):
+    """The size and modification time of the file at path, or None if it's gone (so it counts as changed)."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+@contextlib.contextmanager
+def export(root, name):
+    """Writes through a Session for root while the block runs. The stale files are only removed, and the manifest
+    only updated, if it finishes without an exception."""
+    global session
+    session = Session(root, name)
+    try:
+        yield session
+        session.wait()
+        session.finish()
+    finally:
+        session.close()
+        session = None
+
+
+def open(path, mode='w', encoding=None, newline=None):
+    """Like the builtin open for writing (text or binary)."""
+    if session is None:
+        return builtins.open(path, mode, encoding=encoding, newline=newline)
+    if 'b' in mode:
+        return PendingFile(path, session)
+    return io.TextIOWrapper(PendingFile(path, session), encoding=encoding, newline=newline)
+
+
+def save_image(image, path):
+    """Like image.save(path), with the format from the extension. During an export it's saved on a worker thread, so
+    image shouldn't be changed afterwards."""
+    if session is None:
+        image.save(path)
+    elif session.executor is None:
+        encode_image(image, path)
+    else:
+        session.submit_image(image, path)
+
+
+def save_blank(path, size, mode, color):
+    """Saves an image of size filled with color, like PIL.Image.new(mode, size, color).save(path). During an export
+    each distinct blank is only drawn and encoded once, and those bytes are written to every path that wants it."""
+    if session is None:
+        PIL.Image.new(mode, size, color).save(path)
+        return
+    image_format = PIL.Image.registered_extensions()[os.path.splitext(path)[1].lower()]
+    key = (mode, tuple(size), color, image_format)
+    if key not in session.data_from_blank:
+        buffer = io.BytesIO()
+        PIL.Image.new(mode, size, color).save(buffer, format=image_format)
+        session.data_from_blank[key] = buffer.getvalue()
+    session.commit(path, session.data_from_blank[key])
+
+
+def encode_image(image, path):
+    with open(path, 'wb') as outf:
+        image.save(outf, format=PIL.Image.registered_extensions()[os.path.splitext(path)[1].lower()])
+
+
+def copy(src, dst):
+    """Like shutil.copy, for a file."""
+    if session is None:
+        shutil.copy(src, dst)
+        return
+    with builtins.open(src, 'rb') as inf, open(dst, 'wb') as outf:
+        outf.write(inf.read())
@@ -0,0 +1,107 @@
+import atexit
+import cProfile
+import os
+import sys
+import threading
+from collections import Counter
+
+# Timing spans to profile, read from the environment so that spawned export workers pick them up too:
+# PDOX_PROFILE is a comma-separated list of span names, like "arrange_inner_sea,ck3.create_mod,stage.rivers"; a name
+# matches a span with that name or ending in "." and that name. Each profiled span writes {name}.pstats to
+# PDOX_PROFILE_DIR (default "profiles"), and if PDOX_PROFILE_STACKS is set, also {name}.collapsed, a flamegraph-style
+# collapsed stack count from sampling the span's thread every PDOX_PROFILE_STACKS milliseconds. These are written by
+# dump, once at process exit (pool workers, which skip atexit, call it themselves) rather than every time a span closes.
+# With PDOX_PROFILE unset, timing.span skips this module entirely.
+profile_names = {name.strip() for name in os.environ.get("PDOX_PROFILE", "").split(",") if name.strip() != ""}
+profile_dir = os.environ.get("PDOX_PROFILE_DIR", "profiles")
+stack_interval = float(os.environ["PDOX_PROFILE_STACKS"]) / 1000 if os.environ.get("PDOX_PROFILE_STACKS") else None
+
+profile_from_name = {}
+stacks_from_name = {}
+# Names profiled since the last dump.
+_undumped = set()
+_active = threading.local()
+
+
+def configure(names, directory="profiles", stacks_ms=None):
+    """Sets the spans to profile, and exports the settings to the environment for any processes started later."""
+    global profile_names, profile_dir, stack_interval
+    profile_names = set(names)
+    profile_dir = directory
+    stack_interval = stacks_ms / 1000 if stacks_ms else None
+    os.environ["PDOX_PROFILE"] = ",".join(sorted(profile_names))
+    os.environ["PDOX_PROFILE_DIR"] = directory
+    if stacks_ms:
+        os.environ["PDOX_PROFILE_STACKS"] = str(stacks_ms)
+    else:
+        os.environ.pop("PDOX_PROFILE_STACKS", None)
+
+
+def wanted(span_name):
+    return any([span_name == name or span_name.endswith("." + name) for name in profile_names])
+
+
+def start(span_name):
+    """Starts profiling span_name if it's wanted and nothing else on this thread is being profiled already
+    (cProfile can't nest). Returns a handle for stop, or None."""
+    if getattr(_active, "name", None) is not None or not wanted(span_name):
+        return None
+    _active.name = span_name
+    if len(profile_from_name) == 0:
+        atexit.register(dump)
+    if span_name not in profile_from_name:
+        profile_from_name[span_name] = cProfile.Profile()
+    sampler = None
+    if stack_interval is not None:
+        sampler = Sampler(threading.get_ident(), stacks_from_name.setdefault(span_name, Counter()), stack_interval)
+        sampler.start()
+    profile_from_name[span_name].enable()
+    return span_name, sampler
+
+
+def stop(handle):
+    """Stops the profiling started by start. What it collected is written by the next dump."""
+    span_name, sampler = handle
+    profile_from_name[span_name].disable()
+    if sampler is not None:
+        sampler.stop()
+    _active.name = None
+    _undumped.add(span_name)
+
+
+def dump():
+    """Writes the output files of every name profiled since the last dump, with everything collected under that name."""
+    for span_name in sorted(_undumped):
+        os.makedirs(profile_dir, exist_ok=True)
+        profile_from_name[span_name].dump_stats(os.path.join(profile_dir, f"{span_name}.pstats"))
+        if span_name in stacks_from_name:
+            with open(os.path.join(profile_dir, f"{span_name}.collapsed"), 'w', encoding='utf_8') as outf:
+                for stack, count in sorted(stacks_from_name[span_name].items()):
+                    outf.write(f"{stack} {count}\n")
+    _undumped.clear()
+
+
+class Sampler(threading.Thread):
+    """Counts the call stacks of thread_id, sampled every interval seconds, as 'outer;...;inner' strings."""
+
+    def __init__(self, thread_id, counts, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.counts = counts
+        self.interval = interval
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if len(names) > 0:
+                self.counts[";".join(reversed(names))] += 1
+
+    def stop(self):
+        self.done.set()
+        self.join()
@@ -160,6 +160,21 @@ class RegionTree:
             result.append(cr)
         return (depth, result)
 
+    def to_json(self):
+        """Returns all of the attributes as a JSON-compatible dictionary, recursively; see from_json."""
+        return {
+            "title": self.title, "tag": self.tag, "culture": self.culture, "religion": self.religion, "rough": self.rough, "holy_site": self.holy_site,
+            "color": list(self.color), "capital_title": self.capital_title, "capital_pid": self.capital_pid, "capital_rid": self.capital_rid,
+            "children": [child if isinstance(child, str) else child.to_json() for child in self.children],
+        }
+
+    @classmethod
+    def from_json(cls, contents):
+        """Inverse of to_json."""
+        children = [child if isinstance(child, str) else cls.from_json(child) for child in contents["children"]]
+        return cls(title=contents["title"], tag=contents["tag"], culture=contents["culture"], religion=contents["religion"], rough=contents["rough"], holy_site=contents["holy_site"],
+                   color=tuple(contents["color"]), capital_title=contents["capital_title"], capital_pid=contents["capital_pid"], capital_rid=contents["capital_rid"], children=children)
+
     @classmethod
     def from_csv(cls, filename, last_pid=1, last_rid=1, last_srid=1):
         """last_pid and last_rid will be used to assign pids and rids as we go.
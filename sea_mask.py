@@ -0,0 +1,152 @@
+import heapq
+import random
+
+
+class SeaMask:
+    """The still-open cubes of a sea, with a distance field of how far each one is from the nearest closed cube.
+    Cubes are bucketed by that clearance so that a spot with enough room can be sampled in constant time."""
+
+    def __init__(self, cubes):
+        self.clearance_from_cube = {}
+        self.cubes_from_clearance = {}
+        self.index_from_cube = {}
+        # Multi-source BFS from the edge of the mask; cubes next to a closed cube have clearance 1.
+        frontier = []
+        for cube in cubes:
+            if any([nbr not in cubes for nbr in cube.ordered_neighbors()]):
+                self._set(cube, 1)
+                frontier.append(cube)
+        while len(frontier) > 0:
+            next_frontier = []
+            for cube in frontier:
+                for nbr in cube.ordered_neighbors():
+                    if nbr in cubes and nbr not in self.clearance_from_cube:
+                        self._set(nbr, self.clearance_from_cube[cube] + 1)
+                        next_frontier.append(nbr)
+            frontier = next_frontier
+
+    def __len__(self):
+        return len(self.clearance_from_cube)
+
+    def __contains__(self, cube):
+        return cube in self.clearance_from_cube
+
+    def _set(self, cube, clearance):
+        """Moves cube into the bucket for clearance, taking it out of its old bucket if it had one."""
+        if cube in self.clearance_from_cube:
+            self._drop(cube)
+        self.clearance_from_cube[cube] = clearance
+        if clearance not in self.cubes_from_clearance:
+            self.cubes_from_clearance[clearance] = []
+        self.index_from_cube[cube] = len(self.cubes_from_clearance[clearance])
+        self.cubes_from_clearance[clearance].append(cube)
+
+    def _drop(self, cube):
+        """Removes cube from the mask by swapping it with the last cube in its bucket."""
+        bucket = self.cubes_from_clearance[self.clearance_from_cube.pop(cube)]
+        ind = self.index_from_cube.pop(cube)
+        last = bucket.pop()
+        if last != cube:
+            bucket[ind] = last
+            self.index_from_cube[last] = ind
+
+    def sample(self, min_clearance):
+        """Returns a random open cube with at least min_clearance, or from the roomiest bucket if none are that open.
+        Returns None if the mask is empty."""
+        levels = sorted([level for level, bucket in self.cubes_from_clearance.items() if len(bucket) > 0])
+        if len(levels) == 0:
+            return None
+        if levels[-1] < min_clearance:
+            levels = levels[-1:]
+        else:
+            levels = [level for level in levels if level >= min_clearance]
+        ind = random.randrange(sum([len(self.cubes_from_clearance[level]) for level in levels]))
+        for level in levels:
+            if ind < len(self.cubes_from_clearance[level]):
+                return self.cubes_from_clearance[level][ind]
+            ind -= len(self.cubes_from_clearance[level])
+
+    def close(self, cubes):
+        """Removes cubes from the mask and lowers the clearance of whatever was near them."""
+        frontier = []
+        for cube in cubes:
+            if cube in self.clearance_from_cube:
+                self._drop(cube)
+                frontier.append(cube)
+        # Clearance only ever shrinks, so relaxing outward from the closed cubes until nothing changes is enough.
+        while len(frontier) > 0:
+            cube = frontier.pop()
+            for nbr in cube.ordered_neighbors():
+                if nbr not in self.clearance_from_cube:
+                    continue
+                new_clearance = 1 + min([self.clearance_from_cube.get(nn, 0) for nn in nbr.ordered_neighbors()])
+                if new_clearance < self.clearance_from_cube[nbr]:
+                    self._set(nbr, new_clearance)
+                    frontier.append(nbr)
+
+    def grow(self, seed, size, weight_from_cube, blocked=None):
+        """Floods out from seed over open cubes not in blocked, stopping once it has size cubes.
+        Returns the reached cubes in order of weighted distance; fewer than size means seed's open area was too small."""
+        if blocked is None:
+            blocked = set()
+        region = []
+        reached = set()
+        dist_from_cube = {seed: 0}
+        heap = [(0, 0, seed)]
+        counter = 1
+        while len(heap) > 0 and len(region) < size:
+            dist, _, cube = heapq.heappop(heap)
+            if cube in reached:
+                continue
+            reached.add(cube)
+            region.append(cube)
+            for nbr in cube.ordered_neighbors():
+                if nbr in reached or nbr in blocked or nbr not in self.clearance_from_cube:
+                    continue
+                new_dist = dist + weight_from_cube.get(nbr, 1)
+                if new_dist < dist_from_cube.get(nbr, new_dist + 1):
+                    dist_from_cube[nbr] = new_dist
+                    heapq.heappush(heap, (new_dist, counter, nbr))
+                    counter += 1
+        return region
+
+    def place(self, county_sizes, weight_from_cube, center=None, attempts=10):
+        """Finds room for an island made of counties of county_sizes, starting from center if it's open.
+        Each county is one bounded flood, seeded at the open cube closest to the counties already placed.
+        Returns a list of counties (lists of cubes), or None if no attempt fit. Does not close anything."""
+        size = sum(county_sizes)
+        if size >= len(self):
+            return None
+        # A cube with clearance r+1 has the whole hexagon of radius r around it open.
+        radius = 0
+        while 3 * radius * (radius + 1) + 1 < size:
+            radius += 1
+        for _ in range(attempts):
+            if center is None or center not in self:
+                center = self.sample(radius + 1)
+            counties = self._place_at(center, county_sizes, weight_from_cube)
+            if counties is not None:
+                return counties
+            center = None
+        return None
+
+    def _place_at(self, center, county_sizes, weight_from_cube):
+        """Grows counties outward from center; returns None if the open area around center can't hold them all."""
+        blocked = set()  # Cubes already in a county, or in a pocket too small for one.
+        island = []
+        counties = []
+        for c_size in county_sizes:
+            while True:
+                if len(counties) == 0:
+                    seed = center if center not in blocked else None
+                else:
+                    seed = next((nbr for cube in island for nbr in cube.ordered_neighbors() if nbr in self and nbr not in blocked), None)
+                if seed is None:
+                    return None
+                region = self.grow(seed, c_size, weight_from_cube, blocked)
+                blocked.update(region)
+                if len(region) == c_size:
+                    break
+            counties.append(region)
+            island.extend(region)
+        return counties
@@ -1,4 +1,19 @@
+import io
+import multiprocessing
 import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import clausewitz
+import mod_writer
+
+# Processes to strip files with; 1 strips them one after another in this process. Set from STRIP_WORKERS by gen.run_exporter.
+workers = 1
+# Calls stripping fewer bytes than this do it in this process, since starting the workers would take longer (stripping
+# runs at about 6 MB/s, and a spawned worker takes about 0.3s to start).
+min_pool_bytes = 4 * 2**20
+# The worker processes, started by the first call that wants them and shared by the rest until shutdown.
+executor = None
 
 def strip_base_files(file_dir, src_dir, subpaths, to_remove, to_keep, subsection, main_file=None, encoding="utf_8_sig",):
     """There's a bunch of base game files that are necessary but contain _some_ hardcoded references to provinces.
@@ -7,122 +22,161 @@ def strip_base_files(file_dir, src_dir, subpaths, to_remove, to_keep, subsection
     If present, main_path is processed to remove any objects that were removed elsewhere.
     """
     removed_objs = set()
-    expanded_subpaths = []
-    while len(subpaths) > 0:
-        subpath = subpaths.pop()
-        if os.path.isdir(os.path.join(src_dir, subpath)):
-            subpaths.extend([os.path.join(src_dir, subpath, more) for more in os.listdir(os.path.join(src_dir, subpath))])
-        else:
-            expanded_subpaths.append(subpath)
-
-    for subpath in expanded_subpaths:
-        file_stripped = False
-        file_buffer = ""
+    patterns = matcher(to_remove), matcher(to_keep), matcher(subsection or [])
+    expanded_subpaths = expand_subpaths(src_dir, subpaths)
+    jobs = [(src_dir, subpath, patterns, encoding) for subpath in expanded_subpaths]
+    if workers > 1 and len(jobs) > 1 and sum([os.path.getsize(os.path.join(src_dir, subpath)) for subpath in expanded_subpaths]) >= min_pool_bytes:
+        results = list(pool().map(strip_file, *zip(*jobs), chunksize=max(1, len(jobs) // (4 * workers))))
+    else:
+        results = [strip_file(*job) for job in jobs]
+    # Merged in the (sorted) order of the files, so the output is the same however many workers there were.
+    for subpath, (file_buffer, file_removed) in zip(expanded_subpaths, results):
         file_name = os.path.join(src_dir, subpath)
-        with open(file_name, encoding=encoding) as inf:
-            valid = True
-            brackets = 0
-            mod_brackets = 0
-            mod = False
-            name = ""
-            buffer = ""
-            mod_buffer = ""
-            for line in inf:
-                if brackets == 0 and "{" in line:
-                    name = line.split("=")[0].strip()
-                brackets += line.count("{")
-                if brackets > 0 and (any([tr in line for tr in to_remove])) and (not(any([tk in line for tk in to_keep]))):
-                    valid = False
-                    removed_objs.add(name)
-                    file_stripped = True
-                if subsection is not None and brackets > 0 and valid and any([ss in line for ss in subsection]):
-                    mod = True
-                    mod_brackets = brackets - 1  # This is when it closes
-                if mod:
-                    mod_buffer += line
-                elif valid:
-                    buffer += line
-                brackets -= line.count("}")
-                if mod and brackets == mod_brackets:
-                    if valid:
-                        buffer += mod_buffer
-                        mod_buffer = ""
-                    else:
-                        valid = True
-                        mod_buffer = ""
-                    mod = False
-                if brackets == 0:
-                    if valid and mod:
-                        print(f"There's an issue with parsing {subpath}")
-                    elif valid:
-                        file_buffer = file_buffer + buffer
-                    buffer = ""
-                    valid = True
-        if file_stripped:  # We did a replacement, so need to write out buffer.
+        removed_objs.update(file_removed)
+        if file_buffer is not None:  # We did a replacement, so need to write out buffer.
             relpath = os.path.relpath(file_name,src_dir)
             print(relpath)
             os.makedirs(os.path.join(file_dir, os.path.dirname(relpath)), exist_ok=True)
-            with open(os.path.join(file_dir, relpath), 'w', encoding=encoding) as outf:
+            with mod_writer.open(os.path.join(file_dir, relpath), 'w', encoding=encoding) as outf:
                 outf.write(file_buffer)
     # Main file is currently V3 specific. Might have to refactor it or split it out to the V3 file.
     if main_file is not None:
         os.makedirs(os.path.join(file_dir, *main_file[:-1]), exist_ok=True)
-        with open(os.path.join(src_dir, *main_file), encoding=encoding) as inf:
-            with open(os.path.join(file_dir, *main_file), 'w', encoding=encoding) as outf:
+        lines = []
+        for line in clausewitz.Script(path=os.path.join(src_dir, *main_file)).text(encoding=encoding).splitlines(keepends=True):
+            # This relies that the stripped events are never on the same line as { or }, which should be true?
+            if line.strip().split(" ")[0] in removed_objs:  # A pulse event that should be removed
+                continue
+            if "=" in line and line.split("=")[1].strip().split(" ")[0] in removed_objs:  # an event that should be removed from a weighted random list
+                continue
+            lines.append(line)
+        file_buffer, _ = strip_script(clausewitz.Script("".join(lines).encode("utf_8")), *patterns, "utf_8", set(), os.path.join(*main_file), recheck=True)
+        with mod_writer.open(os.path.join(file_dir, *main_file), 'w', encoding=encoding) as outf:
+            outf.write(file_buffer)
+
+
+def pool():
+    """The executor for the worker processes, started if it isn't already. They're spawned as they're needed."""
+    global executor
+    if executor is None:
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return executor
+
+
+def shutdown():
+    """Stops the worker processes, if any were started."""
+    global executor
+    if executor is not None:
+        executor.shutdown()
+        executor = None
+
+
+def expand_subpaths(src_dir, subpaths):
+    """The files named by subpaths (relative to src_dir), with each directory replaced by all the files under it, sorted."""
+    expanded = []
+    pending = list(subpaths)
+    while len(pending) > 0:
+        subpath = pending.pop()
+        path = os.path.join(src_dir, subpath)
+        if not os.path.isdir(path):
+            expanded.append(subpath)
+            continue
+        with os.scandir(path) as entries:
+            for entry in entries:
+                (pending if entry.is_dir() else expanded).append(os.path.join(subpath, entry.name))
+    return sorted(expanded)
+
+
+def strip_file(src_dir, subpath, patterns, encoding):
+    """Strips one file (see strip_script), in this process or a worker. Returns its remaining text, or None if nothing
+    was removed, and the names of the objects removed from it. The file is read into a Script of its own rather than
+    through clausewitz.read, so it isn't kept in memory once it's stripped."""
+    removed_objs = set()
+    file_buffer, file_stripped = strip_script(clausewitz.Script(path=os.path.join(src_dir, subpath)), *patterns, encoding, removed_objs, subpath)
+    return (file_buffer if file_stripped else None), removed_objs
+
+
+def matcher(needles):
+    """A pattern that finds any of needles in a string, or None if there aren't any (so nothing matches)."""
+    if len(needles) == 0:
+        return None
+    return re.compile("|".join([re.escape(needle) for needle in needles]))
+
+
+def found(pattern, text):
+    return pattern is not None and pattern.search(text) is not None
+
+
+def strip_script(script, remove, keep, subsection, encoding, removed_objs, subpath, recheck=False):
+    """Removes the top-level objects in script that have a line matching remove (and not keep), or just the
+    subsection of them that has it, if it's in a matching subsection, going line by line by the brackets on each line.
+    (The patterns come from matcher.) Adds the names of objects with removals to removed_objs, and returns the remaining
+    text and whether anything was removed; the text is only worked out if something was, or with recheck."""
+    text = script.text(encoding=encoding)
+    if not recheck and not found(remove, text):  # Nothing would be removed, so the file won't be written.
+        return text, False
+    return strip_lines(io.StringIO(text), remove, keep, subsection, removed_objs, subpath, recheck)
+
+
+def strip_lines(lines, remove, keep, subsection, removed_objs, subpath, recheck=False):
+    """Does the stripping for lines, keeping track of the brackets on each line. Lines outside any object are kept,
+    but anything after the last time the brackets balance is dropped."""
+    file_stripped = False
+    file_buffer = []
+    valid = True
+    brackets = 0
+    mod_brackets = 0
+    mod = False
+    name = ""
+    buffer = []
+    mod_buffer = []
+    for line in lines:
+        if not recheck and brackets == 0 and "{" in line:
+            name = line.split("=")[0].strip()
+        brackets += line.count("{")
+        removes = found(remove, line) and not found(keep, line)
+        if brackets > 0 and removes:
+            valid = False
+            if not recheck:
+                removed_objs.add(name)
+                file_stripped = True
+        if brackets > 0 and valid and found(subsection, line):
+            mod = True
+            mod_brackets = brackets - 1  # This is when it closes
+        if mod:
+            mod_buffer.append(line)
+        elif valid:
+            buffer.append(line)
+        brackets -= line.count("}")
+        if mod and brackets == mod_brackets:
+            if valid:
+                buffer.extend(mod_buffer)
+            else:
                 valid = True
-                brackets = 0
-                mod_brackets = 0
-                mod = False
-                file_buffer = ""
-                mod_buffer = ""
-                buffer = ""
-                for line in inf.readlines():
-                    # This relies that the stripped events are never on the same line as { or }, which should be true?
-                    if line.strip().split(" ")[0] in removed_objs:  # A pulse event that should be removed
-                        continue
-                    if "=" in line and line.split("=")[1].strip().split(" ")[0] in removed_objs:  # an event that should be removed from a weighted random list
-                        continue
-                    brackets += line.count("{")
-                    if brackets > 0 and (any([tr in line for tr in to_remove])) and (not(any([tk in line for tk in to_keep]))):
-                        valid = False
-                    if subsection is not None and brackets > 0 and valid and any([ss in line for ss in subsection]):
-                        mod = True
-                        mod_brackets = brackets - 1  # This is when it closes
-                    if mod:
-                        mod_buffer += line
-                    elif valid:
-                        buffer += line
-                    brackets -= line.count("}")
-                    if mod and brackets == mod_brackets:
-                        if valid:
-                            buffer += mod_buffer
-                            mod_buffer = ""
-                        else:
-                            valid = True
-                            mod_buffer = ""
-                        mod = False
-                    if brackets == 0:
-                        if valid and mod:
-                            print(f"There's an issue with parsing {subpath}")
-                        elif valid:
-                            file_buffer = file_buffer + buffer
-                        buffer = ""
-                        valid = True
-                    if brackets > 0 and (any([tr in line for tr in to_remove])) and (not(any([tk in line for tk in to_keep]))):
-                        valid = False
-                outf.write(file_buffer)
-                
+            mod_buffer = []
+            mod = False
+        if brackets == 0:
+            if valid and mod:
+                print(f"There's an issue with parsing {subpath}")
+            elif valid:
+                file_buffer.extend(buffer)
+            buffer = []
+            valid = True
+        if recheck and brackets > 0 and removes:
+            valid = False
+    return "".join(file_buffer), file_stripped
+
 def create_blanks(file_dir, file_paths, encoding="utf_8_sig"):
     """There are a lot of files that we want to just blank out."""
     for file_path in file_paths:
         os.makedirs(os.path.join(file_dir,*file_path[:-1]), exist_ok=True)
-        with open(os.path.join(file_dir, *file_path), 'w', encoding=encoding) as outf:
+        with mod_writer.open(os.path.join(file_dir, *file_path), 'w', encoding=encoding) as outf:
             outf.write("\n")
 
 def copy_base_files(file_dir, base_dir, file_paths, encoding="utf_8_sig"):
     """For when you want to replace_path a directory, but some of the vanilla files should just be copied over."""
     for file_path in file_paths:
         os.makedirs(os.path.join(file_dir,*file_path[:-1]), exist_ok=True)
-        with open(os.path.join(file_dir, *file_path), 'w', encoding=encoding) as outf:
+        with mod_writer.open(os.path.join(file_dir, *file_path), 'w', encoding=encoding) as outf:
             with open(os.path.join(base_dir, *file_path), 'r', encoding=encoding) as inf:
                 outf.write(inf.read())
@@ -0,0 +1,31 @@
+import os
+
+import ck3
+import clausewitz
+
+CULTURES = "a = { name_list = name_list_ab }\nb = { name_list = name_list_ab }\nc = { graphics = x }\n"
+NAME_LISTS = 'name_list_ab = {\n\tdynasty_names = { { "dynnp_von" "dyn_x" } "dyn_y" plain }\n\tmale_names = { 10 = { Abc Def } Ghi }\n\tfemale_names = { Jkl }\n}\n'
+
+
+def test_culture_names_twice(tmp_path):
+    for subdir, text in [("cultures", CULTURES), ("name_lists", NAME_LISTS)]:
+        os.makedirs(tmp_path / "common" / "culture" / subdir)
+        (tmp_path / "common" / "culture" / subdir / "00_test.txt").write_text(text, encoding="utf_8_sig")
+    try:
+        for _ in range(2):  # Like two CK3 exports in one process, which read the same cached indexes.
+            dyn_names_from_cul, male_names_from_cul, female_names_from_cul = ck3.culture_names(str(tmp_path), {"a", "b", "c"})
+            assert sorted(dyn_names_from_cul) == ["a", "b"]
+            assert dyn_names_from_cul["a"] == ['{ "dynnp_von" "dyn_x" }', '"dyn_y"']
+            assert list(male_names_from_cul["b"]) == ["Abc", "Def", "Ghi"]
+            assert list(female_names_from_cul["a"]) == ["Jkl"]
+            dyn_names_from_cul["a"].pop()  # create_history uses up the dynasty names.
+            assert dyn_names_from_cul["b"] == ['{ "dynnp_von" "dyn_x" }']
+    finally:
+        clausewitz.script_from_path.clear()
+
+
+if __name__ == "__main__":
+    import pathlib
+    import tempfile
+    with tempfile.TemporaryDirectory() as path:
+        test_culture_names_twice(pathlib.Path(path))
@@ -0,0 +1,57 @@
+import os
+
+import clausewitz
+
+SCRIPT = b'\xef\xbb\xbf# a comment with a { brace\r\n@size = 5\r\nk_one = { capital = c_a # }\r\n\tname = "one } two"\r\n}\r\nk_two={ group = culture_group_regional names = { 10 = { Abc Def } Xyz } }\r\n'
+
+
+def test_blocks():
+    script = clausewitz.Script(SCRIPT)
+    assert [block.name for block in script.blocks] == ["k_one", "k_two"]
+    one = script.block("k_one")
+    assert script.data[one.start:one.end].startswith(b"k_one = {")
+    assert one.text(lines=True) == 'k_one = { capital = c_a # }\n\tname = "one } two"\n}\n'
+    assert one.get("name") == '"one } two"'
+    two = script.block("k_two")
+    assert two.get("group") == "culture_group_regional"
+    assert [block.name for block in two.children()] == ["names"]
+    assert clausewitz.values(two.get("names")) == ["Abc", "Def", "Xyz"]
+
+
+def test_parse():
+    assert clausewitz.parse(b'a = 1 b >= 2 { c "d e" } f = { g }') == [("a", "=", "1"), ("b", ">=", "2"), ["c", '"d e"'], ("f", "=", ["g"])]
+
+
+def groups(script):
+    return {block.name: block.get("group") for block in script.blocks}
+
+
+def test_block_cache(tmp_path):
+    path = tmp_path / "titles.txt"
+    path.write_bytes(SCRIPT)
+    clausewitz.cache_dir = str(tmp_path / "cache")
+    try:
+        spans = [(block.name, block.start, block.end) for block in clausewitz.read(path).blocks]
+        assert clausewitz.read(path).index("groups", groups) == {"k_one": None, "k_two": "culture_group_regional"}
+        assert len(os.listdir(clausewitz.cache_dir)) == 1
+        clausewitz.script_from_path.clear()
+        script = clausewitz.read(path)
+        assert [(block.name, block.start, block.end) for block in script.blocks] == spans
+        assert script.index("groups", groups) == {"k_one": None, "k_two": "culture_group_regional"}
+        assert script._data is None  # Both came from the cache, without reading the file.
+        path.write_bytes(SCRIPT.replace(b"k_two", b"k_three"))
+        clausewitz.script_from_path.clear()
+        assert clausewitz.read(path)._cached_indexes() == {}
+        assert [block.name for block in clausewitz.read(path).blocks] == ["k_one", "k_three"]
+    finally:
+        clausewitz.cache_dir = None
+        clausewitz.script_from_path.clear()
+
+
+if __name__ == "__main__":
+    test_blocks()
+    test_parse()
+    import pathlib
+    import tempfile
+    with tempfile.TemporaryDirectory() as path:
+        test_block_cache(pathlib.Path(path))
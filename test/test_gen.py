@@ -0,0 +1,64 @@
+import heapq
+import random
+
+from cube import Cube
+from gen import COLOR_RANGES, create_landed_colors, find_rail_path
+from terrain import RAIL_DIST
+
+
+def test_landed_colors():
+    random.seed(0)
+    # Four cubes per pid, each pid within one column, so each is all land or all sea.
+    pid_from_cube = {Cube(x, y, -x-y): (x * 40 + y) // 4 for x in range(40) for y in range(40)}
+    land_cubes = {k for k in pid_from_cube if k.x < 25}
+    rgb_from_pid = create_landed_colors(pid_from_cube, land_cubes)
+    assert len(rgb_from_pid) == 400
+    assert len(set(rgb_from_pid.values())) == 400
+    for cube, pid in pid_from_cube.items():
+        ranges = COLOR_RANGES[cube in land_cubes]
+        assert all(lo <= c <= hi for c, (lo, hi) in zip(rgb_from_pid[pid], ranges))
+
+
+def dijkstra_cost(start, end, rail_dist_from_cube, rid_from_cube, rids):
+    """The cost of the cheapest path from start to end, found the plain way, or None if there isn't one."""
+    cost_from_cube = {start: 0}
+    frontier = [(0, start.tuple(), start)]
+    while frontier:
+        cost, _, cube = heapq.heappop(frontier)
+        if cube == end:
+            return cost
+        if cost > cost_from_cube[cube]:
+            continue
+        for nbr in cube.neighbors():
+            if rid_from_cube.get(nbr, -1) in rids and cost + rail_dist_from_cube[nbr] < cost_from_cube.get(nbr, cost + rail_dist_from_cube[nbr] + 1):
+                cost_from_cube[nbr] = cost + rail_dist_from_cube[nbr]
+                heapq.heappush(frontier, (cost_from_cube[nbr], nbr.tuple(), nbr))
+    return None
+
+
+def test_find_rail_path():
+    random.seed(0)
+    cubes = [Cube(x, y, -x-y) for x in range(12) for y in range(12)]
+    rail_dist_from_cube = {k: random.choice(list(RAIL_DIST.values())) for k in cubes}
+    # Regions 0 and 1 split the grid, and the cubes of region 2 are in neither; the column at x == 8 walls off the east.
+    rid_from_cube = {k: 2 if k.x == 8 or random.random() < 0.2 else int(k.y >= 6) for k in cubes}
+    west = [k for k in cubes if k.x < 8 and rid_from_cube[k] != 2]
+    east = [k for k in cubes if k.x > 8 and rid_from_cube[k] != 2]
+    for _ in range(30):
+        start, end = random.sample(west, 2)
+        path = find_rail_path(start, end, rail_dist_from_cube, rid_from_cube, (0, 1))
+        expected = dijkstra_cost(start, end, rail_dist_from_cube, rid_from_cube, (0, 1))
+        if expected is None:
+            assert path is None
+            continue
+        assert path[0] == start and path[-1] == end
+        assert all([a.dist(b) == 1 and rid_from_cube[b] in (0, 1) for a, b in zip(path, path[1:])])
+        assert sum([rail_dist_from_cube[k] for k in path[1:]]) == expected
+    assert find_rail_path(west[0], east[0], rail_dist_from_cube, rid_from_cube, (0, 1)) is None
+    assert find_rail_path(west[0], next(k for k in west if rid_from_cube[k] == 1), rail_dist_from_cube, rid_from_cube, (rid_from_cube[west[0]],)) is None
+    assert find_rail_path(west[0], west[0], rail_dist_from_cube, rid_from_cube, (0, 1)) == [west[0]]
+
+
+if __name__ == "__main__":
+    test_landed_colors()
+    test_find_rail_path()
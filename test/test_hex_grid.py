@@ -0,0 +1,21 @@
+import random
+
+from cube import *
+from hex_grid import find_straits
+
+
+def test_find_straits_matches_valid_straits():
+    random.seed(0)
+    land_cubes = {Cube(x, y, -x-y) for x in range(-12, 12) for y in range(-12, 12) if random.random() < 0.4}
+    expected = set()
+    for k in land_cubes:
+        for other_land, sea_1, sea_2 in k.valid_straits(land_cubes):
+            expected.add((k, other_land, sea_1, sea_2))
+    straits = find_straits(land_cubes)
+    assert len(straits) == len(expected)
+    assert set(straits) == expected
+    assert straits == find_straits(set(sorted(land_cubes, key=Cube.tuple)))
+
+
+if __name__ == "__main__":
+    test_find_straits_matches_valid_straits()
@@ -0,0 +1,17 @@
+import random
+
+from map_io import create_hex_map, create_label_map, paint_labels, valid_cubes
+
+
+def test_paint_labels():
+    rng = random.Random(0)
+    label_from_ijk = {cube.tuple(): ind + 1 for ind, cube in enumerate(valid_cubes(12, 6))}
+    labels = create_label_map(label_from_ijk, 200, 100, 12, 6)
+    for mode, default in [('L', "black"), ('RGB', (127, 127, 127))]:
+        rgb_from_ijk = {ijk: (rng.randint(0, 255) if mode == 'L' else (rng.randint(0, 255), 0, 9)) for ijk in label_from_ijk if rng.random() < 0.5}
+        expected = create_hex_map(rgb_from_ijk=rgb_from_ijk, max_x=200, max_y=100, n_x=12, n_y=6, mode=mode, default=default)
+        assert paint_labels(labels, label_from_ijk, rgb_from_ijk, mode, default).tobytes() == expected.tobytes()
+
+
+if __name__ == "__main__":
+    test_paint_labels()
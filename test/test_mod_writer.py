@@ -0,0 +1,72 @@
+import os
+
+import PIL.Image
+
+import mod_writer
+
+
+def export(root, files):
+    """Writes files (a dict from name to text) under root in an export, and returns the session."""
+    with mod_writer.export(str(root), "test") as session:
+        for name, text in files.items():
+            os.makedirs(os.path.dirname(os.path.join(root, name)), exist_ok=True)
+            with mod_writer.open(os.path.join(root, name), 'w', encoding="utf_8_sig") as outf:
+                outf.write(text)
+        os.makedirs(os.path.join(root, "map"), exist_ok=True)
+        mod_writer.save_image(PIL.Image.new('L', (8, 4), 7), os.path.join(root, "map", "mask.png"))
+    return session
+
+
+def test_export(tmp_path):
+    with open(tmp_path / "plain.txt", 'w', encoding="utf_8_sig") as outf:
+        outf.write("a = {\n}\n")
+    first = export(tmp_path / "mod", {"common/a.txt": "a = {\n}\n", "common/old/b.txt": "b"})
+    assert (first.files_written, first.files_skipped) == (3, 0)
+    assert (tmp_path / "mod" / "common" / "a.txt").read_bytes() == (tmp_path / "plain.txt").read_bytes()
+    assert PIL.Image.open(tmp_path / "mod" / "map" / "mask.png").getpixel((0, 0)) == 7
+    second = export(tmp_path / "mod", {"common/a.txt": "a = {\n}\n", "common/c.txt": "c"})
+    assert (second.files_written, second.files_skipped) == (1, 2)
+    assert sorted(os.listdir(tmp_path / "mod" / "common")) == ["a.txt", "c.txt"]
+    (tmp_path / "mod" / "common" / "c.txt").write_text("changed by hand")
+    third = export(tmp_path / "mod", {"common/a.txt": "a = {\n}\n", "common/c.txt": "c"})
+    assert (third.files_written, third.files_skipped) == (1, 2)
+    assert (tmp_path / "mod" / "common" / "c.txt").read_text(encoding="utf_8_sig") == "c"
+    os.remove(tmp_path / "mod" / "common" / "a.txt")
+    fourth = export(tmp_path / "mod", {"common/a.txt": "a = {\n}\n", "common/c.txt": "c"})
+    assert (fourth.files_written, fourth.files_skipped) == (1, 2)
+    assert (tmp_path / "mod" / "common" / "a.txt").read_bytes() == (tmp_path / "plain.txt").read_bytes()
+    assert mod_writer.session is None
+
+
+def test_blanks(tmp_path):
+    PIL.Image.new('L', (16, 8), "black").save(tmp_path / "plain.dds")
+    with mod_writer.export(str(tmp_path / "mod"), "test") as session:
+        os.makedirs(tmp_path / "mod")
+        for name in ["a.dds", "b.dds"]:
+            mod_writer.save_blank(os.path.join(tmp_path, "mod", name), (16, 8), 'L', "black")
+        mod_writer.save_blank(os.path.join(tmp_path, "mod", "c.png"), (16, 8), 'L', "black")
+    assert len(session.data_from_blank) == 2
+    assert (tmp_path / "mod" / "a.dds").read_bytes() == (tmp_path / "mod" / "b.dds").read_bytes() == (tmp_path / "plain.dds").read_bytes()
+
+
+def test_image_error(tmp_path):
+    try:
+        with mod_writer.export(str(tmp_path), "test"):
+            mod_writer.save_image(PIL.Image.new('L', (8, 4)), os.path.join(tmp_path, "missing", "mask.png"))
+    except FileNotFoundError:
+        pass
+    else:
+        assert False, "the worker thread's error should be raised by export"
+    assert mod_writer.session is None
+    assert not os.path.exists(tmp_path / ".test.manifest.json")
+
+
+if __name__ == "__main__":
+    import pathlib
+    import tempfile
+    with tempfile.TemporaryDirectory() as path:
+        test_export(pathlib.Path(path))
+    with tempfile.TemporaryDirectory() as path:
+        test_blanks(pathlib.Path(path))
+    with tempfile.TemporaryDirectory() as path:
+        test_image_error(pathlib.Path(path))
@@ -0,0 +1,28 @@
+import os
+import pstats
+
+import profiling
+import timing
+
+
+def test_profile_named_span(tmp_path):
+    profiling.configure(["busy"], str(tmp_path), stacks_ms=1)
+    try:
+        with timing.span("outer"):
+            with timing.span("stage.busy"):
+                sum([i * i for i in range(10**6)])
+        assert os.listdir(tmp_path) == []
+        profiling.dump()
+    finally:
+        profiling.configure([])
+        os.environ.pop("PDOX_PROFILE")
+        os.environ.pop("PDOX_PROFILE_DIR")
+    assert sorted(os.listdir(tmp_path)) == ["stage.busy.collapsed", "stage.busy.pstats"]
+    assert pstats.Stats(str(tmp_path / "stage.busy.pstats")).total_calls > 0
+
+
+if __name__ == "__main__":
+    import pathlib
+    import tempfile
+    with tempfile.TemporaryDirectory() as path:
+        test_profile_named_span(pathlib.Path(path))
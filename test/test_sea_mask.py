@@ -0,0 +1,39 @@
+import random
+
+from cube import *
+from sea_mask import SeaMask
+
+
+def hexagon(radius):
+    return {Cube(x, y, -x-y) for x in range(-radius, radius+1) for y in range(-radius, radius+1) if abs(x+y) <= radius}
+
+
+def test_close_matches_rebuild():
+    random.seed(0)
+    cubes = hexagon(8)
+    sea_mask = SeaMask(cubes)
+    assert sea_mask.clearance_from_cube[Cube(0,0,0)] == 9
+    for _ in range(5):
+        closed = {random.choice(sorted(sea_mask.clearance_from_cube, key=Cube.tuple)) for _ in range(4)}
+        sea_mask.close(closed)
+        cubes = cubes.difference(closed)
+        assert sea_mask.clearance_from_cube == SeaMask(cubes).clearance_from_cube
+
+
+def test_place_contiguous_counties():
+    random.seed(0)
+    sea_mask = SeaMask(hexagon(6))
+    weight_from_cube = {k: random.randint(1,8) for k in hexagon(6)}
+    counties = sea_mask.place([4, 3, 5], weight_from_cube, center=Cube(0,0,0))
+    assert [len(c) for c in counties] == [4, 3, 5]
+    assert counties[0][0] == Cube(0,0,0)
+    island = {k for county in counties for k in county}
+    assert len(island) == 12
+    for county in counties:
+        assert all([any([nbr in county for nbr in k.neighbors()]) for k in county])
+    assert sea_mask.place([200], weight_from_cube) is None
+
+
+if __name__ == "__main__":
+    test_close_matches_rebuild()
+    test_place_contiguous_counties()
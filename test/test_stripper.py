@@ -0,0 +1,61 @@
+import os
+
+import clausewitz
+import stripper
+
+EVENTS = "namespace = test\ntest.1 = {\n\ttrigger = {\n\t\tprovince:12 = { is_coastal = yes }\n\t}\n}\ntest.2 = {\n\toption = {\n\t\tname = a\n\t}\n}\n"
+MAIN = "on_actions = {\n\tevents = {\n\t\ttest.1\n\t\ttest.2\n\t}\n}\n"
+
+
+def strip_tree(src_dir, out_dir, workers):
+    min_pool_bytes = stripper.min_pool_bytes
+    stripper.workers = workers
+    stripper.min_pool_bytes = 0
+    try:
+        stripper.strip_base_files(str(out_dir), str(src_dir), ["events"], ["province:"], [], None, main_file=["main.txt"])
+        assert (stripper.executor is not None) == (workers > 1)
+    finally:
+        stripper.shutdown()
+        stripper.workers = 1
+        stripper.min_pool_bytes = min_pool_bytes
+    contents = {}
+    for root, _, files in os.walk(out_dir):
+        for name in files:
+            with open(os.path.join(root, name), 'r', encoding="utf_8_sig") as inf:
+                contents[os.path.relpath(os.path.join(root, name), out_dir)] = inf.read()
+    return contents
+
+
+def test_strip_base_files(tmp_path):
+    os.makedirs(tmp_path / "src" / "events" / "more")
+    for subpath in ["a.txt", "b.txt", os.path.join("more", "c.txt")]:
+        (tmp_path / "src" / "events" / subpath).write_text(EVENTS.replace("test.", subpath[0] + "."))
+    (tmp_path / "src" / "events" / "d.txt").write_text("namespace = test\n")
+    (tmp_path / "src" / "main.txt").write_text(MAIN.replace("test.1", "a.1"))
+    serial = strip_tree(tmp_path / "src", tmp_path / "serial", 1)
+    assert sorted(serial) == ["events/a.txt", "events/b.txt", "events/more/c.txt", "main.txt"]
+    assert serial["events/a.txt"] == "namespace = test\na.2 = {\n\toption = {\n\t\tname = a\n\t}\n}\n"
+    assert serial["main.txt"] == "on_actions = {\n\tevents = {\n\t\ttest.2\n\t}\n}\n"
+    assert not any([path.startswith(str(tmp_path)) for path in clausewitz.script_from_path])  # Stripped files aren't kept.
+    assert strip_tree(tmp_path / "src", tmp_path / "parallel", 2) == serial
+
+
+def test_brackets_by_line(tmp_path):
+    # Stripping only counts the brackets on each line, without regard to comments or strings, and that's kept as is:
+    # the anonymous block goes, the } in a comment closes a.1 early (so its province line stays), and the { in a
+    # string leaves the rest of the file open, so it's dropped.
+    text = 'namespace = test\n{\n\tprovince:3 = { is_coastal = yes }\n}\na.1 = {\n\t# a } in a comment\n\tprovince:12 = yes\n}\n}\na.2 = {\n\tdesc = "a { in a string"\n}\na.3 = {\n\toption = { name = a }\n}\n'
+    os.makedirs(tmp_path / "src" / "events")
+    (tmp_path / "src" / "events" / "a.txt").write_text(text, encoding="utf_8_sig")
+    stripper.strip_base_files(str(tmp_path / "out"), str(tmp_path / "src"), ["events"], ["province:"], [], None)
+    stripped = (tmp_path / "out" / "events" / "a.txt").read_text(encoding="utf_8_sig")
+    assert stripped == 'namespace = test\na.1 = {\n\t# a } in a comment\n\tprovince:12 = yes\n}\n}\na.2 = {\n\tdesc = "a { in a string"\n}\na.3 = {\n\toption = { name = a }\n'
+
+
+if __name__ == "__main__":
+    import pathlib
+    import tempfile
+    with tempfile.TemporaryDirectory() as path:
+        test_strip_base_files(pathlib.Path(path))
+    with tempfile.TemporaryDirectory() as path:
+        test_brackets_by_line(pathlib.Path(path))
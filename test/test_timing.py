@@ -0,0 +1,39 @@
+import timing
+
+
+@timing.timed()
+def allocate(n):
+    return [0] * n
+
+
+def test_spans_nest_and_count():
+    timing.reset()
+    timing.trace_memory()
+    try:
+        with timing.span("outer"):
+            for _ in range(3):
+                allocate(10**6)
+    finally:
+        timing.trace_memory(False)
+    spans = timing.report()
+    assert spans["outer"]["calls"] == 1
+    assert spans["test_timing.allocate"]["calls"] == 3
+    assert spans["outer"]["wall"] >= spans["test_timing.allocate"]["wall"]
+    assert spans["outer"]["peak_mb"] >= spans["test_timing.allocate"]["peak_mb"] > 7
+    timing.merge(spans)
+    assert timing.report()["outer"]["calls"] == 2
+
+
+def test_counters():
+    timing.reset()
+    timing.count("attempts")
+    timing.count("attempts", 2)
+    timing.merge({}, {"attempts": 1, "rechunks": 1})
+    assert timing.counts() == {"attempts": 4, "rechunks": 1}
+    timing.reset()
+    assert timing.counts() == {}
+
+
+if __name__ == "__main__":
+    test_spans_nest_and_count()
+    test_counters()
@@ -0,0 +1,44 @@
+import numpy as np
+
+from cube import *
+from terrain import BaseTerrain
+from world_io import load_world, save_world
+
+
+def test_round_trip(tmp_path):
+    a, b = Cube(0,0,0), Cube(1,-1,0)
+    world = {
+        "pid_from_cube": {a: 1, b: 2},
+        "terr_from_cube": {a: BaseTerrain.plains, b: BaseTerrain.ocean},
+        "cubes_from_pid": {1: [a], 2: [b, a]},
+        "base_from_vertex": {Vertex(a, 1): 0.5, Vertex(b, -1): 2.0},
+        "river_flow_from_edge": {Edge(a, 0, None): 3, Edge(b, 2, -1): 1},
+        "river_merges": [(Vertex(a, 1), Vertex(b, -1))],
+        "straits": [(a, b, 7)],
+        "name_from_pid": {1: "one", 2: "two"},
+        "railways": [(1, [1, 2])],
+        "ow_nx": 12,
+    }
+    save_world(str(tmp_path), world)
+    loaded = load_world(str(tmp_path))
+    assert sorted(loaded.keys()) == sorted(world.keys())
+    for field, value in world.items():
+        assert loaded[field] == value
+
+
+def test_numpy_ints(tmp_path):
+    a, b = Cube(0,0,0), Cube(1,-1,0)
+    world = {"land_height_from_cube": {a: np.int64(3), b: np.int32(-2)}, "water_depth_from_cube": {a: np.float32(0.5), b: 1}}
+    save_world(str(tmp_path), world)
+    loaded = load_world(str(tmp_path))
+    assert loaded["land_height_from_cube"] == {a: 3, b: -2}
+    assert all([type(v) is int for v in loaded["land_height_from_cube"].values()])
+    assert loaded["water_depth_from_cube"] == {a: 0.5, b: 1.0}
+
+
+if __name__ == "__main__":
+    import tempfile
+    with tempfile.TemporaryDirectory() as path:
+        test_round_trip(path)
+    with tempfile.TemporaryDirectory() as path:
+        test_numpy_ints(path)
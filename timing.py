@@ -0,0 +1,121 @@
+import functools
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import profiling
+
+# Totals for every span that has finished, by name: calls, wall time in seconds, the longest single call, and (when
+# memory tracing is on) the highest traced memory in MB seen during any call.
+stats_from_span = {}
+# Totals for anything else worth counting during a run, like retries, by name.
+count_from_name = {}
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def trace_memory(enabled=True):
+    """Turns tracemalloc on or off. While it's on, each span also records its peak traced memory; this slows
+    allocation-heavy code down noticeably, so it's off by default."""
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not enabled and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+@contextmanager
+def span(name):
+    """Times the enclosed block under name. Spans nest; a span's wall time includes the spans inside it."""
+    stack = _stack()
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        # tracemalloc has a single peak counter, so fold it into the enclosing span before resetting it for this one.
+        if len(stack) > 0:
+            stack[-1][1] = max(stack[-1][1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    frame = [name, 0]
+    stack.append(frame)
+    handle = profiling.start(name) if len(profiling.profile_names) > 0 else None
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - start_time
+        if handle is not None:
+            profiling.stop(handle)
+        stack.pop()
+        peak = max(frame[1], tracemalloc.get_traced_memory()[1]) / 2**20 if tracing else None
+        if tracing and len(stack) > 0:
+            stack[-1][1] = max(stack[-1][1], frame[1])
+        _record(name, 1, wall, wall, peak)
+
+
+def timed(name=None):
+    """Decorator version of span; name defaults to the function's module and qualified name."""
+    def decorator(func):
+        span_name = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _record(name, calls, wall, max_wall, peak):
+    with _lock:
+        if name not in stats_from_span:
+            stats_from_span[name] = {"calls": 0, "wall": 0.0, "max_wall": 0.0, "peak_mb": None}
+        stats = stats_from_span[name]
+        stats["calls"] += calls
+        stats["wall"] += wall
+        stats["max_wall"] = max(stats["max_wall"], max_wall)
+        if peak is not None:
+            stats["peak_mb"] = peak if stats["peak_mb"] is None else max(stats["peak_mb"], peak)
+
+
+def count(name, n=1):
+    """Adds n to the counter called name."""
+    with _lock:
+        count_from_name[name] = count_from_name.get(name, 0) + n
+
+
+def counts():
+    """A copy of the counters, sorted by name."""
+    with _lock:
+        return dict(sorted(count_from_name.items()))
+
+
+def report():
+    """A copy of the span totals, sorted by total wall time."""
+    with _lock:
+        return {name: dict(stats) for name, stats in sorted(stats_from_span.items(), key=lambda kv: -kv[1]["wall"])}
+
+
+def merge(spans, counters=None):
+    """Adds spans, a report() from another process, and counters, its counts(), into this one's totals."""
+    for name, stats in spans.items():
+        _record(name, stats["calls"], stats["wall"], stats["max_wall"], stats["peak_mb"])
+    for name, n in (counters or {}).items():
+        count(name, n)
+
+
+def reset():
+    with _lock:
+        stats_from_span.clear()
+        count_from_name.clear()
+
+
+def write_report(path, **info):
+    """Writes the span totals and counters as JSON to path, along with anything in info (like the seed or total time)."""
+    with open(path, 'w', encoding='utf_8') as outf:
+        json.dump({**info, "spans": report(), "counts": counts()}, outf, indent=1)
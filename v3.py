@@ -1,12 +1,16 @@
 # This file is for file IO for V3 maps.
 import os
 import random
+import numpy as np
 import yaml
 
 from basic_map import BasicMap
+import clausewitz
 from map_io import *
+import mod_writer
 from stripper import create_blanks, strip_base_files
 from terrain import *
+from timing import timed
 
 
 USED_MASKS = {
@@ -41,7 +45,7 @@ class V3Map(BasicMap):
 
     def height_extra(self):
         """Uses height_from_cube to generate a simple heightmap."""
-        with open(os.path.join(self.file_dir, self.map_dir, 'heightmap.heightmap'), 'w') as outf:
+        with mod_writer.open(os.path.join(self.file_dir, self.map_dir, 'heightmap.heightmap'), 'w') as outf:
             outf.write("heightmap_file=\"map_data/packed_heightmap.png\"\n")
             outf.write("indirection_file=\"map_data/indirection_heightmap.png\"\n")
             outf.write(f"original_heightmap_size={{ {self.max_x * 2} {self.max_y * 2} }}\n")
@@ -51,15 +55,16 @@ class V3Map(BasicMap):
             outf.write("max_compress_level=4\n")
             outf.write("empty_tile_offset={ 201 76 }\n")
 
-    def create_locators(self, file_dir, locs_from_rid, pid_from_cube):
+    @timed()
+    def create_locators(self, file_dir, locs_from_rid, cubes_from_pid):
         os.makedirs(os.path.join(file_dir,"gfx","map", "map_object_data"), exist_ok=True)
         for loc in VALID_LOCS:
-            with open(os.path.join(file_dir, "gfx", "map", "map_object_data", f"generated_map_object_locators_{loc}.txt"), 'w', encoding='utf_8_sig') as outf:
+            with mod_writer.open(os.path.join(file_dir, "gfx", "map", "map_object_data", f"generated_map_object_locators_{loc}.txt"), 'w', encoding='utf_8_sig') as outf:
                 clamp = "yes" if loc == "port" else "no"
                 outf.write("game_object_locator={\n\tname=\""+loc+"\"\n\tclamp_to_water_level="+clamp+"\n\trender_under_water=no\n\tgenerated_content=no\n\tlayer=\"locators\"\n\tinstances={\n")
                 for rid in sorted(locs_from_rid.keys()):
                     if loc in locs_from_rid[rid]:
-                        cubes = [cube for cube, pid in pid_from_cube.items() if pid == locs_from_rid[rid][loc]]
+                        cubes = cubes_from_pid.get(locs_from_rid[rid][loc], [])
                         if len(cubes) == 0:
                             raise ValueError(f"Missing {loc} for {rid} with pid {locs_from_rid[rid][loc]}")
                         # TODO: choose more intelligently / have them offset?
@@ -69,45 +74,48 @@ class V3Map(BasicMap):
                         outf.write(f"\t\t{{\n\t\t\tid={rid}\n\t\t\tposition={{ {x} 0.0 {y} }}\n\t\t\trotation={{ 0 0 0 1 }}\n\t\t\tscale={{ 1 1 1 }}\n\t\t}}\n")
                 outf.write("\t}\n}\n")
 
+    @timed()
     def create_terrain_masks(self, base_dir, terr_from_cube):
         """Creates all the terrain masks; just fills each cube.
         terr_from_cube is a map from cube to BaseTerrain."""
         os.makedirs(os.path.join(self.file_dir, "gfx", "map", "terrain"), exist_ok=True)
+        # Which terrain each pixel is, from one draw of the hexes; each used mask is then the pixels of its terrain.
+        terrain_labels = lookup_labels(self.hex_labels(), self.label_from_ijk, {k.tuple(): v.value for k,v in terr_from_cube.items()})
+        terrain_from_mask = {v: k for k,v in USED_MASKS.items()}
         for mask in os.listdir(os.path.join(base_dir, "gfx", "map", "terrain")):
             if not mask.startswith("mask"):
                 continue
             mask_name = mask[5:-4]  # begins with mask_ and ends with .png
-            if mask_name not in USED_MASKS.values():
-                create_hex_map(rgb_from_ijk={}, max_x=self.max_x, max_y=self.max_y, n_x=self.n_x, n_y=self.n_y, mode='L', default="black").save(os.path.join(self.file_dir, "gfx", "map", "terrain", mask))
+            if mask_name not in terrain_from_mask:
+                mod_writer.save_blank(os.path.join(self.file_dir, "gfx", "map", "terrain", mask), (self.max_x, self.max_y), 'L', "black")
             else:
-                terrain = [k for k,v in USED_MASKS.items() if v == mask_name][0]
-                rgb_from_ijk = {k.tuple(): 128 for k,v in terr_from_cube.items() if v == terrain}
-                create_hex_map(rgb_from_ijk=rgb_from_ijk, max_x=self.max_x, max_y=self.max_y, n_x=self.n_x, n_y=self.n_y, mode='L', default="black").save(os.path.join(self.file_dir, "gfx", "map", "terrain", mask))
+                mask_pixels = (terrain_labels == terrain_from_mask[mask_name].value).astype(np.uint8) * 128
+                mod_writer.save_image(PIL.Image.fromarray(mask_pixels, 'L'), os.path.join(self.file_dir, "gfx", "map", "terrain", mask))
         os.makedirs(os.path.join(self.file_dir, "gfx", "map", "masks"), exist_ok=True)
         for mask in os.listdir(os.path.join(base_dir, "gfx", "map", "masks")):
             if not mask.startswith("mask"):
                 continue
             #TODO: Assign farmland/forestry/mining to provinces
-            create_hex_map(rgb_from_ijk={}, max_x=self.max_x, max_y=self.max_y, n_x=self.n_x, n_y=self.n_y, mode='L', default="black").save(os.path.join(self.file_dir, "gfx", "map", "masks", mask))
+            mod_writer.save_blank(os.path.join(self.file_dir, "gfx", "map", "masks", mask), (self.max_x, self.max_y), 'L', "black")
         os.makedirs(os.path.join(self.file_dir, "gfx", "map", "dynamic_masks"), exist_ok=True)
         # TODO: I think this should be land + one sea depth
-        create_hex_map(rgb_from_ijk={}, max_x=self.max_x, max_y=self.max_y, n_x=self.n_x, n_y=self.n_y, mode='L', default="black").save(os.path.join(self.file_dir, "gfx", "map", "dynamic_masks", "exclusion_mask.dds"))
+        mod_writer.save_blank(os.path.join(self.file_dir, "gfx", "map", "dynamic_masks", "exclusion_mask.dds"), (self.max_x, self.max_y), 'L', "black")
         os.makedirs(os.path.join(self.file_dir, "gfx", "map", "textures"), exist_ok=True)
         # Land mask is white for land and black for ocean
-        create_hex_map(rgb_from_ijk={k.tuple(): 0 if v == BaseTerrain.ocean else 255 for k,v in terr_from_cube.items()}, max_x=self.max_x, max_y=self.max_y, n_x=self.n_x, n_y=self.n_y, mode='L', default="black").save(os.path.join(self.file_dir, "gfx", "map", "textures", "land_mask.dds"))
-        create_hex_map(rgb_from_ijk={}, max_x=self.max_x//8, max_y=self.max_y//8, n_x=self.n_x, n_y=self.n_y, mode='L', default="black").save(os.path.join(self.file_dir, "gfx", "map", "textures", "windmap_tree.dds"))
-        create_hex_map(rgb_from_ijk={}, max_x=self.max_x, max_y=self.max_y, n_x=self.n_x, n_y=self.n_y, mode='RGB', default="white").save(os.path.join(self.file_dir, "gfx", "map", "textures", "colormap.dds"))
-        create_hex_map(rgb_from_ijk={}, max_x=self.max_x, max_y=self.max_y, n_x=self.n_x, n_y=self.n_y, mode='RGB', default="white").save(os.path.join(self.file_dir, "gfx", "map", "textures", "flatmap.dds"))
-        create_hex_map(rgb_from_ijk={}, max_x=self.max_x//8, max_y=self.max_y//8, n_x=self.n_x, n_y=self.n_y, mode='RGB', default="black").save(os.path.join(self.file_dir, "gfx", "map", "textures", "colormap_tree.dds"))
+        mod_writer.save_image(PIL.Image.fromarray(((terrain_labels != 0) & (terrain_labels != BaseTerrain.ocean.value)).astype(np.uint8) * 255, 'L'), os.path.join(self.file_dir, "gfx", "map", "textures", "land_mask.dds"))
+        mod_writer.save_blank(os.path.join(self.file_dir, "gfx", "map", "textures", "windmap_tree.dds"), (self.max_x//8, self.max_y//8), 'L', "black")
+        mod_writer.save_blank(os.path.join(self.file_dir, "gfx", "map", "textures", "colormap.dds"), (self.max_x, self.max_y), 'RGB', "white")
+        mod_writer.save_blank(os.path.join(self.file_dir, "gfx", "map", "textures", "flatmap.dds"), (self.max_x, self.max_y), 'RGB', "white")
+        mod_writer.save_blank(os.path.join(self.file_dir, "gfx", "map", "textures", "colormap_tree.dds"), (self.max_x//8, self.max_y//8), 'RGB', "black")
         os.makedirs(os.path.join(self.file_dir, "content_source", "map_objects", "masks"), exist_ok=True)
         for mask in os.listdir(os.path.join(base_dir, "content_source", "map_objects", "masks")):
-            create_hex_map(rgb_from_ijk={}, max_x=self.max_x, max_y=self.max_y, n_x=self.n_x, n_y=self.n_y, mode='L', default="black").save(os.path.join(self.file_dir, "content_source", "map_objects", "masks", mask))
+            mod_writer.save_blank(os.path.join(self.file_dir, "content_source", "map_objects", "masks", mask), (self.max_x, self.max_y), 'L', "black")
 
     def update_defines(self, base_dir):
         """Copies common/defines/00_defines.txt but replaces WORLD_EXTENTS_X and Z."""
         os.makedirs(os.path.join(self.file_dir, "common", "defines"), exist_ok=True)
         with open(os.path.join(base_dir, "common", "defines", "00_defines.txt"), 'r', encoding='utf_8_sig') as inf:
-            with open(os.path.join(self.file_dir, "common", "defines", "00_defines.txt"), 'w', encoding='utf_8_sig') as outf:
+            with mod_writer.open(os.path.join(self.file_dir, "common", "defines", "00_defines.txt"), 'w', encoding='utf_8_sig') as outf:
                 for line in inf.readlines():
                     if line.startswith("\tWORLD_EXTENTS_X"):
                         outf.write(line.split("=")[0] + f"= {self.max_x}\n")
@@ -126,11 +134,11 @@ def create_terrain_file(file_dir, terr_from_pid, rgb_from_pid):
     """Writes out common/province_terrains."""
     # Masks were historically wrapped into create_heightmap, and should maybe be again.
     os.makedirs(os.path.join(file_dir, "map_data"), exist_ok=True)
-    with open(os.path.join(file_dir, "map_data", "province_terrains.txt"), 'w') as outf:
+    with mod_writer.open(os.path.join(file_dir, "map_data", "province_terrains.txt"), 'w') as outf:
         for pid, terr in sorted(terr_from_pid.items()):
             outf.write(f"{hex_rgb(*rgb_from_pid[pid])}=\"{V3Terrain_Name_from_BaseTerrain[terr]}\"\n")
     os.makedirs(os.path.join(file_dir, "common", "terrain_manipulators", "provinces"), exist_ok=True)
-    with open(os.path.join(file_dir, "common", "terrain_manipulators", "provinces", "allowed_provinces.txt"), 'w') as outf:
+    with mod_writer.open(os.path.join(file_dir, "common", "terrain_manipulators", "provinces", "allowed_provinces.txt"), 'w') as outf:
         # TODO: remove cities from this list.
         all_provs = " ".join([str(pid) for pid, terr in terr_from_pid.items() if terr != BaseTerrain.ocean])
         for mask_type in ["farmland", "mining", "forestry"]:
@@ -141,7 +149,7 @@ def create_dot_mod(file_dir, mod_name, mod_disp_name):
     """Creates the basic mod structure and metadata file."""
     file_dir = os.path.join(file_dir, mod_name)
     os.makedirs(os.path.join(file_dir,".metadata"), exist_ok=True)
-    with open(os.path.join(file_dir, ".metadata", "metadata.json"),'w') as outf:
+    with mod_writer.open(os.path.join(file_dir, ".metadata", "metadata.json"),'w') as outf:
         outf.write("{\n\t\"name\" : \""+mod_disp_name+"\",\n\t\"id\" : \"\",\n\t\"version\" : \"0.0\",\n\t\"supported_game_version\" : \"1.5.13\",\n\t\"short_description\" : \"\",\n\t\"tags\" : [\n\t\t\"Total Conversion\"\n\t],\n\t\"relationships\" : [],\n\t\"game_custom_data\" : {\n\t\t\"multiplayer_synchronized\" : true,\n\t\t\"replace_paths\": [\n")
         outf.write(",\n".join("\t\t\t\"" + x + "\"" for x in [                
                     "common/canals",
@@ -177,11 +185,12 @@ def hex_rgb(r, g, b):
     return "x" + HEX_LIST[r // 16] + HEX_LIST[r % 16] + HEX_LIST[g // 16] + HEX_LIST[g % 16] + HEX_LIST[b // 16] + HEX_LIST[b % 16]
 
 
+@timed()
 def create_states(file_dir, rid_from_pid, pids_from_rid, rgb_from_pid, name_from_rid, traits_from_rid, locs_from_rid, arable_from_rid, capped_from_rid, coast_from_rid, tag_from_pid, pop_from_rid, building_from_rid, culture_conv, religion_conv, homelands_from_rid={}, claims_from_rid={}):
     """Creates state_region files, as well as relevant history files."""
     os.makedirs(os.path.join(file_dir,"map_data","state_regions"), exist_ok=True)
-    with open(os.path.join(file_dir,"map_data","state_regions", "00_state_regions.txt"), 'w', encoding='utf_8_sig') as outf:
-        with open(os.path.join(file_dir,"map_data","state_regions", "99_seas.txt"), 'w', encoding='utf_8_sig') as soutf:
+    with mod_writer.open(os.path.join(file_dir,"map_data","state_regions", "00_state_regions.txt"), 'w', encoding='utf_8_sig') as outf:
+        with mod_writer.open(os.path.join(file_dir,"map_data","state_regions", "99_seas.txt"), 'w', encoding='utf_8_sig') as soutf:
             for rid, rname in name_from_rid.items():
                 if rname[0] == "i":  # We don't care about the impassable regions. Might need to fix this later.
                     continue
@@ -204,14 +213,8 @@ def create_states(file_dir, rid_from_pid, pids_from_rid, rgb_from_pid, name_from
                     if "port" in locs_from_rid[rid]:
                         outf.write("\tnaval_exit_id = " + str(coast_from_rid[rid]) + "\n")
                 outf.write("}\n\n")
-    pids_from_rid = {}
-    for pid, rid in rid_from_pid.items():
-        if rid in pids_from_rid:
-            pids_from_rid[rid].append(pid)
-        else:
-            pids_from_rid[rid] = [pid]
     os.makedirs(os.path.join(file_dir,"common","history", "states"), exist_ok=True)
-    with open(os.path.join(file_dir, "common", "history", "states", "00_states.txt"), 'w', encoding='utf_8_sig') as outf:
+    with mod_writer.open(os.path.join(file_dir, "common", "history", "states", "00_states.txt"), 'w', encoding='utf_8_sig') as outf:
         outf.write("STATES = {\n")
         for rid, rname in name_from_rid.items():
             if rname[0] == "i" or rname[0] == "s":  # We don't care about the impassable regions or seas.
@@ -234,7 +237,7 @@ def create_states(file_dir, rid_from_pid, pids_from_rid, rgb_from_pid, name_from
                 outf.write("\n"+"\n".join(["\t\tadd_homeland = c:" + tag for tag in claims_from_rid[rid]]) + "\n")
             outf.write("\t}\n")
     os.makedirs(os.path.join(file_dir,"common","history", "pops"), exist_ok=True)
-    with open(os.path.join(file_dir, "common", "history", "pops", "00_world.txt"), 'w', encoding='utf_8_sig') as outf:
+    with mod_writer.open(os.path.join(file_dir, "common", "history", "pops", "00_world.txt"), 'w', encoding='utf_8_sig') as outf:
         outf.write("POPS = {\n")
         for rid, pop_from_tag in pop_from_rid.items():
             outf.write(f"\ts:{name_from_rid[rid]} = {{\n")
@@ -251,7 +254,7 @@ def create_states(file_dir, rid_from_pid, pids_from_rid, rgb_from_pid, name_from
             outf.write("\t}\n")
         outf.write("}\n")
     os.makedirs(os.path.join(file_dir,"common","history", "buildings"), exist_ok=True)
-    with open(os.path.join(file_dir, "common", "history", "buildings", "00_world.txt"), 'w', encoding='utf_8_sig') as outf:
+    with mod_writer.open(os.path.join(file_dir, "common", "history", "buildings", "00_world.txt"), 'w', encoding='utf_8_sig') as outf:
         outf.write("BUILDINGS = {\n")
         for rid, building_from_tag in building_from_rid.items():
             outf.write(f"\ts:{name_from_rid[rid]} = {{\n")
@@ -264,12 +267,13 @@ def create_states(file_dir, rid_from_pid, pids_from_rid, rgb_from_pid, name_from
         outf.write("}\n")
 
 
+@timed()
 def create_strat_regions(file_dir, srs_from_place, srs_from_farm, region_trees, rgb_from_pid, name_from_rid):
     """Create the strategic region files and a handful of other miscellaneous files."""
     os.makedirs(os.path.join(file_dir, "common", "strategic_regions"), exist_ok=True)
     for region_tree in region_trees:
         grouping_name = region_tree.title[2:]  # Strip off the e_ or w/e
-        with open(os.path.join(file_dir, "common", "strategic_regions", grouping_name + "_strategic_regions.txt"), 'w', encoding='utf_8_sig') as outf:
+        with mod_writer.open(os.path.join(file_dir, "common", "strategic_regions", grouping_name + "_strategic_regions.txt"), 'w', encoding='utf_8_sig') as outf:
             outf.write(f"# Strategic Regions in {grouping_name}\n\n")
             for rt in region_tree.children:
                 if rt.capital_pid == -1:
@@ -279,12 +283,12 @@ def create_strat_regions(file_dir, srs_from_place, srs_from_farm, region_trees,
                 map_color = " ".join([str(x) for x in list(rt.color)])
                 states = " ".join(rt.some_ck3_titles("d_"))
                 outf.write(f"{region_name} = {{\n\tcapital_province = {capital_prov}\n\tmap_color = {{ {map_color} }}\n\tstates = {{ {states} }}\n}}\n\n")
-    with open(os.path.join(file_dir, "common", "strategic_regions", "water_strategic_regions.txt"), 'w', encoding='utf_8_sig') as outf:
+    with mod_writer.open(os.path.join(file_dir, "common", "strategic_regions", "water_strategic_regions.txt"), 'w', encoding='utf_8_sig') as outf:
         for rid, rname in name_from_rid.items():
             if rname[0] == "s":
                 outf.write(f"region_{rid} = {{\n\tstates = {{ s_{rid} }}\n}}\n\n")
     os.makedirs(os.path.join(file_dir, "common", "scripted_triggers"), exist_ok=True)
-    with open(os.path.join(file_dir,  "common", "scripted_triggers", "00_geography_triggers.txt"), 'w', encoding='utf_8_sig') as outf:
+    with mod_writer.open(os.path.join(file_dir,  "common", "scripted_triggers", "00_geography_triggers.txt"), 'w', encoding='utf_8_sig') as outf:
         americas_list = []
         for place, srs in srs_from_place.items():
             outf.write(f"state_is_in_{place} = {{\n")
@@ -313,10 +317,11 @@ TIER_FROM_PREFIX = {
     "c": "principality",
 }
 
+@timed()
 def create_countries(file_dir, base_dir, region_trees, tech_from_tag, tax_from_tag, laws_from_tag, wealth_from_tag, literacy_from_tag, name_from_rid, culture_conv, religion_conv,):
     """Creates common/country_definitions files, as well as relevant history files."""
     os.makedirs(os.path.join(file_dir,"common","country_definitions"), exist_ok=True)
-    with open(os.path.join(os.path.join(file_dir, "common", "country_definitions", "00_countries.txt")), 'w', encoding='utf_8_sig') as outf:
+    with mod_writer.open(os.path.join(os.path.join(file_dir, "common", "country_definitions", "00_countries.txt")), 'w', encoding='utf_8_sig') as outf:
         for region_tree in region_trees:
             for region in region_tree.all_region_trees():
                 if region.tag is not None and region.capital_rid != -1:
@@ -324,17 +329,17 @@ def create_countries(file_dir, base_dir, region_trees, tech_from_tag, tax_from_t
                     capital = name_from_rid[region.capital_rid]
                     outf.write(region.tag + f" = {{\n\tcolor = {{ {r} {g} {b} }}\n\tcountry_type = recognized\n\ttier = {TIER_FROM_PREFIX[region.title[0]]}\n\tcultures = {{ {culture_conv.get(region.culture, region.culture)} }}\n\tcapital = {capital}\n}}\n\n")
     with open(os.path.join(os.path.join(base_dir, "common", "country_definitions", "99_dynamic.txt")), 'r', encoding='utf_8_sig') as inf:
-        with open(os.path.join(os.path.join(file_dir, "common", "country_definitions", "99_dynamic.txt")), 'w', encoding='utf_8_sig') as outf:
+        with mod_writer.open(os.path.join(os.path.join(file_dir, "common", "country_definitions", "99_dynamic.txt")), 'w', encoding='utf_8_sig') as outf:
             for line in inf.readlines():
                 outf.write(line)
     os.makedirs(os.path.join(file_dir,"common","history","countries"), exist_ok=True)
     for tag, tech in tech_from_tag.items():
-        with open(os.path.join(file_dir,"common","history","countries", f"{tag} - {tag}.txt"),'w', encoding='utf_8_sig') as outf:  # Not actually obvious these need to be different files instead of one mongo file
+        with mod_writer.open(os.path.join(file_dir,"common","history","countries", f"{tag} - {tag}.txt"),'w', encoding='utf_8_sig') as outf:  # Not actually obvious these need to be different files instead of one mongo file
             outf.write(f"COUNTRIES = {{\n\tc:{tag} = {{\n\teffect_starting_technology_tier_{str(tech)}_tech = yes\n\t\tset_tax_level = {tax_from_tag[tag]}\n")
             outf.write("\n".join(["\t\tactivate_law = law_type:" + law for law in laws_from_tag[tag]]) + "\n\t}\n}\n")
     os.makedirs(os.path.join(file_dir,"common","history","population"), exist_ok=True)
     for tag, wealth in wealth_from_tag.items():
-        with open(os.path.join(file_dir,"common","history","population", f"{tag} - {tag}.txt"),'w', encoding='utf_8_sig') as outf:  # Not actually obvious these need to be different files instead of one mongo file
+        with mod_writer.open(os.path.join(file_dir,"common","history","population", f"{tag} - {tag}.txt"),'w', encoding='utf_8_sig') as outf:  # Not actually obvious these need to be different files instead of one mongo file
             outf.write(f"POPULATION = {{\n\tc:{tag} = {{\n\t\teffect_starting_pop_wealth_{wealth} = yes\n\t\teffect_starting_pop_literacy_{literacy_from_tag[tag]} = yes\n\t}}\n}}\n")
 
 
@@ -342,7 +347,7 @@ def create_adjacencies(file_dir, straits, rgb_from_pid, pid_from_cube, canals=[]
     """straits is a list of (cube, cube, pid) tuples (from, to, pid of the water region it passes thru).
     This function will create the adjacencies file (including some calculations about type and positioning)."""
     os.makedirs(os.path.join(file_dir,"map_data"), exist_ok=True)
-    with open(os.path.join(file_dir,"map_data","adjacencies.csv"),'w', encoding='utf_8_sig') as outf:
+    with mod_writer.open(os.path.join(file_dir,"map_data","adjacencies.csv"),'w', encoding='utf_8_sig') as outf:
         outf.write("From;To;Type;Through;start_x;start_y;stop_x;stop_y;adjacency_rule_name;Comment")
         for strait in straits:
             fr, to = strait[0], strait[1]
@@ -364,7 +369,7 @@ def create_adjacencies(file_dir, straits, rgb_from_pid, pid_from_cube, canals=[]
 def create_default(file_dir, sea_rgbs, lake_rgbs = []):
     """Create default.map"""
     os.makedirs(os.path.join(file_dir,"map_data"), exist_ok=True)
-    with open(os.path.join(file_dir,"map_data","default.map"), 'w', encoding='utf_8_sig') as outf:
+    with mod_writer.open(os.path.join(file_dir,"map_data","default.map"), 'w', encoding='utf_8_sig') as outf:
         outf.write("provinces = \"provinces.png\"\ntopology = \"heightmap.heightmap\"\nrivers = \"rivers.png\"\nadjacencies = \"adjacencies.csv\"\nwrap_x = yes\n\nsea_starts = {\n")
         outf.write("\t\t" + " ".join(sea_rgbs) + "\n}\nlakes= {\n\t" + " ".join(lake_rgbs) + "\n}\n")
 
@@ -373,15 +378,18 @@ def create_objectives(file_dir, base_dir, tags):
     """Modifies 00_objective_tutorial and 01_player_objectives.txt to point to actual tags."""
     os.makedirs(os.path.join(file_dir,"common", "objectives"), exist_ok=True)
     for filename in os.listdir(os.path.join(base_dir, "common", "objectives")):
-        with open(os.path.join(file_dir, "common", "objectives", filename), 'w', encoding='utf_8_sig') as outf:
-            with open(os.path.join(base_dir, "common", "objectives", filename), 'r', encoding='utf_8_sig') as inf:
-                for line in inf.readlines():
-                    if "recommended_tags" in line:
-                        outf.write(line.split("=")[0] + "= { " + " ".join(random.sample(tags, k=4)) + " }\n")
-                    else:
-                        outf.write(line)
-
-
+        script = clausewitz.read(os.path.join(base_dir, "common", "objectives", filename))
+        with mod_writer.open(os.path.join(file_dir, "common", "objectives", filename), 'w', encoding='utf_8_sig') as outf:
+            last_end = 0
+            for objective in script.blocks:
+                for tags_block in objective.children():
+                    if tags_block.name == "recommended_tags":
+                        outf.write(script.text(last_end, tags_block.start, 'utf_8_sig') + "recommended_tags = { " + " ".join(random.sample(tags, k=4)) + " }")
+                        last_end = tags_block.end
+            outf.write(script.text(last_end, None, 'utf_8_sig'))
+
+
+@timed()
 def create_journals(file_dir, base_dir):
     """Copies over some valid journal files."""
     os.makedirs(os.path.join(file_dir,"common", "journal_entries"), exist_ok=True)
@@ -422,14 +430,15 @@ def create_journals(file_dir, base_dir):
         "02_silkworm_diseases.txt",
         "03_positivism.txt",
     ]:
-        with open(os.path.join(file_dir, "common", "journal_entries", filename), 'w', encoding='utf_8_sig') as outf:
+        with mod_writer.open(os.path.join(file_dir, "common", "journal_entries", filename), 'w', encoding='utf_8_sig') as outf:
             with open(os.path.join(base_dir, "common", "journal_entries", filename), 'r', encoding='utf_8_sig') as inf:
                 for line in inf.readlines():
                     outf.write(line)
     # TODO: ones that could be customized are 00_belle_epoque and 00_canals
 
 
-def create_mod(file_dir, config, pid_from_cube, rid_from_pid, pids_from_rid, terr_from_cube, terr_from_pid, rgb_from_pid, base_from_vertex, mask_from_vertex, river_flow_from_edge, river_sources, river_merges, river_max_flow, locs_from_rid, coast_from_rid, name_from_rid, region_trees, tag_from_pid, straits):
+@timed()
+def create_mod(file_dir, config, pid_from_cube, cubes_from_pid, rid_from_pid, pids_from_rid, terr_from_cube, terr_from_pid, rgb_from_pid, base_from_vertex, mask_from_vertex, river_flow_from_edge, river_sources, river_merges, river_max_flow, locs_from_rid, coast_from_rid, name_from_rid, region_trees, tag_from_pid, straits):
     """Creates the V3 mod files in file_dir, given the basic data."""
     # Get some conversion data.
     with open(os.path.join("data", "conversion_v3.yml"), 'r', encoding="utf_8_sig") as inf:
@@ -466,7 +475,7 @@ def create_mod(file_dir, config, pid_from_cube, rid_from_pid, pids_from_rid, ter
     v3map.create_locators(
         file_dir=file_dir,
         locs_from_rid=locs_from_rid,
-        pid_from_cube=pid_from_cube,
+        cubes_from_pid=cubes_from_pid,
     )
     v3map.update_defines(base_dir=config["BASE_V3_DIR"])
     sea_rgbs = sorted({hex_rgb(*new_rgb_from_pid[pid]) for pid in sorted(set(coast_from_rid.values()))})
@@ -2,7 +2,9 @@ import random
 
 from area import Area
 from cube import Cube
+from timing import timed
 
+@timed()
 def simple_voronoi(centers, weights_from_cube):
     """Uses the domain of weights_from_cube to determine which cubes are eligible to be filled.
     - centers is a list of cubes
@@ -21,6 +23,7 @@ def simple_voronoi(centers, weights_from_cube):
     return centers, result, mindistmap
 
 
+@timed()
 def voronoi(centers, weight_from_cube):
     """Uses the domain of weight_from_cube to determine which cubes are eligible to be filled.
     - centers is a list of cubes; if they aren't unique they will be made unique
@@ -65,6 +68,7 @@ def voronoi(centers, weight_from_cube):
     return centers, group_from_cube, mindistmap
 
 
+@timed()
 def max_voronoi(centers, weight_from_cube, poss_centers, max_dist):
     """Uses the domain of weight_from_cube to determine which cubes are eligible to be filled.
     - centers is a list of cubes; if they aren't unique they will be made unique
@@ -132,6 +136,7 @@ def max_voronoi(centers, weight_from_cube, poss_centers, max_dist):
                     continue
     return centers, group_from_cube, mindistmap
 
+@timed()
 def growing_voronoi(centers, region_sizes, weight_from_cube, group_from_cube=None):
     """Grow regions from their centers out to the appropriate size from region_sizes.
     Demands that all centers be unique.
@@ -182,6 +187,7 @@ def growing_voronoi(centers, region_sizes, weight_from_cube, group_from_cube=Non
     return centers, group_from_cube
     
 
+@timed()
 def iterative_voronoi(num_centers, weight_from_cube, min_size, max_iters=5):
     """Given a set of weights, seed num_centers random centers and then keep going until all of the regions are at least min_size.
     Returns the pair of centers and ind_from_cube mapping."""
@@ -226,6 +232,7 @@ def iterative_voronoi(num_centers, weight_from_cube, min_size, max_iters=5):
     return centers, guess, distmap
 
 
+@timed()
 def area_voronoi(area_from_cube, centers):
     """Given a dictionary area_from_cube which maps from cubes to area ids, and a list of centers (indices of the areas list), return a dictionary from area index to center index."""
     rid_from_aid = {}
@@ -0,0 +1,199 @@
+import json
+import os
+from collections.abc import Mapping
+
+import numpy as np
+
+from cube import Cube, Edge, Vertex
+from region_tree import RegionTree
+from terrain import BaseTerrain
+
+# Bump this whenever the layout below changes; load_world refuses worlds with a different version.
+WORLD_FORMAT_VERSION = 1
+
+# How each world field is stored. Per-hex, per-vertex, and per-edge data go in .npy arrays, which are memory-mapped on load;
+# everything else goes in world.json. Fields not listed here are stored as plain JSON.
+KIND_FROM_FIELD = {
+    "continents": "cube_lists",
+    "pid_from_cube": "cube_map",
+    "land_cube_from_pid": "int_cube_map",
+    "rid_from_pid": "int_keys",
+    "srid_from_pid": "int_keys",
+    "cont_from_pid": "int_keys",
+    "terr_from_cube": "cube_terrain_map",
+    "terr_from_pid": "int_terrain_map",
+    "type_from_pid": "int_keys",
+    "base_from_vertex": "vertex_map",
+    "mask_from_vertex": "vertex_map",
+    "land_height_from_cube": "cube_map",
+    "water_depth_from_cube": "cube_map",
+    "region_trees": "region_trees",
+    "name_from_pid": "int_keys",
+    "name_from_rid": "int_keys",
+    "name_from_srid": "int_keys",
+    "river_flow_from_edge": "edge_map",
+    "river_sources": "vertex_list",
+    "river_merges": "vertex_pairs",
+    "straits": "straits",
+    "locs_from_rid": "int_keys",
+    "coast_from_rid": "int_keys",
+    "coast_from_cube": "cube_map",
+    "tag_from_pid": "int_keys",
+    "cubes_from_pid": "int_cube_lists",
+    "pids_from_rid": "int_keys",
+    "pids_from_srid": "int_keys",
+    "rgb_from_pid": "rgb_map",
+    "railways": "railways",
+}
+
+
+def cube_array(cubes):
+    """(n, 2) array of the x and y of each cube; z is implied."""
+    return np.array([(k.x, k.y) for k in cubes], dtype=np.int32).reshape(-1, 2)
+
+
+def cubes_from_array(arr):
+    return [Cube(x, y, -x-y) for x, y in arr.tolist()]
+
+
+def value_array(values):
+    """Stores ints (Python or numpy, but not bools) as int64 and anything else numeric as float64."""
+    values = list(values)
+    if all([isinstance(v, (int, np.integer)) and not isinstance(v, bool) for v in values]):
+        return np.array(values, dtype=np.int64)
+    return np.array(values, dtype=np.float64)
+
+
+def encode(kind, value):
+    """Returns (arrays, json_value) for value, where arrays maps a part name to a numpy array."""
+    if kind == "cube_map":
+        return {"keys": cube_array(value.keys()), "values": value_array(value.values())}, None
+    elif kind == "cube_terrain_map":
+        return {"keys": cube_array(value.keys()), "values": np.array([t.value for t in value.values()], dtype=np.uint8)}, None
+    elif kind == "int_terrain_map":
+        return {"keys": np.array(list(value.keys()), dtype=np.int64), "values": np.array([t.value for t in value.values()], dtype=np.uint8)}, None
+    elif kind == "int_cube_map":
+        return {"keys": np.array(list(value.keys()), dtype=np.int64), "values": cube_array(value.values())}, None
+    elif kind == "vertex_map":
+        keys = np.array([(v.cube.x, v.cube.y, v.rot) for v in value.keys()], dtype=np.int32).reshape(-1, 3)
+        return {"keys": keys, "values": value_array(value.values())}, None
+    elif kind == "edge_map":
+        keys = np.array([(e.cube.x, e.cube.y, e.rot, e.dir or 0) for e in value.keys()], dtype=np.int32).reshape(-1, 4)
+        return {"keys": keys, "values": value_array(value.values())}, None
+    elif kind == "vertex_list":
+        return {"values": np.array([(v.cube.x, v.cube.y, v.rot) for v in value], dtype=np.int32).reshape(-1, 3)}, None
+    elif kind == "vertex_pairs":
+        return {"values": np.array([(a.cube.x, a.cube.y, a.rot, b.cube.x, b.cube.y, b.rot) for a, b in value], dtype=np.int32).reshape(-1, 6)}, None
+    elif kind == "straits":
+        return {"values": np.array([(k.x, k.y, o.x, o.y, pid) for k, o, pid in value], dtype=np.int64).reshape(-1, 5)}, None
+    elif kind == "rgb_map":
+        return {"values": np.array([(pid, *rgb) for pid, rgb in value.items()], dtype=np.int64).reshape(-1, 4)}, None
+    elif kind == "cube_lists":
+        return {"values": cube_array([k for cubes in value for k in cubes]), "lengths": np.array([len(cubes) for cubes in value], dtype=np.int64)}, None
+    elif kind == "int_cube_lists":
+        return {"keys": np.array(list(value.keys()), dtype=np.int64), "values": cube_array([k for cubes in value.values() for k in cubes]), "lengths": np.array([len(cubes) for cubes in value.values()], dtype=np.int64)}, None
+    elif kind == "region_trees":
+        return {}, [rt.to_json() for rt in value]
+    elif kind == "int_keys":
+        return {}, {str(k): v for k, v in value.items()}
+    elif kind == "railways":
+        return {}, [[level, path] for level, path in value]
+    return {}, value
+
+
+def decode(kind, arrays, value):
+    """Inverse of encode."""
+    if kind in ["cube_map", "cube_terrain_map"]:
+        values = arrays["values"].tolist()
+        if kind == "cube_terrain_map":
+            values = [BaseTerrain(v) for v in values]
+        return dict(zip(cubes_from_array(arrays["keys"]), values))
+    elif kind == "int_terrain_map":
+        return {k: BaseTerrain(v) for k, v in zip(arrays["keys"].tolist(), arrays["values"].tolist())}
+    elif kind == "int_cube_map":
+        return dict(zip(arrays["keys"].tolist(), cubes_from_array(arrays["values"])))
+    elif kind == "vertex_map":
+        return {Vertex(Cube(x, y, -x-y), rot): v for (x, y, rot), v in zip(arrays["keys"].tolist(), arrays["values"].tolist())}
+    elif kind == "edge_map":
+        return {Edge(Cube(x, y, -x-y), rot, dir or None): v for (x, y, rot, dir), v in zip(arrays["keys"].tolist(), arrays["values"].tolist())}
+    elif kind == "vertex_list":
+        return [Vertex(Cube(x, y, -x-y), rot) for x, y, rot in arrays["values"].tolist()]
+    elif kind == "vertex_pairs":
+        return [(Vertex(Cube(ax, ay, -ax-ay), arot), Vertex(Cube(bx, by, -bx-by), brot)) for ax, ay, arot, bx, by, brot in arrays["values"].tolist()]
+    elif kind == "straits":
+        return [(Cube(kx, ky, -kx-ky), Cube(ox, oy, -ox-oy), pid) for kx, ky, ox, oy, pid in arrays["values"].tolist()]
+    elif kind == "rgb_map":
+        return {pid: (r, g, b) for pid, r, g, b in arrays["values"].tolist()}
+    elif kind in ["cube_lists", "int_cube_lists"]:
+        cubes = cubes_from_array(arrays["values"])
+        lists = []
+        start = 0
+        for length in arrays["lengths"].tolist():
+            lists.append(cubes[start:start+length])
+            start += length
+        if kind == "cube_lists":
+            return lists
+        return dict(zip(arrays["keys"].tolist(), lists))
+    elif kind == "region_trees":
+        return [RegionTree.from_json(contents) for contents in value]
+    elif kind == "int_keys":
+        return {int(k): v for k, v in value.items()}
+    elif kind == "railways":
+        return [(level, path) for level, path in value]
+    return value
+
+
+def save_world(path, world):
+    """Writes world, a dict of field name to data, as a world directory at path: manifest.json, world.json, and one .npy per array."""
+    os.makedirs(path, exist_ok=True)
+    manifest = {"version": WORLD_FORMAT_VERSION, "fields": {}}
+    json_fields = {}
+    for field, value in world.items():
+        kind = KIND_FROM_FIELD.get(field, "json")
+        arrays, json_value = encode(kind, value)
+        for part, arr in arrays.items():
+            np.save(os.path.join(path, f"{field}.{part}.npy"), arr)
+        if json_value is not None or len(arrays) == 0:
+            json_fields[field] = json_value
+        manifest["fields"][field] = {"kind": kind, "arrays": sorted(arrays.keys())}
+    with open(os.path.join(path, "world.json"), 'w', encoding='utf_8') as outf:
+        json.dump(json_fields, outf, separators=(",", ":"))
+    with open(os.path.join(path, "manifest.json"), 'w', encoding='utf_8') as outf:  # Written last, so a partial world has no manifest.
+        json.dump(manifest, outf, indent=1)
+
+
+class World(Mapping):
+    """A saved world, read lazily: each field is decoded the first time it's looked up."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "manifest.json"), 'r', encoding='utf_8') as inf:
+            manifest = json.load(inf)
+        if manifest["version"] != WORLD_FORMAT_VERSION:
+            raise ValueError(f"{path} is world format version {manifest['version']}, but this reads version {WORLD_FORMAT_VERSION}")
+        self.fields = manifest["fields"]
+        self.json_fields = None
+        self.cache = {}
+
+    def __getitem__(self, field):
+        if field not in self.cache:
+            if field not in self.fields:
+                raise KeyError(field)
+            spec = self.fields[field]
+            arrays = {part: np.load(os.path.join(self.path, f"{field}.{part}.npy"), mmap_mode='r') for part in spec["arrays"]}
+            if self.json_fields is None:
+                with open(os.path.join(self.path, "world.json"), 'r', encoding='utf_8') as inf:
+                    self.json_fields = json.load(inf)
+            self.cache[field] = decode(spec["kind"], arrays, self.json_fields.get(field))
+        return self.cache[field]
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+
+def load_world(path):
+    """Opens the world saved at path; see World."""
+    return World(path)